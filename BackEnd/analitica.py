@@ -0,0 +1,160 @@
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+# Cada cuántos segundos se suman las ventas pendientes y cuántas compras por lote
+ANALITICA_INTERVALO = float(os.getenv("ANALITICA_INTERVALO", "5"))
+LOTE_VENTAS = 500
+
+# Día natural de una compra, calculado por la base de datos igual en la carga
+# incremental y en la reconstrucción
+_fecha_compra = func.date(models.Compra.fecha_compra)
+
+# Deja las compras pagadas indicadas pendientes de sumar a los resúmenes, en la
+# transacción de la compra (no hace commit). Cada venta inserta solo su propia
+# fila: la fila del día en ventas_diarias, que comparten todas las ventas, ya no
+# se bloquea mientras dura la transacción de la compra
+def encolar_ventas(db: Session, ids_compra):
+    ids_compra = list(ids_compra)
+    if ids_compra:
+        db.execute(insert(models.VentaPendiente), [{"id_compra": i} for i in ids_compra])
+
+# Tarea periódica: suma las ventas pendientes a los resúmenes por lotes. Cada lote
+# se reclama con SKIP LOCKED y se borra de la cola en la misma transacción en la
+# que se suma, así que varios workers nunca cuentan dos veces la misma compra
+def procesar_ventas_pendientes() -> int:
+    procesadas = 0
+    db = SessionLocal()
+    try:
+        while True:
+            ids = db.execute(
+                select(models.VentaPendiente.id_compra)
+                .order_by(models.VentaPendiente.id_compra)
+                .limit(LOTE_VENTAS)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not ids:
+                db.rollback()
+                break
+            _acumular(db, models.Compra.id_compra.in_(ids))
+            db.execute(
+                delete(models.VentaPendiente)
+                .where(models.VentaPendiente.id_compra.in_(ids))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            procesadas += len(ids)
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error sumando las ventas pendientes: {e}")
+    finally:
+        db.close()
+    return procesadas
+
+def tareas_analitica() -> list:
+    return [("sumar_ventas", procesar_ventas_pendientes, ANALITICA_INTERVALO)]
+
+# Reconstruye los resúmenes a partir del historial de compras, para la carga
+# inicial o para corregir un rango de días
+def reconstruir_ventas(db: Session, desde: Optional[date] = None, hasta: Optional[date] = None):
+    condiciones_resumen = []
+    condiciones_compra = []
+    if desde is not None:
+        condiciones_resumen.append(lambda tabla: tabla.fecha >= desde)
+        condiciones_compra.append(models.Compra.fecha_compra >= datetime.combine(desde, time.min))
+    if hasta is not None:
+        condiciones_resumen.append(lambda tabla: tabla.fecha <= hasta)
+        condiciones_compra.append(models.Compra.fecha_compra < datetime.combine(hasta + timedelta(days=1), time.min))
+
+    for tabla in (models.VentaDiaria, models.VentaDiariaProducto):
+        db.execute(
+            delete(tabla).where(*[c(tabla) for c in condiciones_resumen])
+            .execution_options(synchronize_session=False)
+        )
+    # Las ventas del rango que seguían en cola quedan contadas por la reconstrucción
+    db.execute(
+        delete(models.VentaPendiente)
+        .where(models.VentaPendiente.id_compra.in_(select(models.Compra.id_compra).where(*condiciones_compra)))
+        .execution_options(synchronize_session=False)
+    )
+    _acumular(db, *condiciones_compra)
+
+# Las filas se escriben siempre en el mismo orden, (fecha, id_producto) y después
+# los totales por día, para que dos workers que suman a la vez no se bloqueen
+# mutuamente en orden inverso
+def _acumular(db: Session, *condiciones):
+    condiciones = (models.Compra.estado == "pagada", *condiciones)
+
+    # Totales por día y producto, con la categoría y el proveedor actuales del producto
+    por_producto = select(
+        _fecha_compra.label("fecha"),
+        models.DetalleCompra.id_producto,
+        models.Producto.id_categoria,
+        models.Producto.id_proveedor,
+        func.sum(models.DetalleCompra.cantidad).label("unidades"),
+        func.sum(models.DetalleCompra.cantidad * models.DetalleCompra.precio_unitario).label("ingresos"),
+    ).select_from(models.DetalleCompra).join(
+        models.Compra, models.Compra.id_compra == models.DetalleCompra.id_compra
+    ).outerjoin(
+        models.Producto, models.Producto.id_producto == models.DetalleCompra.id_producto
+    ).where(*condiciones).group_by(
+        _fecha_compra, models.DetalleCompra.id_producto, models.Producto.id_categoria, models.Producto.id_proveedor
+    ).order_by(_fecha_compra, models.DetalleCompra.id_producto)
+    _insertar_sumando(
+        db, models.VentaDiariaProducto, por_producto,
+        ["fecha", "id_producto"], ["id_categoria", "id_proveedor", "unidades", "ingresos"],
+        reemplazar=["id_categoria", "id_proveedor"],
+    )
+
+    # Totales por día: las unidades se suman por compra antes de unir para no
+    # repetir el total de la compra una vez por línea
+    unidades_compra = select(
+        models.DetalleCompra.id_compra,
+        func.sum(models.DetalleCompra.cantidad).label("unidades"),
+    ).group_by(models.DetalleCompra.id_compra).subquery()
+    por_dia = select(
+        _fecha_compra.label("fecha"),
+        func.count(models.Compra.id_compra).label("compras"),
+        func.coalesce(func.sum(unidades_compra.c.unidades), 0).label("unidades"),
+        func.sum(models.Compra.total).label("ingresos"),
+    ).select_from(models.Compra).outerjoin(
+        unidades_compra, unidades_compra.c.id_compra == models.Compra.id_compra
+    ).where(*condiciones).group_by(_fecha_compra).order_by(_fecha_compra)
+    _insertar_sumando(db, models.VentaDiaria, por_dia, ["fecha"], ["compras", "unidades", "ingresos"])
+
+# INSERT ... SELECT que, si la fila del resumen ya existe, suma los valores nuevos
+# a los acumulados (ON CONFLICT DO UPDATE en PostgreSQL y SQLite)
+def _insertar_sumando(db: Session, modelo, seleccion, claves: list, valores: list, reemplazar: list = ()):
+    dialecto = db.get_bind().dialect.name
+    tabla = modelo.__table__
+    if dialecto in ("postgresql", "sqlite"):
+        if dialecto == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        sentencia = insert(tabla).from_select(claves + valores, seleccion)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=claves,
+            set_={
+                c: sentencia.excluded[c] if c in reemplazar else tabla.c[c] + sentencia.excluded[c]
+                for c in valores
+            },
+        )
+        db.execute(sentencia)
+        return
+
+    # Otros motores: actualización o inserción fila a fila
+    for fila in db.execute(seleccion).mappings().all():
+        filtro = [tabla.c[c] == fila[c] for c in claves]
+        resultado = db.execute(update(tabla).where(*filtro).values({
+            c: fila[c] if c in reemplazar else tabla.c[c] + fila[c] for c in valores
+        }))
+        if resultado.rowcount == 0:
+            db.execute(tabla.insert().values(dict(fila)))
@@ -4,10 +4,13 @@ from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import jwt  # Cambiado de jose.jwt a jwt
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 
-from database import get_db
+from database import get_async_db
+from cache import CacheLRU
+from auth.passwords import verificar, verificar_async
 import models
 import schemas
 import os
@@ -23,19 +26,63 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 # Configuración del OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Caché de usuarios autenticados por email (el "sub" del token), para no consultar
+# la tabla de usuarios en cada petición. Guarda el esquema público, sin el hash
+# de la contraseña; los cambios en el usuario la invalidan con invalidar_usuario
+cache_usuarios = CacheLRU(
+    "usuarios",
+    max_entradas=int(os.getenv("USUARIOS_CACHE_MAX_ENTRADAS", "4096")),
+    ttl=float(os.getenv("USUARIOS_CACHE_TTL", "60")),
+)
+
+def invalidar_usuario(*emails: str):
+    for email in emails:
+        cache_usuarios.invalidar(email)
 
 # Funciones para autenticación de usuarios
 def get_user(db: Session, email: str):
     return db.query(models.Usuario).filter(models.Usuario.email == email).first()
 
+# Guarda el hash rehecho con el coste actual de bcrypt. La condición sobre el
+# hash anterior evita pisar un cambio de contraseña hecho mientras tanto
+def _rehash(usuario: models.Usuario, nuevo_hash: str):
+    return (
+        update(models.Usuario)
+        .where(models.Usuario.id_usuario == usuario.id_usuario)
+        .where(models.Usuario.contraseña == usuario.contraseña)
+        .values(contraseña=nuevo_hash)
+        .execution_options(synchronize_session=False)
+    )
+
 def authenticate_user(db: Session, email: str, password: str):
     user = get_user(db, email)
     if not user:
         return False
-    # Verifica el hash de la contraseña
-    if not pwd_context.verify(password, user.contraseña):
+    # Verifica el hash de la contraseña (en el pool de bcrypt)
+    valida, nuevo_hash = verificar(password, user.contraseña)
+    if not valida:
         return False
+    if nuevo_hash:
+        db.execute(_rehash(user, nuevo_hash))
+        db.commit()
+    return user
+
+# Versiones asíncronas para los endpoints `async def`
+async def get_user_async(db: AsyncSession, email: str):
+    result = await db.execute(select(models.Usuario).where(models.Usuario.email == email))
+    return result.scalars().first()
+
+async def authenticate_user_async(db: AsyncSession, email: str, password: str):
+    user = await get_user_async(db, email)
+    if not user:
+        return False
+    # Verifica el hash de la contraseña sin bloquear el event loop
+    valida, nuevo_hash = await verificar_async(password, user.contraseña)
+    if not valida:
+        return False
+    if nuevo_hash:
+        await db.execute(_rehash(user, nuevo_hash))
+        await db.commit()
     return user
 
 # Funciones para tokens JWT
@@ -49,7 +96,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -64,12 +111,32 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = schemas.TokenData(email=email)
     except jwt.PyJWTError:  # Cambiado de JWTError a PyJWTError
         raise credentials_exception
-    user = get_user(db, email=token_data.email)
-    if user is None:
+    encontrado, user = cache_usuarios.obtener(token_data.email)
+    if encontrado:
+        return user
+    generacion = cache_usuarios.generacion
+    db_user = await get_user_async(db, email=token_data.email)
+    if db_user is None:
         raise credentials_exception
+    # Copia sin validar: el usuario ya está en la base de datos y un teléfono
+    # antiguo que no pase el validador no debe impedir autenticarse
+    user = schemas.Usuario.model_construct(**{
+        campo: getattr(db_user, campo) for campo in schemas.Usuario.model_fields
+    })
+    cache_usuarios.guardar(token_data.email, user, generacion)
     return user
 
 async def get_current_active_user(current_user: schemas.Usuario = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+# Solo para usuarios activos con el rol "admin"
+async def get_current_admin_user(
+    current_user: schemas.Usuario = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    nombre_rol = await db.scalar(select(models.Rol.nombre_rol).where(models.Rol.id_rol == current_user.id_rol))
+    if nombre_rol != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Se requieren permisos de administrador")
+    return current_user
@@ -0,0 +1,106 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+
+from auth.passwords import PASSWORD_HILOS
+
+# Presupuesto de las rutas que calculan bcrypt (login, registro, confirmación):
+#  - por cliente, un cubo de fichas: LOGIN_RAFAGA peticiones seguidas y después
+#    LOGIN_TASA por segundo (0.2 = una cada 5 segundos)
+#  - en total, como mucho LOGIN_CONCURRENCIA peticiones a la vez; el resto se
+#    rechaza al instante en lugar de hacer cola y acaparar la CPU
+LOGIN_TASA = float(os.getenv("LOGIN_TASA", "0.2"))
+LOGIN_RAFAGA = float(os.getenv("LOGIN_RAFAGA", "5"))
+LOGIN_CONCURRENCIA = int(os.getenv("LOGIN_CONCURRENCIA", str(PASSWORD_HILOS * 2)))
+# Clientes distintos de los que se guarda el cubo; los más antiguos se descartan
+LOGIN_MAX_CLIENTES = int(os.getenv("LOGIN_MAX_CLIENTES", "10000"))
+
+class LimitadorBcrypt:
+    def __init__(
+        self,
+        tasa: float = LOGIN_TASA,
+        rafaga: float = LOGIN_RAFAGA,
+        concurrencia: int = LOGIN_CONCURRENCIA,
+        max_clientes: int = LOGIN_MAX_CLIENTES,
+    ):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.concurrencia = concurrencia
+        self.max_clientes = max_clientes
+        # cliente -> (fichas, instante de la última recarga)
+        self._cubos = OrderedDict()
+        self._en_curso = 0
+        self._lock = threading.Lock()
+        self.admitidas = 0
+        self.rechazadas_cliente = 0
+        self.rechazadas_global = 0
+
+    # Consume una ficha del cubo del cliente. Devuelve 0 si se admite o los
+    # segundos que faltan para la siguiente ficha
+    def _consumir(self, cliente: str) -> float:
+        ahora = time.monotonic()
+        fichas, ultima = self._cubos.pop(cliente, (self.rafaga, ahora))
+        fichas = min(self.rafaga, fichas + (ahora - ultima) * self.tasa)
+        espera = 0.0
+        if fichas >= 1:
+            fichas -= 1
+        else:
+            espera = (1 - fichas) / self.tasa
+        self._cubos[cliente] = (fichas, ahora)
+        while len(self._cubos) > self.max_clientes:
+            self._cubos.popitem(last=False)
+        return espera
+
+    # Admite la petición o lanza 429 con Retry-After. La concurrencia se comprueba
+    # antes del cubo para no gastar fichas del cliente en peticiones rechazadas
+    def entrar(self, cliente: str):
+        with self._lock:
+            if self._en_curso >= self.concurrencia:
+                self.rechazadas_global += 1
+                raise _demasiadas_peticiones(1)
+            espera = self._consumir(cliente)
+            if espera:
+                self.rechazadas_cliente += 1
+                raise _demasiadas_peticiones(math.ceil(espera))
+            self._en_curso += 1
+            self.admitidas += 1
+
+    def salir(self):
+        with self._lock:
+            self._en_curso -= 1
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "tasa": self.tasa,
+                "rafaga": self.rafaga,
+                "concurrencia": self.concurrencia,
+                "en_curso": self._en_curso,
+                "clientes": len(self._cubos),
+                "admitidas": self.admitidas,
+                "rechazadas_cliente": self.rechazadas_cliente,
+                "rechazadas_global": self.rechazadas_global,
+            }
+
+def _demasiadas_peticiones(reintentar_en: int):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Demasiados intentos, inténtalo de nuevo en unos segundos",
+        headers={"Retry-After": str(reintentar_en)},
+    )
+
+limitador_bcrypt = LimitadorBcrypt()
+
+# Dependencia para las rutas que calculan bcrypt. El cliente se identifica por
+# su IP (detrás de un proxy, arrancar uvicorn con --proxy-headers)
+async def limitar_bcrypt(request: Request):
+    cliente = request.client.host if request.client else "desconocido"
+    limitador_bcrypt.entrar(cliente)
+    try:
+        yield
+    finally:
+        limitador_bcrypt.salir()
@@ -0,0 +1,39 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+# Coste de bcrypt (2^rounds iteraciones). Al subirlo, los hashes antiguos se
+# rehacen con el nuevo coste la próxima vez que su usuario inicia sesión
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Hilos para bcrypt: acota la CPU que pueden ocupar los inicios de sesión
+# simultáneos. bcrypt libera el GIL, así que los hilos trabajan en paralelo
+PASSWORD_HILOS = int(os.getenv("PASSWORD_HILOS", str(min(4, os.cpu_count() or 1))))
+
+# Contexto único de hashing de contraseñas de toda la aplicación
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+_ejecutor = ThreadPoolExecutor(max_workers=PASSWORD_HILOS, thread_name_prefix="bcrypt")
+
+# Versiones síncronas, para los endpoints `def`: el cálculo se hace igualmente en
+# el pool de bcrypt, de modo que nunca hay más de PASSWORD_HILOS a la vez
+def hashear(contraseña: str) -> str:
+    return _ejecutor.submit(pwd_context.hash, contraseña).result()
+
+# Devuelve (válida, nuevo_hash); nuevo_hash no es None si hay que guardar
+# el hash rehecho con el coste actual
+def verificar(contraseña: str, hash_guardado: str):
+    return _ejecutor.submit(pwd_context.verify_and_update, contraseña, hash_guardado).result()
+
+# Versiones asíncronas, para los endpoints `async def`: no bloquean el event loop
+async def hashear_async(contraseña: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_ejecutor, pwd_context.hash, contraseña)
+
+async def verificar_async(contraseña: str, hash_guardado: str):
+    return await asyncio.get_running_loop().run_in_executor(
+        _ejecutor, pwd_context.verify_and_update, contraseña, hash_guardado
+    )
+
+def cerrar():
+    _ejecutor.shutdown(wait=False)
@@ -0,0 +1,110 @@
+import hashlib
+import logging
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+import models
+
+# Vida de un token de refresco; cada rotación emite uno nuevo con la vida completa
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# Cada cuántos segundos se borran los tokens caducados
+REFRESCO_INTERVALO_PURGA = float(os.getenv("REFRESCO_INTERVALO_PURGA", "3600"))
+
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _token_invalido():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Token de refresco inválido o caducado",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+# Crea un token de refresco para el usuario en la transacción de `db` (no hace
+# commit) y devuelve el valor en claro, que solo conoce el cliente.
+# Sin familia se empieza una nueva (inicio de sesión)
+def emitir_token_refresco(db: Session, id_usuario: int, familia: str = None) -> str:
+    token = secrets.token_urlsafe(32)
+    db.add(models.TokenRefresco(
+        hash_token=_hash(token),
+        id_usuario=id_usuario,
+        familia=familia or uuid.uuid4().hex,
+        expira_en=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+def _revocar_familia(db: Session, familia: str):
+    db.execute(
+        update(models.TokenRefresco)
+        .where(models.TokenRefresco.familia == familia)
+        .values(revocado=True)
+        .execution_options(synchronize_session=False)
+    )
+
+# Canjea un token de refresco por (usuario, nuevo token de refresco) y confirma
+# la transacción. El UPDATE condicional garantiza que un token solo se canjea
+# una vez: si ya estaba revocado se revoca toda su familia
+def rotar_token_refresco(db: Session, token: str):
+    db_token = db.query(models.TokenRefresco).filter(models.TokenRefresco.hash_token == _hash(token)).first()
+    if db_token is None or db_token.expira_en <= datetime.utcnow():
+        raise _token_invalido()
+    canjeado = db.execute(
+        update(models.TokenRefresco)
+        .where(models.TokenRefresco.id_token == db_token.id_token)
+        .where(models.TokenRefresco.revocado.is_(False))
+        .values(revocado=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not canjeado:
+        logging.warning(f"Reutilización de un token de refresco del usuario {db_token.id_usuario}; se revoca la sesión")
+        _revocar_familia(db, db_token.familia)
+        db.commit()
+        raise _token_invalido()
+
+    usuario = db.query(models.Usuario).filter(models.Usuario.id_usuario == db_token.id_usuario).first()
+    if usuario is None or not usuario.is_active:
+        db.commit()
+        raise _token_invalido()
+    nuevo_token = emitir_token_refresco(db, usuario.id_usuario, db_token.familia)
+    db.commit()
+    return usuario, nuevo_token
+
+# Cierre de sesión: borra la familia del token (no hace commit)
+def revocar_token_refresco(db: Session, token: str):
+    db_token = db.query(models.TokenRefresco.familia).filter(models.TokenRefresco.hash_token == _hash(token)).first()
+    if db_token is not None:
+        db.execute(
+            delete(models.TokenRefresco)
+            .where(models.TokenRefresco.familia == db_token.familia)
+            .execution_options(synchronize_session=False)
+        )
+
+# Borra todos los tokens del usuario, por ejemplo al cambiar la contraseña (no hace commit)
+def revocar_tokens_usuario(db: Session, id_usuario: int):
+    db.execute(
+        delete(models.TokenRefresco)
+        .where(models.TokenRefresco.id_usuario == id_usuario)
+        .execution_options(synchronize_session=False)
+    )
+
+# Tarea periódica: borra los tokens caducados para que la tabla no crezca sin límite.
+# Los revocados se conservan hasta caducar para poder detectar su reutilización
+def purgar_tokens_caducados() -> int:
+    db = SessionLocal()
+    try:
+        borrados = db.execute(
+            delete(models.TokenRefresco)
+            .where(models.TokenRefresco.expira_en <= datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return borrados
+    finally:
+        db.close()
@@ -0,0 +1,109 @@
+import logging
+import re
+
+from sqlalchemy import Float, Integer, func, or_, text
+
+import models
+
+# Configuración regional usada para el análisis de texto en PostgreSQL
+CONFIG_TEXTO = "spanish"
+
+# Crea los índices de búsqueda del catálogo si no existen.
+# En PostgreSQL se usa un índice GIN sobre tsvector y otro de trigramas sobre el nombre;
+# en SQLite (entorno local) una tabla virtual FTS5 sincronizada mediante triggers.
+def configurar_busqueda(engine):
+    if engine.dialect.name == "postgresql":
+        _configurar_postgres(engine)
+    elif engine.dialect.name == "sqlite":
+        _configurar_sqlite(engine)
+
+def _configurar_postgres(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_productos_busqueda_fts ON productos "
+            f"USING gin (to_tsvector('{CONFIG_TEXTO}', coalesce(nombre, '') || ' ' || coalesce(\"descripción\", '')))"
+        ))
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_productos_nombre_trgm ON productos "
+                "USING gin (nombre gin_trgm_ops)"
+            ))
+    except Exception as e:
+        # Sin permisos para crear la extensión la búsqueda sigue funcionando con tsvector
+        logging.warning(f"No se pudo crear el índice de trigramas: {e}")
+
+def _configurar_sqlite(engine):
+    with engine.begin() as conn:
+        existe = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'productos_fts'"
+        )).first()
+        if existe:
+            return
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE productos_fts USING fts5("
+            "nombre, \"descripción\", content='productos', content_rowid='id_producto', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER productos_fts_ai AFTER INSERT ON productos BEGIN "
+            "INSERT INTO productos_fts(rowid, nombre, \"descripción\") "
+            "VALUES (new.id_producto, new.nombre, new.\"descripción\"); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER productos_fts_ad AFTER DELETE ON productos BEGIN "
+            "INSERT INTO productos_fts(productos_fts, rowid, nombre, \"descripción\") "
+            "VALUES ('delete', old.id_producto, old.nombre, old.\"descripción\"); END"
+        ))
+        # Solo se reindexa cuando cambia el texto, no en cada actualización de stock
+        conn.execute(text(
+            "CREATE TRIGGER productos_fts_au AFTER UPDATE OF nombre, \"descripción\" ON productos BEGIN "
+            "INSERT INTO productos_fts(productos_fts, rowid, nombre, \"descripción\") "
+            "VALUES ('delete', old.id_producto, old.nombre, old.\"descripción\"); "
+            "INSERT INTO productos_fts(rowid, nombre, \"descripción\") "
+            "VALUES (new.id_producto, new.nombre, new.\"descripción\"); END"
+        ))
+        conn.execute(text("INSERT INTO productos_fts(productos_fts) VALUES ('rebuild')"))
+
+# Patrón LIKE que busca el término literal: sin escapar, "%" o "_" harían de
+# comodín y devolverían todo el catálogo con un recorrido completo de la tabla
+def _patron_contiene(termino: str) -> str:
+    for caracter in ("\\", "%", "_"):
+        termino = termino.replace(caracter, "\\" + caracter)
+    return f"%{termino}%"
+
+# Aplica la búsqueda de texto a una consulta de productos.
+# Devuelve la consulta filtrada y la expresión de orden por relevancia.
+def filtrar_texto(query, dialecto: str, termino: str):
+    if dialecto == "postgresql":
+        documento = func.to_tsvector(
+            CONFIG_TEXTO,
+            func.coalesce(models.Producto.nombre, "") + " " + func.coalesce(models.Producto.descripción, ""),
+        )
+        consulta_ts = func.websearch_to_tsquery(CONFIG_TEXTO, termino)
+        query = query.filter(or_(
+            documento.op("@@")(consulta_ts),
+            models.Producto.nombre.ilike(_patron_contiene(termino), escape="\\"),
+        ))
+        return query, func.ts_rank(documento, consulta_ts).desc()
+
+    if dialecto == "sqlite":
+        tokens = re.findall(r"\w+", termino)
+        if not tokens:
+            return query, None
+        # Cada palabra se busca como prefijo para que "zeld" encuentre "Zelda"
+        expresion = " ".join(f'"{t}"*' for t in tokens)
+        coincidencias = text(
+            "SELECT rowid AS id_producto, bm25(productos_fts) AS rango "
+            "FROM productos_fts WHERE productos_fts MATCH :expresion"
+        ).bindparams(expresion=expresion).columns(id_producto=Integer, rango=Float).subquery()
+        query = query.join(coincidencias, coincidencias.c.id_producto == models.Producto.id_producto)
+        return query, coincidencias.c.rango.asc()
+
+    patron = _patron_contiene(termino)
+    query = query.filter(or_(
+        models.Producto.nombre.ilike(patron, escape="\\"),
+        models.Producto.descripción.ilike(patron, escape="\\"),
+    ))
+    return query, None
@@ -0,0 +1,163 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Response
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import engine
+from paginacion import CABECERA_CURSOR
+
+# Caché en memoria acotada por número de entradas (LRU) y por antigüedad (TTL).
+# Es local a cada proceso: con varios workers el TTL limita cuánto puede tardar
+# un worker en ver los cambios hechos a través de otro.
+class CacheLRU:
+    def __init__(self, nombre: str, max_entradas: int = 1024, ttl: float = 60.0):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        self.expulsiones = 0
+        # Se incrementa con cada invalidación; permite descartar valores calculados
+        # con datos que han cambiado mientras se calculaban
+        self.generacion = 0
+        self.modificado_en = time.time()
+
+    # Devuelve (encontrado, valor); una entrada caducada cuenta como fallo
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                expira, valor = entrada
+                if expira > time.monotonic():
+                    self._entradas.move_to_end(clave)
+                    self.aciertos += 1
+                    return True, valor
+                del self._entradas[clave]
+            self.fallos += 1
+            return False, None
+
+    def guardar(self, clave, valor, generacion: Optional[int] = None):
+        with self._lock:
+            if generacion is not None and generacion != self.generacion:
+                return
+            self._entradas[clave] = (time.monotonic() + self.ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.expulsiones += 1
+
+    def invalidar(self, clave):
+        with self._lock:
+            self.generacion += 1
+            self.modificado_en = time.time()
+            if self._entradas.pop(clave, None) is not None:
+                self.invalidaciones += 1
+
+    # Las claves son tuplas cuyo primer elemento identifica el tipo de consulta
+    def invalidar_prefijo(self, prefijo: str):
+        with self._lock:
+            self.generacion += 1
+            self.modificado_en = time.time()
+            claves = [c for c in self._entradas if c[0] == prefijo]
+            for clave in claves:
+                del self._entradas[clave]
+            self.invalidaciones += len(claves)
+
+    def limpiar(self):
+        with self._lock:
+            self.generacion += 1
+            self.modificado_en = time.time()
+            self.invalidaciones += len(self._entradas)
+            self._entradas.clear()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "nombre": self.nombre,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "ttl": self.ttl,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "ratio_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+                "invalidaciones": self.invalidaciones,
+                "expulsiones": self.expulsiones,
+                "generacion": self.generacion,
+            }
+
+# Caché de lecturas del catálogo (productos y categorías). Además del TTL, se
+# vacía cuando cache_http ve que otro worker ha publicado un cambio
+cache_catalogo = CacheLRU(
+    "catalogo",
+    max_entradas=int(os.getenv("CATALOGO_CACHE_MAX_ENTRADAS", "2048")),
+    ttl=float(os.getenv("CATALOGO_CACHE_TTL", "300")),
+)
+
+# Devuelve el resultado cacheado de una lectura o lo calcula y lo guarda.
+# Los objetos ORM se convierten al esquema de respuesta para no retener la sesión,
+# y se conserva la cabecera de paginación para que las respuestas sean idénticas.
+def leer_con_cache(clave, calcular, esquema, response: Optional[Response] = None):
+    encontrado, entrada = cache_catalogo.obtener(clave)
+    if encontrado:
+        datos, cursor = entrada
+        if response is not None and cursor:
+            response.headers[CABECERA_CURSOR] = cursor
+        return datos
+
+    generacion = cache_catalogo.generacion
+    resultado = calcular()
+    if isinstance(resultado, list):
+        datos = [esquema.model_validate(obj, from_attributes=True) for obj in resultado]
+    else:
+        datos = esquema.model_validate(resultado, from_attributes=True)
+    cursor = response.headers.get(CABECERA_CURSOR) if response is not None else None
+    cache_catalogo.guardar(clave, (datos, cursor), generacion)
+    return datos
+
+# Incrementa la versión compartida del catálogo para que los demás workers
+# vacíen su caché y cambien el ETag. Se llama después del commit del cambio, en
+# su propia transacción; la fila se crea con el primer cambio
+def _publicar_cambio_catalogo():
+    version = models.VersionCatalogo
+    incremento = (
+        update(version)
+        .where(version.id_version == 1)
+        .values(version=version.version + 1, modificado_en=datetime.utcnow())
+    )
+    try:
+        with engine.begin() as conn:
+            if conn.execute(incremento).rowcount:
+                return
+            try:
+                with conn.begin_nested():
+                    conn.execute(insert(version).values(id_version=1, version=1, modificado_en=datetime.utcnow()))
+            except IntegrityError:
+                # Otro worker creó la fila a la vez
+                conn.execute(incremento)
+    except Exception as e:
+        # El cambio ya está confirmado: sin la nueva versión, los demás workers
+        # lo verán al caducar su caché
+        logging.error(f"No se pudo publicar el cambio del catálogo: {e}")
+
+# Invalida los listados de productos y, si se indican, las fichas de esos productos
+def invalidar_productos(ids_producto=None):
+    cache_catalogo.invalidar_prefijo("productos")
+    for id_producto in ids_producto or []:
+        cache_catalogo.invalidar(("producto", id_producto))
+    _publicar_cambio_catalogo()
+
+def invalidar_categorias():
+    cache_catalogo.invalidar_prefijo("categorias")
+    _publicar_cambio_catalogo()
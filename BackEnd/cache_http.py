@@ -0,0 +1,84 @@
+import hashlib
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request, Response
+from sqlalchemy import select
+
+import models
+from cache import cache_catalogo
+from database import async_engine
+
+# Rutas cuyas respuestas dependen solo del estado del catálogo
+RUTAS_CATALOGO = ("/productos", "/categorias")
+
+# Última versión del catálogo vista por este worker
+_version_vista = None
+
+# Versión del catálogo compartida por todos los workers (la incrementan
+# invalidar_productos e invalidar_categorias) y su fecha de modificación. Es una
+# lectura por clave primaria; si otro worker la cambió, la caché local se vacía
+# para que el cuerpo no sea más antiguo que la versión de su ETag
+async def _version_catalogo():
+    global _version_vista
+    async with async_engine.connect() as conn:
+        fila = (await conn.execute(
+            select(models.VersionCatalogo.version, models.VersionCatalogo.modificado_en)
+            .where(models.VersionCatalogo.id_version == 1)
+        )).first()
+    version, modificado_en = (fila.version, fila.modificado_en.replace(tzinfo=timezone.utc).timestamp()) if fila else (0, 0.0)
+    if version != _version_vista:
+        if _version_vista is not None:
+            cache_catalogo.limpiar()
+        _version_vista = version
+    return str(version), modificado_en
+
+# ETag débil: se calcula antes de la compresión, así que la misma etiqueta acompaña
+# a la respuesta gzip, brotli o sin comprimir, que no son idénticas byte a byte
+def _etag(request: Request, version: str) -> str:
+    clave = f"{version}:{request.url.path}?{request.url.query}"
+    return 'W/"' + hashlib.sha1(clave.encode()).hexdigest()[:20] + '"'
+
+# Comparación débil (la que exige If-None-Match): se ignora el prefijo W/
+def _coincide_etag(cabecera: str, etag: str) -> bool:
+    etiquetas = [e.strip().removeprefix("W/") for e in cabecera.split(",")]
+    return "*" in etiquetas or etag.removeprefix("W/") in etiquetas
+
+def _no_modificado_desde(cabecera: str, modificado_en: float) -> bool:
+    try:
+        return int(modificado_en) <= parsedate_to_datetime(cabecera).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+# Middleware de GET condicional para el catálogo: responde 304 sin ejecutar la
+# consulta ni serializar nada cuando el cliente ya tiene la versión actual.
+# Va por fuera de la compresión, así que ve la cabecera Vary que esta añade
+async def get_condicional_catalogo(request: Request, call_next):
+    if request.method != "GET" or not request.url.path.startswith(RUTAS_CATALOGO):
+        return await call_next(request)
+
+    version, modificado_en = await _version_catalogo()
+    cabeceras = {
+        "ETag": _etag(request, version),
+        "Last-Modified": formatdate(modificado_en, usegmt=True),
+        # El navegador puede guardar la respuesta pero debe revalidarla siempre
+        "Cache-Control": "no-cache",
+        # Las cachés intermedias guardan una copia por codificación
+        "Vary": "Accept-Encoding",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        if _coincide_etag(if_none_match, cabeceras["ETag"]):
+            return Response(status_code=304, headers=cabeceras)
+    elif if_modified_since is not None and _no_modificado_desde(if_modified_since, modificado_en):
+        return Response(status_code=304, headers=cabeceras)
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        vary = cabeceras.pop("Vary")
+        response.headers.update(cabeceras)
+        if "accept-encoding" not in response.headers.get("vary", "").lower():
+            response.headers.add_vary_header(vary)
+    return response
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import aiosmtplib
+from dotenv import load_dotenv
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import models
+from database import SessionLocal
+
+load_dotenv()
+
+# Servidor SMTP. Las credenciales no tienen valor por defecto y se leen del
+# entorno (o del .env, que no se sube al repositorio):
+#   SMTP_USUARIO    cuenta con la que se inicia sesión en el servidor
+#   SMTP_PASSWORD   su contraseña; en Gmail, una contraseña de aplicación
+#   SMTP_REMITENTE  dirección del From; por defecto, SMTP_USUARIO
+# Sin credenciales el worker de correo no arranca y los correos se quedan en la
+# bandeja hasta que se configuren. Para probar en local sin enviar correos reales:
+#   python -m aiosmtpd -n -l localhost:8025
+# con SMTP_HOST=localhost SMTP_PORT=8025 SMTP_STARTTLS=0 SMTP_SIN_AUTENTICACION=1
+# y SMTP_REMITENTE con cualquier dirección
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USUARIO = os.getenv("SMTP_USUARIO")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_REMITENTE = os.getenv("SMTP_REMITENTE", SMTP_USUARIO)
+SMTP_SIN_AUTENTICACION = os.getenv("SMTP_SIN_AUTENTICACION", "0").lower() in ("1", "true", "si", "sí")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1").lower() in ("1", "true", "si", "sí")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# Segundos sin enviar nada tras los que se cierra la conexión
+SMTP_INACTIVIDAD = float(os.getenv("SMTP_INACTIVIDAD", "60"))
+# Límite de envío del proveedor (Gmail admite unos pocos por minuto de forma sostenida)
+SMTP_MAX_POR_MINUTO = float(os.getenv("SMTP_MAX_POR_MINUTO", "60"))
+
+# Cada cuántos segundos se revisa la bandeja y cuántos correos se reclaman de cada vez
+CORREO_INTERVALO = float(os.getenv("CORREO_INTERVALO", "2"))
+LOTE_CORREOS = 20
+# Tiempo que el worker retiene un correo; si se cae, se retoma al vencer
+DURACION_BLOQUEO = timedelta(minutes=5)
+# Reintentos con espera exponencial: 30s, 1min, 2min... hasta 1 hora
+MAX_INTENTOS = int(os.getenv("CORREO_MAX_INTENTOS", "8"))
+RETRASO_BASE = 30
+RETRASO_MAX = 60 * 60
+
+# Errores de conexión: no tiene sentido seguir con el resto del lote
+ERRORES_CONEXION = (
+    aiosmtplib.SMTPConnectError,
+    aiosmtplib.SMTPServerDisconnected,
+    aiosmtplib.SMTPTimeoutError,
+    OSError,
+)
+
+# Añade un correo a la bandeja en la transacción de `db` (no hace commit).
+# Vale tanto para sesiones síncronas como asíncronas
+def encolar_correo(db, destinatario: str, asunto: str, cuerpo: str):
+    db.add(models.CorreoSaliente(destinatario=destinatario, asunto=asunto, cuerpo=cuerpo))
+
+# Conexión SMTP persistente: se abre con el primer envío (conexión, STARTTLS y
+# login una sola vez), se reutiliza entre lotes y se cierra tras SMTP_INACTIVIDAD
+class ConexionSMTP:
+    def __init__(self):
+        self._smtp = None
+        self._ultimo_uso = 0.0
+        self.conexiones = 0
+
+    async def _conectar(self):
+        await self.cerrar()
+        self._smtp = aiosmtplib.SMTP(
+            hostname=SMTP_HOST,
+            port=SMTP_PORT,
+            username=None if SMTP_SIN_AUTENTICACION else SMTP_USUARIO,
+            password=None if SMTP_SIN_AUTENTICACION else SMTP_PASSWORD,
+            start_tls=SMTP_STARTTLS,
+            timeout=SMTP_TIMEOUT,
+        )
+        await self._smtp.connect()
+        self.conexiones += 1
+
+    async def enviar(self, mensaje: EmailMessage):
+        if self._smtp is None or not self._smtp.is_connected:
+            await self._conectar()
+        try:
+            await self._smtp.send_message(mensaje)
+        except aiosmtplib.SMTPServerDisconnected:
+            # El servidor cerró la conexión inactiva: se reabre y se reintenta una vez
+            await self._conectar()
+            await self._smtp.send_message(mensaje)
+        self._ultimo_uso = time.monotonic()
+
+    async def cerrar_si_inactiva(self):
+        if self._smtp is not None and time.monotonic() - self._ultimo_uso > SMTP_INACTIVIDAD:
+            await self.cerrar()
+
+    async def cerrar(self):
+        if self._smtp is None:
+            return
+        smtp, self._smtp = self._smtp, None
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except Exception:
+            smtp.close()
+
+# Espacia los envíos para no superar SMTP_MAX_POR_MINUTO
+class Ritmo:
+    def __init__(self, por_minuto: float = SMTP_MAX_POR_MINUTO):
+        self.intervalo = 60 / por_minuto if por_minuto > 0 else 0
+        self._siguiente = 0.0
+
+    async def esperar(self):
+        ahora = time.monotonic()
+        if self._siguiente > ahora:
+            await asyncio.sleep(self._siguiente - ahora)
+        self._siguiente = max(ahora, self._siguiente) + self.intervalo
+
+conexion_smtp = ConexionSMTP()
+ritmo_smtp = Ritmo()
+
+def _mensaje(correo) -> EmailMessage:
+    mensaje = EmailMessage()
+    mensaje["From"] = SMTP_REMITENTE
+    mensaje["To"] = correo.destinatario
+    mensaje["Subject"] = correo.asunto
+    mensaje.set_content(correo.cuerpo)
+    return mensaje
+
+# Rechazos definitivos (destinatario inexistente, remitente no autorizado...):
+# reintentarlos no serviría de nada
+def _es_permanente(error: Exception) -> bool:
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, aiosmtplib.SMTPResponseException) and 500 <= error.code < 600
+
+# Reclama un lote de correos pendientes (o con el bloqueo vencido), igual que la
+# bandeja de webhooks: SKIP LOCKED y UPDATE condicional
+def _reclamar_correos() -> list:
+    ahora = datetime.utcnow()
+    reclamable = (
+        models.CorreoSaliente.estado.in_(("pendiente", "enviando")),
+        models.CorreoSaliente.proximo_intento <= ahora,
+    )
+    db = SessionLocal()
+    try:
+        ids = db.execute(
+            select(models.CorreoSaliente.id_correo)
+            .where(*reclamable)
+            .order_by(models.CorreoSaliente.proximo_intento)
+            .limit(LOTE_CORREOS)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not ids:
+            db.rollback()
+            return []
+        reclamados = db.execute(
+            update(models.CorreoSaliente)
+            .where(models.CorreoSaliente.id_correo.in_(ids), *reclamable)
+            .values(
+                estado="enviando",
+                intentos=models.CorreoSaliente.intentos + 1,
+                proximo_intento=ahora + DURACION_BLOQUEO,
+            )
+            .returning(
+                models.CorreoSaliente.id_correo,
+                models.CorreoSaliente.destinatario,
+                models.CorreoSaliente.asunto,
+                models.CorreoSaliente.cuerpo,
+                models.CorreoSaliente.intentos,
+            )
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        return reclamados
+    finally:
+        db.close()
+
+def _retraso_reintento(intentos: int) -> timedelta:
+    segundos = min(RETRASO_BASE * 2 ** (intentos - 1), RETRASO_MAX)
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+# Guarda el resultado de un lote en una sola transacción.
+# `resultados` es una lista de (correo, error o None)
+# `sin_intentar` son los correos que no llegaron a enviarse porque el servidor
+# no respondía: vuelven a la bandeja sin gastar el intento que sumó el reclamo,
+# así una caída del servidor no agota los reintentos de los correos
+def _registrar_resultados(resultados: list, sin_intentar: list = (), error_conexion: Exception = None):
+    ahora = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        if sin_intentar:
+            logging.error(f"Servidor SMTP no disponible, {len(sin_intentar)} correos aplazados: {error_conexion}")
+            db.execute(
+                update(models.CorreoSaliente)
+                .where(models.CorreoSaliente.id_correo.in_([c.id_correo for c in sin_intentar]))
+                .values(
+                    estado="pendiente",
+                    intentos=models.CorreoSaliente.intentos - 1,
+                    error=str(error_conexion),
+                    proximo_intento=ahora + _retraso_reintento(1),
+                )
+                .execution_options(synchronize_session=False)
+            )
+        for correo, error in resultados:
+            if error is None:
+                valores = {"estado": "enviado", "error": None, "enviado_en": ahora}
+            else:
+                agotado = _es_permanente(error) or correo.intentos >= MAX_INTENTOS
+                logging.error(f"Error enviando el correo {correo.id_correo}, intento {correo.intentos}: {error}")
+                valores = {
+                    "estado": "fallido" if agotado else "pendiente",
+                    "error": str(error),
+                    "proximo_intento": ahora + _retraso_reintento(correo.intentos),
+                }
+            db.execute(
+                update(models.CorreoSaliente)
+                .where(models.CorreoSaliente.id_correo == correo.id_correo)
+                .values(**valores)
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+    finally:
+        db.close()
+
+# Tarea del worker: vacía la bandeja lote a lote por la misma conexión SMTP
+async def enviar_correos_pendientes() -> int:
+    enviados = 0
+    while True:
+        correos = await run_in_threadpool(_reclamar_correos)
+        if not correos:
+            break
+        resultados = []
+        sin_intentar = []
+        error_conexion = None
+        for i, correo in enumerate(correos):
+            await ritmo_smtp.esperar()
+            try:
+                await conexion_smtp.enviar(_mensaje(correo))
+                resultados.append((correo, None))
+                enviados += 1
+            except ERRORES_CONEXION as e:
+                # Servidor inalcanzable: este correo y el resto del lote se
+                # reintentarán más tarde
+                await conexion_smtp.cerrar()
+                sin_intentar = correos[i:]
+                error_conexion = e
+                break
+            except Exception as e:
+                resultados.append((correo, e))
+        await run_in_threadpool(_registrar_resultados, resultados, sin_intentar, error_conexion)
+        if sin_intentar:
+            break
+    await conexion_smtp.cerrar_si_inactiva()
+    return enviados
+
+def smtp_configurado() -> bool:
+    credenciales = SMTP_SIN_AUTENTICACION or bool(SMTP_USUARIO and SMTP_PASSWORD)
+    return credenciales and bool(SMTP_REMITENTE)
+
+# Sin configuración SMTP no se arranca el worker: los correos se siguen encolando
+# y se envían cuando se configure y se reinicie la aplicación
+def tareas_correo() -> list:
+    if not smtp_configurado():
+        logging.warning(
+            "Envío de correo desactivado: faltan SMTP_USUARIO y SMTP_PASSWORD "
+            "(o SMTP_SIN_AUTENTICACION=1 y SMTP_REMITENTE)"
+        )
+        return []
+    return [("enviar_correos", enviar_correos_pendientes, CORREO_INTERVALO)]
+
+# Correos de la bandeja por estado
+def estado_bandeja_correo(db: Session) -> dict:
+    return dict(
+        db.query(models.CorreoSaliente.estado, func.count(models.CorreoSaliente.id_correo))
+        .group_by(models.CorreoSaliente.estado)
+        .all()
+    )
@@ -1,6 +1,11 @@
-from sqlalchemy import create_engine
+import threading
+import time
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import os
 from dotenv import load_dotenv
 
@@ -9,8 +14,78 @@ load_dotenv()
 
 # URL de conexión a PostgreSQL
 DATABASE_URL = os.getenv("DATABASE_URL")   
+
+# Tiempos de espera para obtener una conexión del pool
+class EstadisticasPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.esperas = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.timeouts = 0
+
+    def registrar(self, segundos: float, timeout: bool = False):
+        with self._lock:
+            self.esperas += 1
+            self.espera_total += segundos
+            self.espera_maxima = max(self.espera_maxima, segundos)
+            if timeout:
+                self.timeouts += 1
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.esperas,
+                "espera_media_ms": round(self.espera_total / self.esperas * 1000, 3) if self.esperas else 0.0,
+                "espera_maxima_ms": round(self.espera_maxima * 1000, 3),
+                "timeouts": self.timeouts,
+            }
+
+# Pools que miden cuánto tarda cada checkout (espera en cola + conexión nueva + pre-ping)
+class _MedicionPool:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.estadisticas = EstadisticasPool()
+
+    def recreate(self):
+        nuevo = super().recreate()
+        nuevo.estadisticas = self.estadisticas
+        return nuevo
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            conexion = super().connect()
+        except exc.TimeoutError:
+            self.estadisticas.registrar(time.perf_counter() - inicio, timeout=True)
+            raise
+        self.estadisticas.registrar(time.perf_counter() - inicio)
+        return conexion
+
+class PoolMedido(_MedicionPool, QueuePool):
+    pass
+
+class PoolAsincronoMedido(_MedicionPool, AsyncAdaptedQueuePool):
+    pass
+
+# Configuración del pool por despliegue. Cada worker abre hasta
+# DB_POOL_SIZE + DB_MAX_OVERFLOW conexiones por motor (síncrono y asíncrono).
+def _opciones_pool(url: str, clase_pool) -> dict:
+    opciones = {"pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")}
+    if url.startswith("sqlite"):
+        # SQLite elige su propio pool según sea fichero o memoria
+        return opciones
+    opciones.update(
+        poolclass=clase_pool,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    )
+    return opciones
+
 # Crear el motor de SQLAlchemy
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **_opciones_pool(DATABASE_URL, PoolMedido))
 
 # Crear una sesión local
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -18,10 +93,65 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Base para los modelos declarativos
 Base = declarative_base()
 
-# Función para obtener la sesión de la base de datos
+# create_all solo crea los índices al crear una tabla nueva; esto añade a las
+# tablas existentes los índices declarados después en los modelos
+def crear_indices_pendientes(motor):
+    for tabla in Base.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(bind=motor, checkfirst=True)
+
+# Función para obtener la sesión de la base de datos.
+# La sesión se cierra (y su conexión vuelve al pool) en todos los casos, también si
+# el endpoint lanza una excepción a mitad de una transacción.
 def get_db():
     db = SessionLocal()
     try:
         yield db
+    except Exception:
+        db.rollback()
+        raise
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# URL del motor asíncrono: asyncpg para PostgreSQL y aiosqlite para SQLite en local
+def _url_asincrona(url: str) -> str:
+    for prefijo, driver in (
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgres://", "postgresql+asyncpg://"),
+        ("sqlite://", "sqlite+aiosqlite://"),
+    ):
+        if url.startswith(prefijo):
+            return driver + url[len(prefijo):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _url_asincrona(DATABASE_URL)
+# Motor y sesiones asíncronas para los endpoints `async def`, que así no bloquean el event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_opciones_pool(ASYNC_DATABASE_URL, PoolAsincronoMedido))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Función para obtener una sesión asíncrona de la base de datos
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+
+# Estado de un pool: conexiones en uso, libres, desbordadas y tiempos de espera
+def estado_pool(motor) -> dict:
+    pool = motor.pool
+    estado = {"clase": type(pool).__name__, "descripcion": pool.status()}
+    if isinstance(pool, QueuePool):
+        estado.update(
+            tamano=pool.size(),
+            en_uso=pool.checkedout(),
+            libres=pool.checkedin(),
+            desbordamiento=pool.overflow(),
+            max_desbordamiento=pool._max_overflow,
+            timeout=pool.timeout(),
+        )
+    if hasattr(pool, "estadisticas"):
+        estado["esperas"] = pool.estadisticas.resumen()
+    return estado
\ No newline at end of file
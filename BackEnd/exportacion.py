@@ -0,0 +1,149 @@
+import csv
+import io
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+
+import models
+from database import SessionLocal
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Filas que se leen de la base de datos (y se escriben) en cada bloque
+FILAS_POR_LOTE = 2000
+
+COLUMNAS_EXPORTACION = [
+    "id_compra", "fecha_compra", "estado", "total_compra",
+    "id_usuario", "usuario_nombre", "usuario_email",
+    "id_detalle", "id_producto", "producto_nombre", "cantidad", "precio_unitario", "subtotal",
+]
+
+def parquet_disponible() -> bool:
+    return pa is not None
+
+# Una fila por línea de compra (las compras sin líneas salen una vez con el detalle vacío).
+# Sin estado se exportan las compras en cualquier estado
+def _consulta_exportacion(fecha_desde: Optional[datetime], fecha_hasta: Optional[datetime], estado: Optional[str]):
+    consulta = select(
+        models.Compra.id_compra,
+        models.Compra.fecha_compra,
+        models.Compra.estado,
+        models.Compra.total.label("total_compra"),
+        models.Compra.id_usuario,
+        models.Usuario.nombre.label("usuario_nombre"),
+        models.Usuario.email.label("usuario_email"),
+        models.DetalleCompra.id_detalle,
+        models.DetalleCompra.id_producto,
+        models.Producto.nombre.label("producto_nombre"),
+        models.DetalleCompra.cantidad,
+        models.DetalleCompra.precio_unitario,
+        (models.DetalleCompra.cantidad * models.DetalleCompra.precio_unitario).label("subtotal"),
+    ).select_from(models.Compra).outerjoin(
+        models.Usuario, models.Usuario.id_usuario == models.Compra.id_usuario
+    ).outerjoin(
+        models.DetalleCompra, models.DetalleCompra.id_compra == models.Compra.id_compra
+    ).outerjoin(
+        models.Producto, models.Producto.id_producto == models.DetalleCompra.id_producto
+    ).order_by(models.Compra.id_compra, models.DetalleCompra.id_detalle)
+
+    if estado is not None:
+        consulta = consulta.where(models.Compra.estado == estado)
+    if fecha_desde is not None:
+        consulta = consulta.where(models.Compra.fecha_compra >= fecha_desde)
+    if fecha_hasta is not None:
+        consulta = consulta.where(models.Compra.fecha_compra <= fecha_hasta)
+    return consulta
+
+# Recorre la exportación por lotes con un cursor de servidor (yield_per activa
+# stream_results), así que la memoria no depende del número de compras.
+# La sesión se abre aquí y no con Depends(get_db) porque las dependencias se
+# cierran antes de que StreamingResponse empiece a consumir el generador.
+def _lotes(fecha_desde: Optional[datetime], fecha_hasta: Optional[datetime], estado: Optional[str]):
+    db = SessionLocal()
+    try:
+        resultado = db.execute(
+            _consulta_exportacion(fecha_desde, fecha_hasta, estado),
+            execution_options={"yield_per": FILAS_POR_LOTE},
+        )
+        for lote in resultado.partitions():
+            yield lote
+    except Exception as e:
+        logging.error(f"Error exportando compras: {e}")
+        raise
+    finally:
+        db.close()
+
+def exportar_csv(fecha_desde: Optional[datetime] = None, fecha_hasta: Optional[datetime] = None, estado: Optional[str] = None):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUMNAS_EXPORTACION)
+    for lote in _lotes(fecha_desde, fecha_hasta, estado):
+        escritor.writerows(
+            [fila.fecha_compra.isoformat() if c == "fecha_compra" and fila.fecha_compra else v
+             for c, v in zip(COLUMNAS_EXPORTACION, fila)]
+            for fila in lote
+        )
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+# Destino de escritura que entrega los bytes escritos en cada bloque en lugar de acumularlos
+class _SalidaPorBloques(io.RawIOBase):
+    def __init__(self):
+        self._bloques = []
+        self._posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._bloques.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._bloques)
+        self._bloques.clear()
+        return datos
+
+# Cada lote se escribe como un row group de Parquet y se envía en cuanto está listo
+def exportar_parquet(fecha_desde: Optional[datetime] = None, fecha_hasta: Optional[datetime] = None, estado: Optional[str] = None):
+    esquema = pa.schema([
+        ("id_compra", pa.int64()),
+        ("fecha_compra", pa.timestamp("us")),
+        ("estado", pa.string()),
+        ("total_compra", pa.float64()),
+        ("id_usuario", pa.int64()),
+        ("usuario_nombre", pa.string()),
+        ("usuario_email", pa.string()),
+        ("id_detalle", pa.int64()),
+        ("id_producto", pa.int64()),
+        ("producto_nombre", pa.string()),
+        ("cantidad", pa.int64()),
+        ("precio_unitario", pa.float64()),
+        ("subtotal", pa.float64()),
+    ])
+    salida = _SalidaPorBloques()
+    escritor = pq.ParquetWriter(salida, esquema)
+    try:
+        for lote in _lotes(fecha_desde, fecha_hasta, estado):
+            columnas = list(zip(*lote))
+            escritor.write_table(pa.Table.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)],
+                schema=esquema,
+            ))
+            yield salida.vaciar()
+    finally:
+        escritor.close()
+    yield salida.vaciar()
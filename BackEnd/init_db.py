@@ -1,9 +1,10 @@
-from database import engine, Base
+from database import engine, Base, crear_indices_pendientes
 from models import Usuario, Rol, Producto, Categoria, Proveedor, Compra, DetalleCompra
 
 def init_db():
     # Crear todas las tablas en la base de datos
     Base.metadata.create_all(bind=engine)
+    crear_indices_pendientes(engine)
     print("Base de datos inicializada correctamente.")
 
 if __name__ == "__main__":
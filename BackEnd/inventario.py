@@ -0,0 +1,78 @@
+from collections import defaultdict
+
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session
+
+import models
+
+# Agrupa las líneas por producto (un pedido puede repetir el mismo producto)
+def agrupar_lineas(lineas) -> dict:
+    cantidades = defaultdict(int)
+    for id_producto, cantidad in lineas:
+        cantidades[id_producto] += cantidad
+    return dict(cantidades)
+
+# Descuenta stock de varios productos con una única sentencia condicional:
+#   UPDATE productos SET cantidad = cantidad - CASE ... END
+#   WHERE id_producto IN (...) AND cantidad >= CASE ... END
+# La comprobación y el descuento ocurren dentro de la misma fila bloqueada, así que dos
+# compras concurrentes nunca pueden vender las mismas unidades y no hace falta leer antes.
+# Devuelve la lista de líneas que no se pudieron descontar; si no está vacía el llamador
+# debe hacer rollback, porque las demás líneas sí se han descontado en la transacción.
+def descontar_stock(db: Session, lineas) -> list:
+    cantidades = agrupar_lineas(lineas)
+    if not cantidades:
+        return []
+
+    solicitado = case(cantidades, value=models.Producto.id_producto)
+    descontados = db.execute(
+        update(models.Producto)
+        .where(models.Producto.id_producto.in_(cantidades.keys()))
+        .where(models.Producto.cantidad >= solicitado)
+        .values(cantidad=models.Producto.cantidad - solicitado)
+        .returning(models.Producto.id_producto)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+
+    pendientes = set(cantidades) - set(descontados)
+    if not pendientes:
+        return []
+    return _describir_fallos(db, {i: cantidades[i] for i in pendientes})
+
+# Devuelve unidades al stock (cancelaciones, reservas caducadas...)
+def reponer_stock(db: Session, lineas):
+    cantidades = agrupar_lineas(lineas)
+    if not cantidades:
+        return
+    devuelto = case(cantidades, value=models.Producto.id_producto)
+    db.execute(
+        update(models.Producto)
+        .where(models.Producto.id_producto.in_(cantidades.keys()))
+        .values(cantidad=models.Producto.cantidad + devuelto)
+        .execution_options(synchronize_session=False)
+    )
+
+# Detalla por qué falló cada línea: producto inexistente o stock insuficiente
+def _describir_fallos(db: Session, pendientes: dict) -> list:
+    productos = {
+        p.id_producto: p
+        for p in db.query(models.Producto.id_producto, models.Producto.nombre, models.Producto.cantidad)
+        .filter(models.Producto.id_producto.in_(pendientes.keys()))
+    }
+    fallos = []
+    for id_producto, cantidad in sorted(pendientes.items()):
+        producto = productos.get(id_producto)
+        fallos.append({
+            "id_producto": id_producto,
+            "nombre": producto.nombre if producto else None,
+            "solicitado": cantidad,
+            "disponible": producto.cantidad if producto else 0,
+            "motivo": "stock_insuficiente" if producto else "no_encontrado",
+        })
+    return fallos
+
+# Mensaje de error legible para la primera línea fallida
+def mensaje_fallo(fallo: dict) -> str:
+    if fallo["motivo"] == "no_encontrado":
+        return f"Producto con ID {fallo['id_producto']} no encontrado"
+    return f"Stock insuficiente para el producto {fallo['nombre']}"
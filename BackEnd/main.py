@@ -1,40 +1,93 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request, Body
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.middleware.gzip import GZipMiddleware
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
 import os
 from typing import List
 import logging
 
-from database import get_db, engine, Base, SessionLocal
+from database import get_async_db, engine, Base, crear_indices_pendientes
 import models
 import schemas
-from auth.jwt import authenticate_user, create_access_token, get_current_active_user, ACCESS_TOKEN_EXPIRE_MINUTES
-from payment.stripe_utils import create_payment_intent, check_payment_status, process_webhook, crear_sesion_pago  # Nombre actualizado
+from auth import passwords
+from auth.limites import limitar_bcrypt
+from auth.refresco import emitir_token_refresco, purgar_tokens_caducados, REFRESCO_INTERVALO_PURGA
+from auth.jwt import authenticate_user_async, create_access_token, get_current_active_user, ACCESS_TOKEN_EXPIRE_MINUTES
+from paginacion import CABECERA_CURSOR, CABECERA_TOTAL
+from busqueda import configurar_busqueda
+from cache import invalidar_productos
+from cache_http import get_condicional_catalogo
+from inventario import mensaje_fallo
+from reservas import reservar_stock, liberar_reservas, liberar_reservas_expiradas, expiracion_sesion
+from tareas import iniciar_tareas, detener_tareas
+from correo import tareas_correo, conexion_smtp
+from payment.stripe_utils import create_payment_intent, check_payment_status, verificar_evento_webhook, crear_sesion_pago, comprobar_stripe_disponible  # Nombre actualizado
+from payment.webhooks import guardar_evento, tareas_webhooks
+from payment.sincronizacion import tareas_sincronizacion
+from analitica import tareas_analitica
+from payment.cliente_stripe import cliente as cliente_stripe
+from payment.stripe_falso import ClienteStripeFalso
+from payment.estados_pago import guardar_estado_pago, estado_vigente, respuesta_estado
 
 # Importar todos los routers
-from routers import usuarios, roles, categorias, proveedores, productos, compras, detalles_compra
+from routers import usuarios, roles, categorias, proveedores, productos, compras, detalles_compra, metricas, analitica, stripe_falso
 
 # Crear las tablas en la base de datos si no existen
 Base.metadata.create_all(bind=engine)
+crear_indices_pendientes(engine)
+# Crear los índices de búsqueda del catálogo
+configurar_busqueda(engine)
 
-app = FastAPI(title="NovaForgeGames API", description="API para la tienda en línea de NovaForgeGames")
+# Tareas de fondo mientras la aplicación está en marcha
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tareas = iniciar_tareas([
+        ("liberar_reservas_expiradas", liberar_reservas_expiradas, float(os.getenv("RESERVAS_INTERVALO_BARRIDO", "60"))),
+        ("purgar_tokens_caducados", purgar_tokens_caducados, REFRESCO_INTERVALO_PURGA),
+        *tareas_webhooks(),
+        *tareas_sincronizacion(),
+        *tareas_correo(),
+        *tareas_analitica(),
+    ])
+    yield
+    await detener_tareas(tareas)
+    cliente_stripe.cerrar()
+    passwords.cerrar()
+    await conexion_smtp.cerrar()
 
-# Configuración de CORS
+app = FastAPI(title="NovaForgeGames API", description="API para la tienda en línea de NovaForgeGames", lifespan=lifespan)
+
+# Compresión de las respuestas JSON grandes (brotli si está instalado, si no gzip)
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1000)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# ETag / Last-Modified y respuestas 304 para el catálogo. Se registra después de
+# la compresión para quedar por fuera de ella
+app.middleware("http")(get_condicional_catalogo)
+
+# Configuración de CORS (la última registrada queda por fuera de todas, también de los 304)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # En producción, especifica los dominios permitidos
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[CABECERA_CURSOR, CABECERA_TOTAL, "Content-Disposition"],
 )
 
 # Endpoint para autenticación y obtención de token JWT
-@app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+@app.post("/token", response_model=schemas.Token, dependencies=[Depends(limitar_bcrypt)])
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     # Aquí asumimos que el frontend envía la contraseña ya hasheada
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -45,7 +98,9 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     access_token = create_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    refresh_token = await db.run_sync(emitir_token_refresco, user.id_usuario)
+    await db.commit()
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 # Endpoint para obtener información del usuario currente
 @app.get("/users/me", response_model=schemas.Usuario)
@@ -54,90 +109,92 @@ async def read_users_me(current_user: schemas.Usuario = Depends(get_current_acti
 
 # Endpoints para Stripe con nombres en español
 @app.post("/crear-intencion-pago")
-async def crear_intencion_pago(monto: float, current_user: schemas.Usuario = Depends(get_current_active_user)):
-    return create_payment_intent(monto, metadata={"user_id": current_user.id_usuario})
+async def crear_intencion_pago(
+    monto: float,
+    current_user: schemas.Usuario = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    metadatos = {"user_id": current_user.id_usuario}
+    intencion = await cliente_stripe.ejecutar(create_payment_intent, monto, metadata=metadatos)
+    # El estado inicial se guarda ya para que las primeras consultas no vayan a Stripe
+    await db.run_sync(guardar_estado_pago, intencion["payment_intent_id"], {
+        "status": "requires_payment_method", "amount": monto, "currency": "eur", "metadata": metadatos,
+    })
+    await db.commit()
+    return intencion
 
+# Estado de un pago: se sirve del almacén local (actualizado por los webhooks) y solo
+# se consulta a Stripe si no está o si un estado intermedio se ha quedado antiguo
 @app.get("/estado-pago/{payment_intent_id}")
-async def estado_pago(payment_intent_id: str, current_user: schemas.Usuario = Depends(get_current_active_user)):
-    return check_payment_status(payment_intent_id)
+async def estado_pago(
+    payment_intent_id: str,
+    current_user: schemas.Usuario = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    guardado = await db.get(models.EstadoPago, payment_intent_id)
+    if guardado is not None and estado_vigente(guardado):
+        return respuesta_estado(guardado)
+    try:
+        estado = await cliente_stripe.ejecutar(check_payment_status, payment_intent_id)
+    except HTTPException as e:
+        # Con Stripe caído es mejor un estado algo antiguo que un error
+        if guardado is not None and e.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
+            return respuesta_estado(guardado)
+        raise
+    await db.run_sync(guardar_estado_pago, payment_intent_id, estado)
+    await db.commit()
+    return estado
 
+# Webhook de Stripe: verifica la firma, guarda el evento y responde enseguida.
+# El procesamiento lo hacen los workers de payment.webhooks con reintentos
 @app.post("/webhook")
-async def webhook_stripe(request: Request):
+async def webhook_stripe(request: Request, db: AsyncSession = Depends(get_async_db)):
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
-    event = process_webhook(payload, sig_header)
-
-    print(f"Evento recibido: {event['type']}")
-
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        user_id = session["metadata"].get("user_id")
-
-        import stripe
-        stripe.api_key = os.getenv("STRIPE_API_KEY")
-        items = stripe.checkout.Session.list_line_items(session["id"], limit=100)
-
-        total = sum([item.amount_total / 100 for item in items.data])
-
-        db = SessionLocal()
-        try:
-            # Crea la compra
-            db_compra = models.Compra(
-                id_usuario=user_id,
-                total=total
-            )
-            db.add(db_compra)
-            db.commit()
-            db.refresh(db_compra)
-
-            # Crea los detalles de la compra y actualiza stock
-            for item in items.data:
-                db_producto = db.query(models.Producto).filter(models.Producto.id_precio_stripe == item.price.id).first()
-                if db_producto:
-                    detalle = models.DetalleCompra(
-                        id_compra=db_compra.id_compra,
-                        id_producto=db_producto.id_producto,
-                        cantidad=item.quantity,
-                        precio_unitario=db_producto.precio
-                    )
-                    db_producto.cantidad = db_producto.cantidad - item.quantity
-                    db.add(detalle)
-                else:
-                    logging.error(f"Producto con id_precio_stripe {item.price.id} no encontrado.")
-            db.commit()
-            print(f"Compra y detalles guardados para usuario {user_id}")
-        except Exception as e:
-            db.rollback()
-            logging.error(f"Error guardando compra Stripe: {e}")
-            print(f"Error guardando compra Stripe: {e}")
-        finally:
-            db.close()
+    event = verificar_evento_webhook(payload, sig_header)
 
+    if not await guardar_evento(db, event):
+        logging.info(f"Evento {event['id']} ya recibido, se ignora el reenvío")
     return {"status": "success"}
 
 # Nuevos endpoints para la pasarela de pago
 @app.post("/crear-sesion-pago")
 async def crear_sesion_checkout(
     items: List[dict] = Body(...),
-    current_user: schemas.Usuario = Depends(get_current_active_user)
+    current_user: schemas.Usuario = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db = next(get_db())
+    # Si Stripe no está disponible no se llega a reservar stock
+    comprobar_stripe_disponible()
+
     items_linea = []
     total = 0
     detalles = []
 
-    # 1. Verifica stock y prepara detalles
+    # 1. Resuelve todos los productos del carrito con una sola consulta y prepara detalles
+    ids_producto = {item["id_producto"] for item in items}
+    resultado = await db.execute(select(models.Producto).where(models.Producto.id_producto.in_(ids_producto)))
+    productos_por_id = {p.id_producto: p for p in resultado.scalars()}
     for item in items:
-        db_producto = db.query(models.Producto).filter(models.Producto.id_producto == item["id_producto"]).first()
+        db_producto = productos_por_id.get(item["id_producto"])
         if not db_producto:
             raise HTTPException(status_code=404, detail=f"Producto con ID {item['id_producto']} no encontrado")
-        if db_producto.cantidad < item["cantidad"]:
-            raise HTTPException(status_code=400, detail=f"Stock insuficiente para {db_producto.nombre}")
 
-        items_linea.append({
-            "price": db_producto.id_precio_stripe,
-            "quantity": item["cantidad"]
-        })
+        if db_producto.estado_sync == "sincronizado" and db_producto.id_precio_stripe:
+            items_linea.append({
+                "price": db_producto.id_precio_stripe,
+                "quantity": item["cantidad"]
+            })
+        else:
+            # Alta o cambio de precio aún sin llevar a Stripe: se cobra el precio local
+            items_linea.append({
+                "price_data": {
+                    "currency": "eur",
+                    "unit_amount": int(round(db_producto.precio * 100)),
+                    "product_data": {"name": db_producto.nombre},
+                },
+                "quantity": item["cantidad"]
+            })
         total += db_producto.precio * item["cantidad"]
         detalles.append({
             "id_producto": db_producto.id_producto,
@@ -148,38 +205,46 @@ async def crear_sesion_checkout(
     # 2. Crea la compra en la base de datos (estado "pendiente")
     db_compra = models.Compra(
         id_usuario=current_user.id_usuario,
-        total=total
-        # estado="pendiente"  # <-- Elimina o comenta esta línea
+        total=total,
+        estado="pendiente"
     )
     db.add(db_compra)
-    db.commit()
-    db.refresh(db_compra)
-
-    # 3. Crea los detalles de la compra
-    for det in detalles:
-        detalle = models.DetalleCompra(
-            id_compra=db_compra.id_compra,
-            id_producto=det["id_producto"],
-            cantidad=det["cantidad"],
-            precio_unitario=det["precio_unitario"]
-        )
-        db.add(detalle)
-    db.commit()
+    await db.flush()
+    id_compra = db_compra.id_compra
+
+    # 3. Reserva el stock durante la vida de la sesión de pago
+    fallos = await db.run_sync(reservar_stock, id_compra, [(d["id_producto"], d["cantidad"]) for d in detalles])
+    if fallos:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="; ".join(mensaje_fallo(f) for f in fallos))
 
-    # 4. URLs de redirección
+    # 4. Crea los detalles de la compra con una sola inserción y confirma todo a la vez
+    await db.execute(insert(models.DetalleCompra), [dict(det, id_compra=id_compra) for det in detalles])
+    await db.commit()
+    await run_in_threadpool(invalidar_productos, [d["id_producto"] for d in detalles])
+
+    # 5. URLs de redirección
     url_exito = os.getenv("FRONTEND_URL", "http://localhost:5173") + "/pagar/exito"
     url_cancelacion = os.getenv("FRONTEND_URL", "http://localhost:5173") + "/pagar/fallo"
 
-    # 5. Crea la sesión de Stripe con el id_compra en metadatos
-    sesion_checkout = crear_sesion_pago(
-        items_linea=items_linea,
-        url_exito=url_exito,
-        url_cancelacion=url_cancelacion,
-        metadatos={
-            "user_id": current_user.id_usuario,
-            "id_compra": db_compra.id_compra
-        }
-    )
+    # 6. Crea la sesión de Stripe con el id_compra en metadatos; si falla, se libera la reserva
+    try:
+        sesion_checkout = await cliente_stripe.ejecutar(
+            crear_sesion_pago,
+            items_linea=items_linea,
+            url_exito=url_exito,
+            url_cancelacion=url_cancelacion,
+            metadatos={
+                "user_id": current_user.id_usuario,
+                "id_compra": id_compra
+            },
+            expira_en=expiracion_sesion()
+        )
+    except HTTPException:
+        await db.run_sync(liberar_reservas, id_compra)
+        await db.commit()
+        await run_in_threadpool(invalidar_productos, [d["id_producto"] for d in detalles])
+        raise
 
     return {"url_pago": sesion_checkout.url}
 
@@ -191,6 +256,11 @@ app.include_router(proveedores.router)
 app.include_router(productos.router)
 app.include_router(compras.router)
 app.include_router(detalles_compra.router)
+app.include_router(metricas.router)
+app.include_router(analitica.router)
+# Solo con el Stripe en memoria: simulación de pagos y webhooks por HTTP
+if isinstance(cliente_stripe, ClienteStripeFalso):
+    app.include_router(stripe_falso.router)
 
 @app.get("/")
 async def root():
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Table, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Table, Boolean, Index, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from datetime import datetime
 from database import Base
 
 # Modelo de Usuarios
@@ -38,13 +39,19 @@ class Producto(Base):
     id_producto = Column(Integer, primary_key=True, index=True)
     nombre = Column(String, nullable=False)
     descripción = Column(String)
-    precio = Column(Float, nullable=False)
+    precio = Column(Float, nullable=False, index=True)
     cantidad = Column(Integer, nullable=False)
-    id_categoria = Column(Integer, ForeignKey("categorias.id_categoria"))
-    id_proveedor = Column(Integer, ForeignKey("proveedores.id_proveedor"))
+    id_categoria = Column(Integer, ForeignKey("categorias.id_categoria"), index=True)
+    id_proveedor = Column(Integer, ForeignKey("proveedores.id_proveedor"), index=True)
     id_producto_stripe = Column(String)  # Cambiado de stripe_product_id
     id_precio_stripe = Column(String)    # Cambiado de stripe_price_id
     imagen_url = Column(String)         # URL de la imagen del producto
+    # Sincronización con Stripe: pendiente, sincronizado o error (los productos
+    # anteriores a la cola de sincronización ya están en Stripe)
+    estado_sync = Column(String, nullable=False, server_default="sincronizado")
+    # Se incrementa con cada cambio encolado; el worker solo marca el producto
+    # sincronizado si no ha cambiado desde que leyó la versión
+    version_sync = Column(Integer, nullable=False, server_default="0")
     
     # Relaciones
     categoria = relationship("Categoria", back_populates="productos")
@@ -77,24 +84,201 @@ class Compra(Base):
     __tablename__ = "compras"
     
     id_compra = Column(Integer, primary_key=True, index=True)
-    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), nullable=False)
-    fecha_compra = Column(DateTime, default=func.now(), nullable=False)
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), nullable=False, index=True)
+    fecha_compra = Column(DateTime, default=func.now(), nullable=False, index=True)
     total = Column(Float, nullable=False)
+    # pendiente (sesión de pago abierta), pagada o cancelada
+    estado = Column(String, nullable=False, default="pagada", server_default="pagada")
     
     # Relaciones
     usuario = relationship("Usuario", back_populates="compras")
     detalles = relationship("DetalleCompra", back_populates="compra")
+    reservas = relationship("ReservaStock", back_populates="compra")
+
+    __table_args__ = (
+        # Historial de un cliente ordenado por fecha
+        Index("ix_compras_usuario_fecha", "id_usuario", "fecha_compra"),
+    )
 
 # Tabla de relación entre Compras y Productos (Detalle_Compra)
 class DetalleCompra(Base):
     __tablename__ = "detalle_compra"
     
     id_detalle = Column(Integer, primary_key=True, index=True)
-    id_compra = Column(Integer, ForeignKey("compras.id_compra"), nullable=False)
+    id_compra = Column(Integer, ForeignKey("compras.id_compra"), nullable=False, index=True)
     id_producto = Column(Integer, ForeignKey("productos.id_producto"), nullable=False)
     cantidad = Column(Integer, nullable=False)
     precio_unitario = Column(Float, nullable=False)
     
     # Relaciones
     compra = relationship("Compra", back_populates="detalles")
-    producto = relationship("Producto", back_populates="detalles")
\ No newline at end of file
+    producto = relationship("Producto", back_populates="detalles")
+
+# Reservas temporales de stock mientras una sesión de pago está abierta
+class ReservaStock(Base):
+    __tablename__ = "reservas_stock"
+    
+    id_reserva = Column(Integer, primary_key=True, index=True)
+    id_compra = Column(Integer, ForeignKey("compras.id_compra"), nullable=False, index=True)
+    id_producto = Column(Integer, ForeignKey("productos.id_producto"), nullable=False)
+    cantidad = Column(Integer, nullable=False)
+    # activa, convertida (pago completado) o expirada (stock devuelto)
+    estado = Column(String, nullable=False, default="activa")
+    expira_en = Column(DateTime, nullable=False)
+    creada_en = Column(DateTime, default=func.now(), nullable=False)
+    
+    # Relaciones
+    compra = relationship("Compra", back_populates="reservas")
+    producto = relationship("Producto")
+
+    __table_args__ = (
+        # Para el barrido de reservas caducadas
+        Index("ix_reservas_stock_estado_expira", "estado", "expira_en"),
+        # Para consultar el stock reservado de un producto
+        Index("ix_reservas_stock_producto_estado", "id_producto", "estado"),
+    )
+
+
+# Resumen de ventas por día (solo compras pagadas), mantenido de forma incremental
+class VentaDiaria(Base):
+    __tablename__ = "ventas_diarias"
+    
+    fecha = Column(Date, primary_key=True)
+    compras = Column(Integer, nullable=False, default=0)
+    unidades = Column(Integer, nullable=False, default=0)
+    ingresos = Column(Float, nullable=False, default=0)
+
+# Compras pagadas que aún no se han sumado a los resúmenes de ventas. La venta
+# solo inserta aquí su fila; el worker de analítica la suma después por lotes
+class VentaPendiente(Base):
+    __tablename__ = "ventas_pendientes"
+
+    id_compra = Column(Integer, ForeignKey("compras.id_compra", ondelete="CASCADE"), primary_key=True)
+
+# Resumen de ventas por día y producto. La categoría y el proveedor se copian
+# para poder agregar por ellos sin unir con productos
+class VentaDiariaProducto(Base):
+    __tablename__ = "ventas_diarias_producto"
+    
+    fecha = Column(Date, primary_key=True)
+    id_producto = Column(Integer, ForeignKey("productos.id_producto"), primary_key=True)
+    id_categoria = Column(Integer, ForeignKey("categorias.id_categoria"))
+    id_proveedor = Column(Integer, ForeignKey("proveedores.id_proveedor"))
+    unidades = Column(Integer, nullable=False, default=0)
+    ingresos = Column(Float, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index("ix_ventas_diarias_producto_producto_fecha", "id_producto", "fecha"),
+        Index("ix_ventas_diarias_producto_categoria_fecha", "id_categoria", "fecha"),
+        Index("ix_ventas_diarias_producto_proveedor_fecha", "id_proveedor", "fecha"),
+    )
+
+# Bandeja de entrada de los webhooks de Stripe: el evento se guarda al recibirlo
+# y lo procesan los workers de fondo con reintentos
+class EventoWebhook(Base):
+    __tablename__ = "eventos_webhook"
+    
+    id_evento = Column(Integer, primary_key=True, index=True)
+    id_evento_stripe = Column(String, nullable=False, unique=True)
+    tipo = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    # pendiente, procesando, procesado o fallido (agotó los reintentos)
+    estado = Column(String, nullable=False, default="pendiente")
+    intentos = Column(Integer, nullable=False, default=0)
+    # Siguiente reintento o, mientras se procesa, fin del bloqueo del worker
+    proximo_intento = Column(DateTime, nullable=False, default=datetime.utcnow)
+    error = Column(Text)
+    recibido_en = Column(DateTime, nullable=False, default=datetime.utcnow)
+    procesado_en = Column(DateTime)
+    
+    __table_args__ = (
+        Index("ix_eventos_webhook_estado_proximo", "estado", "proximo_intento"),
+    )
+
+# Registro de eventos de Stripe ya aplicados. Se inserta en la misma transacción
+# que los efectos del evento, así que un evento nunca se aplica dos veces
+class EventoProcesado(Base):
+    __tablename__ = "eventos_procesados"
+    
+    id_evento_stripe = Column(String, primary_key=True)
+    tipo = Column(String, nullable=False)
+    procesado_en = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+# Último estado conocido de cada intención de pago, alimentado por los webhooks
+# payment_intent.* y por las consultas a Stripe
+class EstadoPago(Base):
+    __tablename__ = "estados_pago"
+    
+    id_intencion_pago = Column(String, primary_key=True)
+    estado = Column(String, nullable=False)
+    importe = Column(Float, nullable=False)
+    moneda = Column(String, nullable=False)
+    metadatos = Column(Text)
+    actualizado_en = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+# Outbox de sincronización del catálogo con Stripe: se escribe en la misma
+# transacción que el cambio del producto y la procesa un worker de fondo
+class SincronizacionStripe(Base):
+    __tablename__ = "sincronizaciones_stripe"
+    
+    id_sincronizacion = Column(Integer, primary_key=True, index=True)
+    # Sin clave foránea: la fila debe sobrevivir al borrado del producto para archivarlo en Stripe
+    id_producto = Column(Integer, nullable=False, index=True)
+    # sincronizar (alta o cambios del producto) o archivar (producto borrado)
+    operacion = Column(String, nullable=False)
+    id_producto_stripe = Column(String)
+    # pendiente, procesando, completada o fallida
+    estado = Column(String, nullable=False, default="pendiente")
+    intentos = Column(Integer, nullable=False, default=0)
+    proximo_intento = Column(DateTime, nullable=False, default=datetime.utcnow)
+    error = Column(Text)
+    creada_en = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_sincronizaciones_stripe_estado_proximo", "estado", "proximo_intento"),
+    )
+
+# Tokens de refresco. Solo se guarda el SHA-256 del token, que es lo que se busca
+# (índice único). Cada uso lo revoca y emite otro de la misma familia; si se
+# presenta uno ya revocado se entiende que lo han robado y se revoca la familia
+class TokenRefresco(Base):
+    __tablename__ = "tokens_refresco"
+    
+    id_token = Column(Integer, primary_key=True, index=True)
+    hash_token = Column(String(64), nullable=False, unique=True)
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), nullable=False, index=True)
+    # Cadena de rotaciones que parte de un mismo inicio de sesión
+    familia = Column(String(32), nullable=False, index=True)
+    expira_en = Column(DateTime, nullable=False, index=True)
+    revocado = Column(Boolean, nullable=False, default=False)
+    creado_en = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+# Bandeja de salida de correo: los endpoints encolan y un worker de fondo los
+# envía reutilizando la conexión SMTP, con reintentos y límite de ritmo
+class CorreoSaliente(Base):
+    __tablename__ = "correos_salientes"
+    
+    id_correo = Column(Integer, primary_key=True, index=True)
+    destinatario = Column(String, nullable=False)
+    asunto = Column(String, nullable=False)
+    cuerpo = Column(Text, nullable=False)
+    # pendiente, enviando, enviado o fallido
+    estado = Column(String, nullable=False, default="pendiente")
+    intentos = Column(Integer, nullable=False, default=0)
+    proximo_intento = Column(DateTime, nullable=False, default=datetime.utcnow)
+    error = Column(Text)
+    creado_en = Column(DateTime, nullable=False, default=datetime.utcnow)
+    enviado_en = Column(DateTime)
+    
+    __table_args__ = (
+        Index("ix_correos_salientes_estado_proximo", "estado", "proximo_intento"),
+    )
+
+# Versión del catálogo compartida por todos los workers (una sola fila). Cada
+# cambio de productos o categorías la incrementa; de ella salen los ETag del catálogo
+class VersionCatalogo(Base):
+    __tablename__ = "version_catalogo"
+    
+    id_version = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    modificado_en = Column(DateTime, nullable=False, default=datetime.utcnow)
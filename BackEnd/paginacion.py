@@ -0,0 +1,72 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+# Cabecera en la que se devuelve el cursor de la siguiente página
+CABECERA_CURSOR = "X-Next-Cursor"
+# Cabecera con el número total de resultados de una búsqueda
+CABECERA_TOTAL = "X-Total-Count"
+
+# Codifica los valores de la última fila como un cursor opaco
+def codificar_cursor(valores: list) -> str:
+    serializados = [v.isoformat() if isinstance(v, datetime) else v for v in valores]
+    crudo = json.dumps(serializados, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+# Decodifica un cursor y convierte cada valor al tipo de su columna
+def decodificar_cursor(cursor: str, columnas: list) -> list:
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if not isinstance(valores, list) or len(valores) != len(columnas):
+            raise ValueError
+        return [
+            datetime.fromisoformat(v) if col.type.python_type is datetime else v
+            for v, col in zip(valores, columnas)
+        ]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+# Pagina una consulta por skip/limit o por cursor (keyset).
+# `columnas` define el orden estable: la última debe ser única (normalmente la clave primaria).
+# Con cursor, la consulta arranca justo después de la última fila vista en lugar de
+# recorrer `skip` filas, así que cualquier página cuesta lo mismo que la primera.
+def paginar(
+    query,
+    columnas: list,
+    skip: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    response: Optional[Response] = None,
+    descendente: bool = False,
+):
+    orden = [c.desc() if descendente else c.asc() for c in columnas]
+    if cursor:
+        valores = decodificar_cursor(cursor, columnas)
+        clave = tuple_(*columnas) if len(columnas) > 1 else columnas[0]
+        limite = tuple_(*valores) if len(columnas) > 1 else valores[0]
+        query = query.filter(clave < limite if descendente else clave > limite).order_by(*orden)
+    else:
+        query = query.order_by(*orden).offset(skip)
+
+    # Se pide una fila de más para saber si existe una página siguiente
+    filas = query.limit(limit + 1).all()
+    hay_mas = len(filas) > limit
+    filas = filas[:limit]
+
+    if response is not None and hay_mas and filas:
+        ultima = filas[-1]
+        response.headers[CABECERA_CURSOR] = codificar_cursor(
+            [_valor_columna(ultima, col) for col in columnas]
+        )
+    return filas
+
+# Obtiene el valor de una columna tanto de entidades ORM como de filas de resultados
+def _valor_columna(fila, columna):
+    if hasattr(fila, "_mapping") and columna in fila._mapping:
+        return fila._mapping[columna]
+    return getattr(fila, columna.key)
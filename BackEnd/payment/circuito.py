@@ -0,0 +1,122 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+
+# El circuito se abre cuando, en los últimos VENTANA segundos y con al menos
+# MINIMO_LLAMADAS llamadas, la proporción de fallos alcanza UMBRAL_FALLOS
+STRIPE_CIRCUITO_UMBRAL = float(os.getenv("STRIPE_CIRCUITO_UMBRAL", "0.5"))
+STRIPE_CIRCUITO_MINIMO = int(os.getenv("STRIPE_CIRCUITO_MINIMO", "10"))
+STRIPE_CIRCUITO_VENTANA = float(os.getenv("STRIPE_CIRCUITO_VENTANA", "30"))
+# Segundos que permanece abierto antes de dejar pasar una llamada de prueba
+STRIPE_CIRCUITO_ESPERA = float(os.getenv("STRIPE_CIRCUITO_ESPERA", "20"))
+
+class CircuitoAbierto(Exception):
+    def __init__(self, nombre: str, reintentar_en: float):
+        super().__init__(f"Circuito {nombre} abierto")
+        self.reintentar_en = reintentar_en
+
+# Cortacircuitos para un servicio externo:
+#   cerrado     -> las llamadas pasan y se cuentan éxitos y fallos
+#   abierto     -> las llamadas fallan al instante sin llegar al servicio
+#   semiabierto -> pasada la espera se deja pasar una sola llamada de prueba;
+#                  si va bien se cierra, si falla vuelve a abrirse
+class Circuito:
+    def __init__(
+        self,
+        nombre: str,
+        umbral_fallos: float = STRIPE_CIRCUITO_UMBRAL,
+        minimo_llamadas: int = STRIPE_CIRCUITO_MINIMO,
+        ventana: float = STRIPE_CIRCUITO_VENTANA,
+        espera: float = STRIPE_CIRCUITO_ESPERA,
+    ):
+        self.nombre = nombre
+        self.umbral_fallos = umbral_fallos
+        self.minimo_llamadas = minimo_llamadas
+        self.ventana = ventana
+        self.espera = espera
+        self._resultados = deque()
+        self._estado = "cerrado"
+        self._abierto_en = 0.0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+        self.rechazadas = 0
+        self.aperturas = 0
+
+    # Comprueba si se puede llamar al servicio; lanza CircuitoAbierto si no
+    def permitir(self):
+        with self._lock:
+            if self._estado == "cerrado":
+                return
+            restante = self._abierto_en + self.espera - time.monotonic()
+            if self._estado == "abierto" and restante <= 0:
+                self._estado = "semiabierto"
+            if self._estado == "semiabierto" and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return
+            self.rechazadas += 1
+            raise CircuitoAbierto(self.nombre, max(restante, 1))
+
+    # Consulta sin efectos: indica si ahora mismo se rechazarían las llamadas
+    def abierto(self) -> bool:
+        with self._lock:
+            return self._estado == "abierto" and time.monotonic() < self._abierto_en + self.espera
+
+    def registrar_exito(self):
+        with self._lock:
+            if self._estado == "semiabierto":
+                self._cerrar()
+            self._anotar(True)
+
+    def registrar_fallo(self):
+        with self._lock:
+            if self._estado == "semiabierto":
+                self._abrir()
+                return
+            self._anotar(False)
+            total = len(self._resultados)
+            fallos = sum(1 for _, correcto in self._resultados if not correcto)
+            if self._estado == "cerrado" and total >= self.minimo_llamadas and fallos / total >= self.umbral_fallos:
+                self._abrir()
+
+    # Segundos recomendados al cliente antes de reintentar (cabecera Retry-After)
+    def reintentar_en(self) -> int:
+        with self._lock:
+            if self._estado == "cerrado":
+                return 1
+            return max(math.ceil(self._abierto_en + self.espera - time.monotonic()), 1)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            self._purgar(time.monotonic())
+            total = len(self._resultados)
+            fallos = sum(1 for _, correcto in self._resultados if not correcto)
+            return {
+                "estado": self._estado,
+                "llamadas_ventana": total,
+                "fallos_ventana": fallos,
+                "rechazadas": self.rechazadas,
+                "aperturas": self.aperturas,
+            }
+
+    def _anotar(self, correcto: bool):
+        ahora = time.monotonic()
+        self._resultados.append((ahora, correcto))
+        self._purgar(ahora)
+
+    def _purgar(self, ahora: float):
+        while self._resultados and self._resultados[0][0] < ahora - self.ventana:
+            self._resultados.popleft()
+
+    def _abrir(self):
+        self._estado = "abierto"
+        self._abierto_en = time.monotonic()
+        self._prueba_en_curso = False
+        self._resultados.clear()
+        self.aperturas += 1
+
+    def _cerrar(self):
+        self._estado = "cerrado"
+        self._prueba_en_curso = False
+        self._resultados.clear()
@@ -0,0 +1,228 @@
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+import stripe
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+load_dotenv()
+
+# Configuración del cliente HTTP de Stripe: plazo total y reintentos por defecto
+STRIPE_TIMEOUT = float(os.getenv("STRIPE_TIMEOUT", "10"))
+STRIPE_REINTENTOS = int(os.getenv("STRIPE_REINTENTOS", "2"))
+# Plazo total de cada operación en segundos, reintentos y esperas incluidos, y
+# número máximo de reintentos dentro de ese plazo. Las que se hacen con un
+# usuario esperando tienen plazos cortos; las del worker pueden reintentar más.
+# Se pueden cambiar con STRIPE_TIMEOUT_<OPERACION> y STRIPE_REINTENTOS_<OPERACION>
+LIMITES_OPERACION = {
+    "crear_producto": (15, 1),
+    "crear_precio": (10, 1),
+    "crear_intencion_pago": (8, 1),
+    "obtener_intencion_pago": (5, 2),
+    "crear_sesion_checkout": (8, 1),
+    # Operaciones del worker de sincronización del catálogo: nadie espera la respuesta
+    "actualizar_producto": (20, 3),
+    "obtener_precio": (10, 3),
+    "archivar_precio": (20, 3),
+}
+# Un intento no empieza con menos tiempo que este por delante
+PLAZO_MINIMO_INTENTO = 1
+# Espera entre reintentos: 0.5s, 1s, 2s... hasta 5s, con aleatoriedad (como el SDK)
+ESPERA_BASE = 0.5
+ESPERA_MAX = 5
+STRIPE_MAX_CONEXIONES = int(os.getenv("STRIPE_MAX_CONEXIONES", "20"))
+# Hilos dedicados a las llamadas a Stripe, para no ocupar el pool general de FastAPI
+STRIPE_HILOS = int(os.getenv("STRIPE_HILOS", "8"))
+
+# Parte común del cliente real y del falso: el pool de hilos donde se ejecutan
+# las llamadas bloqueantes a Stripe
+class _ClienteBase:
+    def __init__(self, hilos: int = STRIPE_HILOS):
+        self._ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="stripe")
+
+    # Ejecuta una llamada bloqueante en el pool de Stripe sin bloquear el event loop
+    async def ejecutar(self, funcion, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._ejecutor, partial(funcion, *args, **kwargs))
+
+    def cerrar(self):
+        self._ejecutor.shutdown(wait=False)
+
+# Cliente de Stripe con una sesión HTTP persistente: las conexiones TLS se
+# reutilizan entre llamadas en lugar de abrir una nueva cada vez
+class ClienteStripe(_ClienteBase):
+    def __init__(
+        self,
+        api_key: str,
+        timeout: float = STRIPE_TIMEOUT,
+        reintentos: int = STRIPE_REINTENTOS,
+        max_conexiones: int = STRIPE_MAX_CONEXIONES,
+        hilos: int = STRIPE_HILOS,
+    ):
+        super().__init__(hilos)
+        self._api_key = api_key
+        self._timeout = timeout
+        self._reintentos = reintentos
+        self._sesion_http = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=max_conexiones, pool_maxsize=max_conexiones)
+        self._sesion_http.mount("https://", adaptador)
+        # Un StripeClient por tiempo de intento, todos sobre la misma sesión HTTP
+        self._clientes = {}
+        self._lock = threading.Lock()
+
+    def _limites(self, operacion: str):
+        plazo, reintentos = LIMITES_OPERACION.get(operacion, (self._timeout, self._reintentos))
+        return (
+            float(os.getenv(f"STRIPE_TIMEOUT_{operacion.upper()}", plazo)),
+            int(os.getenv(f"STRIPE_REINTENTOS_{operacion.upper()}", reintentos)),
+        )
+
+    # StripeClient sin reintentos propios (los hace _llamar) y con el tiempo de
+    # cada intento en segundos enteros, para reutilizar pocos clientes distintos
+    def _stripe(self, timeout: float):
+        timeout = max(PLAZO_MINIMO_INTENTO, math.floor(timeout))
+        with self._lock:
+            if timeout not in self._clientes:
+                self._clientes[timeout] = stripe.StripeClient(
+                    self._api_key,
+                    http_client=stripe.RequestsClient(timeout=timeout, session=self._sesion_http),
+                    max_network_retries=0,
+                )
+            return self._clientes[timeout]
+
+    # Ejecuta `llamada(cliente, opciones)` dentro del plazo total de la operación.
+    # Solo se reintentan los errores de red y los 5xx, y solo si queda tiempo
+    # para esperar y hacer otro intento; cada intento tiene como tiempo máximo
+    # el que queda de plazo. En las escrituras todos los intentos llevan la misma
+    # clave de idempotencia, así que un reintento no duplica nada en Stripe
+    def _llamar(self, operacion: str, llamada, escritura: bool = False, clave_idempotencia: str = None):
+        plazo, reintentos = self._limites(operacion)
+        limite = time.monotonic() + plazo
+        opciones = {}
+        if escritura:
+            opciones["idempotency_key"] = clave_idempotencia or uuid.uuid4().hex
+        intento = 0
+        while True:
+            try:
+                return llamada(self._stripe(limite - time.monotonic()), opciones)
+            except stripe.StripeError as e:
+                if isinstance(e, stripe.APIConnectionError):
+                    reintentable = e.should_retry
+                else:
+                    reintentable = (e.http_status or 0) >= 500
+                intento += 1
+                espera = min(ESPERA_BASE * 2 ** (intento - 1), ESPERA_MAX) * random.uniform(0.5, 1)
+                if not reintentable or intento > reintentos or time.monotonic() + espera + PLAZO_MINIMO_INTENTO > limite:
+                    raise
+                time.sleep(espera)
+
+    # Crea el producto y su precio en una sola llamada (default_price_data).
+    # Con clave de idempotencia, repetir la llamada (por ejemplo al reintentar
+    # un trabajo) no crea objetos duplicados
+    def crear_producto(self, nombre: str, descripcion: str = None, imagenes: list = None,
+                       precio_centimos: int = None, moneda: str = "eur", clave_idempotencia: str = None):
+        parametros = {"name": nombre, "images": imagenes or []}
+        if descripcion:
+            parametros["description"] = descripcion
+        if precio_centimos is not None:
+            parametros["default_price_data"] = {"unit_amount": precio_centimos, "currency": moneda}
+        return self._llamar(
+            "crear_producto", lambda c, opciones: c.products.create(params=parametros, options=opciones),
+            escritura=True, clave_idempotencia=clave_idempotencia,
+        )
+
+    def crear_precio(self, id_producto: str, precio_centimos: int, moneda: str = "eur", clave_idempotencia: str = None):
+        parametros = {"product": id_producto, "unit_amount": precio_centimos, "currency": moneda}
+        return self._llamar(
+            "crear_precio", lambda c, opciones: c.prices.create(params=parametros, options=opciones),
+            escritura=True, clave_idempotencia=clave_idempotencia,
+        )
+
+    def actualizar_producto(self, id_producto: str, nombre: str, descripcion: str = None,
+                            imagenes: list = None, precio_por_defecto: str = None):
+        parametros = {"name": nombre, "description": descripcion or "", "images": imagenes or []}
+        if precio_por_defecto:
+            parametros["default_price"] = precio_por_defecto
+        return self._llamar(
+            "actualizar_producto",
+            lambda c, opciones: c.products.update(id_producto, params=parametros, options=opciones),
+            escritura=True,
+        )
+
+    def obtener_precio(self, id_precio: str):
+        return self._llamar("obtener_precio", lambda c, opciones: c.prices.retrieve(id_precio))
+
+    def archivar_precio(self, id_precio: str):
+        return self._llamar(
+            "archivar_precio",
+            lambda c, opciones: c.prices.update(id_precio, params={"active": False}, options=opciones),
+            escritura=True,
+        )
+
+    # Los productos con precios no se pueden borrar en Stripe: se desactivan
+    def archivar_producto(self, id_producto: str):
+        return self._llamar(
+            "actualizar_producto",
+            lambda c, opciones: c.products.update(id_producto, params={"active": False}, options=opciones),
+            escritura=True,
+        )
+
+    def crear_intencion_pago(self, importe_centimos: int, moneda: str = "eur", metadatos=None):
+        parametros = {
+            "amount": importe_centimos,
+            "currency": moneda,
+            "metadata": metadatos or {},
+            "automatic_payment_methods": {"enabled": True},
+        }
+        return self._llamar(
+            "crear_intencion_pago",
+            lambda c, opciones: c.payment_intents.create(params=parametros, options=opciones),
+            escritura=True,
+        )
+
+    def obtener_intencion_pago(self, id_intencion: str):
+        return self._llamar("obtener_intencion_pago", lambda c, opciones: c.payment_intents.retrieve(id_intencion))
+
+    def crear_sesion_checkout(self, items_linea, url_exito, url_cancelacion, metadatos=None, expira_en: int = None):
+        parametros = {
+            "payment_method_types": ["card"],
+            "line_items": items_linea,
+            "mode": "payment",
+            "success_url": url_exito,
+            "cancel_url": url_cancelacion,
+            "metadata": metadatos or {},
+        }
+        if expira_en is not None:
+            parametros["expires_at"] = expira_en
+        return self._llamar(
+            "crear_sesion_checkout",
+            lambda c, opciones: c.checkout.sessions.create(params=parametros, options=opciones),
+            escritura=True,
+        )
+
+    def construir_evento(self, payload, firma, secreto):
+        # Solo comprueba la firma, sin llamar a Stripe
+        return self._stripe(self._timeout).construct_event(payload, firma, secreto)
+
+    def cerrar(self):
+        super().cerrar()
+        self._sesion_http.close()
+
+# Cliente único del proceso. Con STRIPE_FAKE=1 se usa el adaptador en memoria
+# de payment.stripe_falso, para pruebas de carga sin conexión
+def crear_cliente():
+    if os.getenv("STRIPE_FAKE", "").lower() in ("1", "true", "si", "sí"):
+        from payment.stripe_falso import ClienteStripeFalso
+        return ClienteStripeFalso()
+    # Sin clave el cliente se crea igual y las llamadas fallan con error de autenticación
+    return ClienteStripe(os.getenv("STRIPE_API_KEY", ""))
+
+cliente = crear_cliente()
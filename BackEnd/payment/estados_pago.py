@@ -0,0 +1,51 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+import models
+
+# Estados que ya no cambian: se sirven siempre desde la base de datos
+ESTADOS_FINALES = {"succeeded", "canceled"}
+# Antigüedad máxima de un estado intermedio antes de volver a preguntar a Stripe
+ESTADO_PAGO_TTL = timedelta(seconds=float(os.getenv("ESTADO_PAGO_TTL", "30")))
+
+# Indica si el estado guardado se puede devolver sin consultar a Stripe
+def estado_vigente(fila: models.EstadoPago) -> bool:
+    return fila.estado in ESTADOS_FINALES or datetime.utcnow() - fila.actualizado_en < ESTADO_PAGO_TTL
+
+# Misma forma que check_payment_status
+def respuesta_estado(fila: models.EstadoPago) -> dict:
+    return {
+        "status": fila.estado,
+        "amount": fila.importe,
+        "currency": fila.moneda,
+        "metadata": json.loads(fila.metadatos) if fila.metadatos else {},
+    }
+
+# Guarda el estado de una intención de pago (respuesta de check_payment_status).
+# Un estado final nunca se sustituye por uno intermedio: los webhooks pueden
+# llegar desordenados y una consulta lenta puede terminar después del webhook
+def guardar_estado_pago(db: Session, id_intencion: str, estado: dict):
+    fila = db.get(models.EstadoPago, id_intencion)
+    if fila is None:
+        fila = models.EstadoPago(id_intencion_pago=id_intencion)
+        db.add(fila)
+    elif fila.estado in ESTADOS_FINALES and estado["status"] not in ESTADOS_FINALES:
+        return
+    fila.estado = estado["status"]
+    fila.importe = estado["amount"]
+    fila.moneda = estado["currency"]
+    fila.metadatos = json.dumps(estado.get("metadata") or {})
+    fila.actualizado_en = datetime.utcnow()
+
+# Manejador de los webhooks payment_intent.*: el objeto del evento es la intención completa
+def actualizar_desde_webhook(db: Session, intencion) -> list:
+    guardar_estado_pago(db, intencion["id"], {
+        "status": intencion["status"],
+        "amount": intencion["amount"] / 100,
+        "currency": intencion["currency"],
+        "metadata": intencion.get("metadata"),
+    })
+    return []
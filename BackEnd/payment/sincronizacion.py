@@ -0,0 +1,279 @@
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, aliased
+
+import models
+from database import SessionLocal
+from cache import invalidar_productos
+from payment.cliente_stripe import cliente
+from payment.stripe_utils import llamar_stripe
+
+# Cada cuántos segundos revisa el worker la cola de sincronización
+SINCRONIZACION_INTERVALO = float(os.getenv("SINCRONIZACION_INTERVALO", "2"))
+# Trabajos que reclama el worker de cada vez
+LOTE_SINCRONIZACIONES = 20
+# Tiempo que el worker retiene un trabajo; si se cae, se retoma al vencer
+DURACION_BLOQUEO = timedelta(minutes=5)
+# Reintentos con espera exponencial: 10s, 20s, 40s... hasta 1 hora
+MAX_INTENTOS = int(os.getenv("SINCRONIZACION_MAX_INTENTOS", "10"))
+RETRASO_BASE = 10
+RETRASO_MAX = 60 * 60
+
+PENDIENTES = ("pendiente", "procesando")
+
+# Añade un trabajo a la cola en la transacción de `db` (no hace commit): el
+# cambio del producto y su sincronización se confirman o se deshacen juntos.
+# Un cambio sobre un trabajo aún no reclamado se funde con él, ya que el worker
+# sincroniza el estado del producto en el momento de procesarlo. La fusión es
+# un UPDATE condicional y no una consulta previa: bloquea la fila, así que el
+# worker no puede reclamar el trabajo hasta que este cambio se confirme, y si
+# el worker lo reclamó antes ya no coincide y se encola uno nuevo
+def encolar_sincronizacion(db: Session, db_producto: models.Producto, operacion: str = "sincronizar"):
+    if operacion == "sincronizar":
+        db_producto.estado_sync = "pendiente"
+        db_producto.version_sync = models.Producto.version_sync + 1
+        fusionado = db.execute(
+            update(models.SincronizacionStripe)
+            .where(
+                models.SincronizacionStripe.id_producto == db_producto.id_producto,
+                models.SincronizacionStripe.operacion == "sincronizar",
+                models.SincronizacionStripe.estado == "pendiente",
+                models.SincronizacionStripe.intentos == 0,
+            )
+            .values(proximo_intento=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if fusionado:
+            return
+    db.add(models.SincronizacionStripe(
+        id_producto=db_producto.id_producto,
+        operacion=operacion,
+        id_producto_stripe=db_producto.id_producto_stripe,
+    ))
+
+# Reclama un lote de trabajos pendientes (o con el bloqueo vencido). Un trabajo
+# solo se reclama si no queda otro anterior sin terminar del mismo producto,
+# así los cambios de un producto llegan a Stripe en orden
+def _reclamar_trabajos(db: Session) -> list:
+    ahora = datetime.utcnow()
+    anterior = aliased(models.SincronizacionStripe)
+    reclamable = (
+        models.SincronizacionStripe.estado.in_(PENDIENTES),
+        models.SincronizacionStripe.proximo_intento <= ahora,
+    )
+    ids = db.execute(
+        select(models.SincronizacionStripe.id_sincronizacion)
+        .where(*reclamable)
+        .where(~select(anterior.id_sincronizacion).where(
+            anterior.id_producto == models.SincronizacionStripe.id_producto,
+            anterior.id_sincronizacion < models.SincronizacionStripe.id_sincronizacion,
+            anterior.estado.in_(PENDIENTES),
+        ).exists())
+        .order_by(models.SincronizacionStripe.id_sincronizacion)
+        .limit(LOTE_SINCRONIZACIONES)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not ids:
+        db.rollback()
+        return []
+    reclamados = db.execute(
+        update(models.SincronizacionStripe)
+        .where(models.SincronizacionStripe.id_sincronizacion.in_(ids), *reclamable)
+        .values(
+            estado="procesando",
+            intentos=models.SincronizacionStripe.intentos + 1,
+            proximo_intento=ahora + DURACION_BLOQUEO,
+        )
+        .returning(
+            models.SincronizacionStripe.id_sincronizacion,
+            models.SincronizacionStripe.id_producto,
+            models.SincronizacionStripe.operacion,
+            models.SincronizacionStripe.id_producto_stripe,
+            models.SincronizacionStripe.intentos,
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return sorted(reclamados, key=lambda t: t.id_sincronizacion)
+
+def _retraso_reintento(intentos: int) -> timedelta:
+    segundos = min(RETRASO_BASE * 2 ** (intentos - 1), RETRASO_MAX)
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+# Lleva a Stripe el estado actual del producto: lo crea con su precio si aún no
+# existe; si existe, actualiza sus datos y, si cambió el importe, crea un precio
+# nuevo como precio por defecto y archiva el anterior (los precios de Stripe no
+# se pueden modificar). Las claves de idempotencia van ligadas al trabajo, de
+# modo que un reintento tras un fallo de red no duplica productos ni precios.
+# Los ids de Stripe se guardan con un UPDATE y no a través del objeto: si el
+# producto se borra mientras tanto no hay nada que actualizar, pero el id queda
+# anotado en el trabajo para que el de archivar lo encuentre
+def _sincronizar(db: Session, trabajo):
+    db_producto = db.query(models.Producto).filter(models.Producto.id_producto == trabajo.id_producto).first()
+    if db_producto is None:
+        # Borrado antes de sincronizarse: de eso se encarga su trabajo de archivar
+        return
+    imagenes = [db_producto.imagen_url] if db_producto.imagen_url else []
+    centimos = int(round(db_producto.precio * 100))
+    id_producto_stripe = db_producto.id_producto_stripe
+    id_precio_stripe = db_producto.id_precio_stripe
+
+    if not id_producto_stripe:
+        producto_stripe = llamar_stripe(
+            "Error al crear el producto en Stripe",
+            cliente.crear_producto, db_producto.nombre, db_producto.descripción, imagenes,
+            precio_centimos=centimos,
+            clave_idempotencia=f"producto-{db_producto.id_producto}-{trabajo.id_sincronizacion}",
+        )
+        _guardar_ids_stripe(db, trabajo, producto_stripe.id, producto_stripe.default_price)
+        return
+
+    precio_anterior = None
+    if id_precio_stripe:
+        precio_stripe = llamar_stripe(
+            "Error al consultar el precio en Stripe", cliente.obtener_precio, id_precio_stripe
+        )
+        if precio_stripe.unit_amount != centimos:
+            precio_anterior = id_precio_stripe
+    if precio_anterior or not id_precio_stripe:
+        nuevo_precio = llamar_stripe(
+            "Error al crear el precio en Stripe",
+            cliente.crear_precio, id_producto_stripe, centimos,
+            clave_idempotencia=f"precio-{db_producto.id_producto}-{trabajo.id_sincronizacion}",
+        )
+        id_precio_stripe = nuevo_precio.id
+
+    llamar_stripe(
+        "Error al actualizar el producto en Stripe",
+        cliente.actualizar_producto, id_producto_stripe, db_producto.nombre,
+        db_producto.descripción, imagenes, precio_por_defecto=id_precio_stripe,
+    )
+    if precio_anterior:
+        llamar_stripe("Error al archivar el precio en Stripe", cliente.archivar_precio, precio_anterior)
+    _guardar_ids_stripe(db, trabajo, id_producto_stripe, id_precio_stripe)
+
+def _guardar_ids_stripe(db: Session, trabajo, id_producto_stripe: str, id_precio_stripe: str):
+    db.execute(
+        update(models.Producto)
+        .where(models.Producto.id_producto == trabajo.id_producto)
+        .values(id_producto_stripe=id_producto_stripe, id_precio_stripe=id_precio_stripe)
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        update(models.SincronizacionStripe)
+        .where(models.SincronizacionStripe.id_sincronizacion == trabajo.id_sincronizacion)
+        .values(id_producto_stripe=id_producto_stripe)
+        .execution_options(synchronize_session=False)
+    )
+
+# El id de Stripe se busca al ejecutar y no al encolar: si el producto se borró
+# mientras se creaba en Stripe, el trabajo se encoló sin él y solo lo tiene el
+# trabajo de sincronizar anterior, que ya terminó por el orden de la cola
+def _archivar(db: Session, trabajo):
+    id_producto_stripe = trabajo.id_producto_stripe or db.query(
+        models.SincronizacionStripe.id_producto_stripe
+    ).filter(
+        models.SincronizacionStripe.id_producto == trabajo.id_producto,
+        models.SincronizacionStripe.id_sincronizacion < trabajo.id_sincronizacion,
+        models.SincronizacionStripe.id_producto_stripe.isnot(None),
+    ).order_by(models.SincronizacionStripe.id_sincronizacion.desc()).limit(1).scalar()
+    if id_producto_stripe:
+        llamar_stripe(
+            "Error al archivar el producto en Stripe", cliente.archivar_producto, id_producto_stripe
+        )
+
+OPERACIONES = {
+    "sincronizar": _sincronizar,
+    "archivar": _archivar,
+}
+
+# Con `version`, solo si el producto no ha cambiado desde que se leyó
+def _cambiar_estado_producto(db: Session, id_producto: int, estado_sync: str, version: int = None):
+    consulta = update(models.Producto).where(models.Producto.id_producto == id_producto)
+    if version is not None:
+        consulta = consulta.where(models.Producto.version_sync == version)
+    db.execute(consulta.values(estado_sync=estado_sync).execution_options(synchronize_session=False))
+
+# Procesa un trabajo en su propia transacción. El producto queda "sincronizado"
+# solo si no le quedan más cambios en cola ni ha cambiado mientras se
+# sincronizaba (la versión se lee antes que sus datos); si se agotan los
+# intentos, "error"
+def _procesar_trabajo(db: Session, trabajo) -> bool:
+    try:
+        version = db.query(models.Producto.version_sync).filter(
+            models.Producto.id_producto == trabajo.id_producto
+        ).scalar()
+        OPERACIONES[trabajo.operacion](db, trabajo)
+        db.execute(
+            update(models.SincronizacionStripe)
+            .where(models.SincronizacionStripe.id_sincronizacion == trabajo.id_sincronizacion)
+            .values(estado="completada", error=None)
+            .execution_options(synchronize_session=False)
+        )
+        otros = db.query(models.SincronizacionStripe.id_sincronizacion).filter(
+            models.SincronizacionStripe.id_producto == trabajo.id_producto,
+            models.SincronizacionStripe.id_sincronizacion != trabajo.id_sincronizacion,
+            models.SincronizacionStripe.estado.in_(PENDIENTES),
+        ).first()
+        if trabajo.operacion == "sincronizar" and otros is None:
+            _cambiar_estado_producto(db, trabajo.id_producto, "sincronizado", version)
+        db.commit()
+        invalidar_productos([trabajo.id_producto])
+        return True
+    except Exception as e:
+        db.rollback()
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        agotado = trabajo.intentos >= MAX_INTENTOS
+        logging.error(
+            f"Error sincronizando el producto {trabajo.id_producto} con Stripe "
+            f"({trabajo.operacion}), intento {trabajo.intentos}: {error}"
+        )
+        db.execute(
+            update(models.SincronizacionStripe)
+            .where(models.SincronizacionStripe.id_sincronizacion == trabajo.id_sincronizacion)
+            .values(
+                estado="fallida" if agotado else "pendiente",
+                error=error,
+                proximo_intento=datetime.utcnow() + _retraso_reintento(trabajo.intentos),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if agotado and trabajo.operacion == "sincronizar":
+            _cambiar_estado_producto(db, trabajo.id_producto, "error")
+        db.commit()
+        if agotado:
+            invalidar_productos([trabajo.id_producto])
+        return False
+
+# Tarea del worker: vacía la cola lote a lote
+def procesar_sincronizaciones_pendientes() -> int:
+    procesados = 0
+    db = SessionLocal()
+    try:
+        while True:
+            trabajos = _reclamar_trabajos(db)
+            if not trabajos:
+                break
+            for trabajo in trabajos:
+                procesados += _procesar_trabajo(db, trabajo)
+    finally:
+        db.close()
+    return procesados
+
+# Tarea de fondo para iniciar_tareas. Un solo worker por proceso basta: los
+# cambios de catálogo son pocos y así se respeta el orden por producto
+def tareas_sincronizacion() -> list:
+    return [("sincronizacion_stripe", procesar_sincronizaciones_pendientes, SINCRONIZACION_INTERVALO)]
+
+# Trabajos de la cola por estado
+def estado_cola(db: Session) -> dict:
+    return dict(
+        db.query(models.SincronizacionStripe.estado, func.count(models.SincronizacionStripe.id_sincronizacion))
+        .group_by(models.SincronizacionStripe.estado)
+        .all()
+    )
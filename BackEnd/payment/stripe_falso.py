@@ -0,0 +1,153 @@
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+import stripe
+
+from payment.cliente_stripe import _ClienteBase
+
+# Latencia simulada de cada llamada, para que las pruebas de carga se parezcan a la API real
+LATENCIA_FALSA_MS = float(os.getenv("STRIPE_FAKE_LATENCIA_MS", "0"))
+# Proporción de llamadas que fallan con un error de conexión, para probar el cortacircuitos
+TASA_ERROR_FALSA = float(os.getenv("STRIPE_FAKE_TASA_ERROR", "0"))
+
+# Adaptador en memoria con la misma interfaz que ClienteStripe. Permite recorrer
+# todo el flujo de pago (alta de productos, checkout y webhooks) sin red ni claves
+class ClienteStripeFalso(_ClienteBase):
+    def __init__(self, latencia_ms: float = LATENCIA_FALSA_MS, tasa_error: float = TASA_ERROR_FALSA):
+        super().__init__()
+        self._latencia = latencia_ms / 1000
+        self.tasa_error = tasa_error
+        self._contador = itertools.count(1)
+        self._cerrojo = threading.Lock()
+        self.productos = {}
+        self.precios = {}
+        self.intenciones = {}
+        self.sesiones = {}
+        self._idempotencia = {}
+
+    def _simular_red(self):
+        if self._latencia:
+            time.sleep(self._latencia)
+        if self.tasa_error and random.random() < self.tasa_error:
+            raise stripe.APIConnectionError("Error de conexión simulado")
+
+    def _nuevo(self, prefijo: str, coleccion: dict, datos: dict):
+        self._simular_red()
+        with self._cerrojo:
+            datos["id"] = f"{prefijo}_falso_{next(self._contador)}"
+            objeto = stripe.StripeObject.construct_from(datos, "sk_falso")
+            coleccion[datos["id"]] = objeto
+        return objeto
+
+    # Igual que Stripe, la misma clave de idempotencia devuelve el objeto ya creado
+    def _idempotente(self, clave: str, crear):
+        if clave is None:
+            return crear()
+        with self._cerrojo:
+            if clave in self._idempotencia:
+                return self._idempotencia[clave]
+        objeto = crear()
+        with self._cerrojo:
+            return self._idempotencia.setdefault(clave, objeto)
+
+    def _buscar(self, coleccion: dict, id_objeto: str, tipo: str):
+        self._simular_red()
+        try:
+            return coleccion[id_objeto]
+        except KeyError:
+            raise stripe.InvalidRequestError(f"No such {tipo}: '{id_objeto}'", "id")
+
+    def crear_producto(self, nombre: str, descripcion: str = None, imagenes: list = None,
+                       precio_centimos: int = None, moneda: str = "eur", clave_idempotencia: str = None):
+        def crear():
+            producto = self._nuevo("prod", self.productos, {
+                "object": "product", "name": nombre, "description": descripcion,
+                "images": imagenes or [], "default_price": None, "active": True,
+            })
+            if precio_centimos is not None:
+                producto["default_price"] = self.crear_precio(producto.id, precio_centimos, moneda).id
+            return producto
+        return self._idempotente(clave_idempotencia, crear)
+
+    def crear_precio(self, id_producto: str, precio_centimos: int, moneda: str = "eur", clave_idempotencia: str = None):
+        return self._idempotente(clave_idempotencia, lambda: self._nuevo("price", self.precios, {
+            "object": "price", "product": id_producto, "unit_amount": precio_centimos,
+            "currency": moneda, "active": True,
+        }))
+
+    def actualizar_producto(self, id_producto: str, nombre: str, descripcion: str = None,
+                            imagenes: list = None, precio_por_defecto: str = None):
+        producto = self._buscar(self.productos, id_producto, "product")
+        producto.update({"name": nombre, "description": descripcion, "images": imagenes or []})
+        if precio_por_defecto:
+            producto["default_price"] = precio_por_defecto
+        return producto
+
+    def obtener_precio(self, id_precio: str):
+        return self._buscar(self.precios, id_precio, "price")
+
+    def archivar_precio(self, id_precio: str):
+        precio = self._buscar(self.precios, id_precio, "price")
+        precio["active"] = False
+        return precio
+
+    def archivar_producto(self, id_producto: str):
+        producto = self._buscar(self.productos, id_producto, "product")
+        producto["active"] = False
+        return producto
+
+    def crear_intencion_pago(self, importe_centimos: int, moneda: str = "eur", metadatos=None):
+        intencion = self._nuevo("pi", self.intenciones, {
+            "object": "payment_intent", "amount": importe_centimos, "currency": moneda,
+            "metadata": metadatos or {}, "status": "requires_payment_method",
+        })
+        intencion["client_secret"] = f"{intencion.id}_secret_falso"
+        return intencion
+
+    def obtener_intencion_pago(self, id_intencion: str):
+        return self._buscar(self.intenciones, id_intencion, "payment_intent")
+
+    def crear_sesion_checkout(self, items_linea, url_exito, url_cancelacion, metadatos=None, expira_en: int = None):
+        # Igual que Stripe, la sesión tiene que caducar entre 30 minutos y 24 horas después de crearse
+        if expira_en is not None and not 30 * 60 <= expira_en - time.time() <= 24 * 60 * 60:
+            raise stripe.InvalidRequestError(
+                "The `expires_at` timestamp must be between 30 minutes and 24 hours from Checkout Session creation.",
+                "expires_at",
+            )
+        total = sum(
+            (item["price_data"]["unit_amount"] if "price_data" in item else self.precios[item["price"]].unit_amount)
+            * item["quantity"]
+            for item in items_linea if "price_data" in item or item["price"] in self.precios
+        )
+        sesion = self._nuevo("cs", self.sesiones, {
+            "object": "checkout.session", "mode": "payment", "status": "open",
+            "payment_status": "unpaid", "amount_total": total, "line_items": items_linea,
+            "success_url": url_exito, "cancel_url": url_cancelacion,
+            "metadata": {k: str(v) for k, v in (metadatos or {}).items()}, "expires_at": expira_en,
+        })
+        sesion["url"] = f"{url_exito}?session_id={sesion.id}"
+        return sesion
+
+    # Los eventos de prueba no van firmados: el cuerpo es directamente el JSON del evento
+    def construir_evento(self, payload, firma, secreto):
+        return stripe.Event.construct_from(json.loads(payload), "sk_falso")
+
+    # Marca una sesión como pagada (o caducada) y devuelve el cuerpo del webhook
+    # que enviaría Stripe, listo para hacer POST a /webhook. Desde fuera del
+    # proceso se usa con las rutas de routers/stripe_falso.py
+    def evento_sesion(self, id_sesion: str, tipo: str = "checkout.session.completed") -> bytes:
+        with self._cerrojo:
+            sesion = self.sesiones[id_sesion]
+            if tipo == "checkout.session.completed":
+                sesion["status"], sesion["payment_status"] = "complete", "paid"
+            elif tipo == "checkout.session.expired":
+                sesion["status"] = "expired"
+            id_evento = f"evt_falso_{next(self._contador)}"
+        return json.dumps({
+            "id": id_evento, "object": "event", "type": tipo,
+            "data": {"object": json.loads(str(sesion))},
+        }).encode()
@@ -1,72 +1,95 @@
+import math
 import stripe
 import os
+from datetime import timezone
 from dotenv import load_dotenv
 from fastapi import HTTPException, status
 
+# Todas las llamadas pasan por el cliente con conexiones persistentes (o por el falso con STRIPE_FAKE=1)
+from payment.cliente_stripe import cliente
+from payment.circuito import Circuito, CircuitoAbierto
+
 load_dotenv()
 
 # Configuración de Stripe
-stripe.api_key = os.getenv("STRIPE_API_KEY")
 webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
 
-# Crear una intención de pago
-def create_payment_intent(amount: float, currency: str = "eur", metadata=None):
+# Cortacircuitos compartido por todas las llamadas a Stripe de este proceso
+circuito_stripe = Circuito("stripe")
+
+# Errores que indican que Stripe no está disponible (red, plazo agotado, 429 o 5xx),
+# a diferencia de los errores de la propia petición (datos inválidos, tarjeta rechazada...)
+def _es_error_transitorio(error: Exception) -> bool:
+    if isinstance(error, (stripe.APIConnectionError, stripe.RateLimitError)):
+        return True
+    return isinstance(error, stripe.StripeError) and (error.http_status or 0) >= 500
+
+def _servicio_no_disponible(reintentar_en: int):
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="El servicio de pagos no está disponible en este momento, inténtalo de nuevo en unos segundos",
+        headers={"Retry-After": str(reintentar_en)},
+    )
+
+# Falla rápido antes de empezar un flujo que acabará llamando a Stripe
+def comprobar_stripe_disponible():
+    if circuito_stripe.abierto():
+        raise _servicio_no_disponible(circuito_stripe.reintentar_en())
+
+# Ejecuta una llamada a Stripe a través del cortacircuitos.
+# Con el circuito abierto se responde 503 al instante sin ocupar la conexión;
+# los errores transitorios también dan 503 con Retry-After y cuentan como fallo;
+# el resto de errores son de la petición y se devuelven como 400 con `mensaje_error`
+def llamar_stripe(mensaje_error: str, funcion, *args, **kwargs):
     try:
-        # Convertir a centavos para Stripe
-        amount_cents = int(amount * 100)
-        
-        intent = stripe.PaymentIntent.create(
-            amount=amount_cents,
-            currency=currency,
-            metadata=metadata,
-            automatic_payment_methods={"enabled": True},
-        )
-        return {
-            "client_secret": intent.client_secret,
-            "payment_intent_id": intent.id
-        }
+        circuito_stripe.permitir()
+    except CircuitoAbierto as e:
+        raise _servicio_no_disponible(math.ceil(e.reintentar_en))
+    try:
+        resultado = funcion(*args, **kwargs)
     except Exception as e:
+        if _es_error_transitorio(e):
+            circuito_stripe.registrar_fallo()
+            raise _servicio_no_disponible(circuito_stripe.reintentar_en())
+        circuito_stripe.registrar_exito()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error al crear la intención de pago: {str(e)}"
+            detail=f"{mensaje_error}: {str(e)}"
         )
+    circuito_stripe.registrar_exito()
+    return resultado
+
+# Crear una intención de pago
+def create_payment_intent(amount: float, currency: str = "eur", metadata=None):
+    # Convertir a centavos para Stripe
+    amount_cents = int(amount * 100)
+    
+    intent = llamar_stripe(
+        "Error al crear la intención de pago",
+        cliente.crear_intencion_pago, amount_cents, currency, metadata
+    )
+    return {
+        "client_secret": intent.client_secret,
+        "payment_intent_id": intent.id
+    }
 
 # Verificar el estado de un pago
 def check_payment_status(payment_intent_id: str):
-    try:
-        intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-        return {
-            "status": intent.status,
-            "amount": intent.amount / 100,  # Convertir de centavos a la moneda base
-            "currency": intent.currency,
-            "metadata": intent.metadata
-        }
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error al verificar el estado del pago: {str(e)}"
-        )
+    intent = llamar_stripe(
+        "Error al verificar el estado del pago",
+        cliente.obtener_intencion_pago, payment_intent_id
+    )
+    return {
+        "status": intent.status,
+        "amount": intent.amount / 100,  # Convertir de centavos a la moneda base
+        "currency": intent.currency,
+        "metadata": intent.metadata
+    }
 
-# Procesar un webhook de Stripe
-def process_webhook(payload, sig_header):
+# Verificar la firma de un webhook de Stripe y devolver el evento
+def verificar_evento_webhook(payload, sig_header):
     try:
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, webhook_secret
-        )
-        
-        # Manejar diferentes tipos de eventos
-        if event.type == 'payment_intent.succeeded':
-            payment_intent = event.data.object
-            # Aquí puedes actualizar el estado de la compra en tu base de datos
-            return {"status": "success", "payment_intent_id": payment_intent.id}
-        
-        elif event.type == 'payment_intent.payment_failed':
-            payment_intent = event.data.object
-            # Aquí puedes manejar el fallo del pago
-            return {"status": "failed", "payment_intent_id": payment_intent.id}
-        
-        return {"status": "received", "type": event.type}
-    
+        return cliente.construir_evento(payload, sig_header, webhook_secret)
     except stripe.error.SignatureVerificationError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -78,56 +101,17 @@ def process_webhook(payload, sig_header):
             detail=f"Error al procesar el webhook: {str(e)}"
         )
 
-
 # Renombrar funciones
 
-# Crear un producto en Stripe
-def crear_producto_stripe(nombre: str, descripcion: str = None, imagenes: list = None):
-    try:
-        producto = stripe.Product.create(
-            name=nombre,
-            description=descripcion,
-            images=imagenes if imagenes else []
-        )
-        return producto
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error al crear el producto en Stripe: {str(e)}"
-        )
-
-# Crear un precio para un producto en Stripe
-def crear_precio_stripe(id_producto: str, precio_unitario: float, moneda: str = "eur"):
-    try:
-        # Convertir a centavos para Stripe
-        precio_centavos = int(precio_unitario * 100)
-        
-        precio = stripe.Price.create(
-            product=id_producto,
-            unit_amount=precio_centavos,
-            currency=moneda,
-        )
-        return precio
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error al crear el precio en Stripe: {str(e)}"
-        )
-
 # Crear un checkout session para pago
-def crear_sesion_pago(items_linea, url_exito, url_cancelacion, metadatos=None):
-    try:
-        sesion_pago = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=items_linea,
-            mode="payment",
-            success_url=url_exito,
-            cancel_url=url_cancelacion,
-            metadata=metadatos
-        )
-        return sesion_pago
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error al crear la sesión de checkout: {str(e)}"
-        )
\ No newline at end of file
+def crear_sesion_pago(items_linea, url_exito, url_cancelacion, metadatos=None, expira_en=None):
+    return llamar_stripe(
+        "Error al crear la sesión de checkout",
+        cliente.crear_sesion_checkout,
+        items_linea,
+        url_exito,
+        url_cancelacion,
+        metadatos=metadatos,
+        # La sesión caduca a la vez que la reserva de stock asociada
+        expira_en=int(expira_en.replace(tzinfo=timezone.utc).timestamp()) if expira_en else None
+    )
\ No newline at end of file
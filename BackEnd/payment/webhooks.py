@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+from cache import invalidar_productos
+from inventario import agrupar_lineas, descontar_stock
+from reservas import convertir_reservas, liberar_reservas
+from analitica import encolar_ventas
+from payment.estados_pago import actualizar_desde_webhook
+
+# Número de workers que procesan la bandeja y cada cuántos segundos la revisan
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+WEBHOOK_INTERVALO = float(os.getenv("WEBHOOK_INTERVALO", "1"))
+# Eventos que reclama un worker de cada vez
+LOTE_EVENTOS = 10
+# Tiempo que un worker retiene un evento; si se cae, otro lo retoma al vencer
+DURACION_BLOQUEO = timedelta(minutes=5)
+# Reintentos con espera exponencial: 5s, 10s, 20s... hasta 1 hora
+MAX_INTENTOS = int(os.getenv("WEBHOOK_MAX_INTENTOS", "8"))
+RETRASO_BASE = 5
+RETRASO_MAX = 60 * 60
+
+# Guarda un evento verificado en la bandeja. Devuelve False si ya se había
+# recibido (Stripe reenvía los eventos hasta recibir un 2xx)
+async def guardar_evento(db: AsyncSession, evento) -> bool:
+    db.add(models.EventoWebhook(
+        id_evento_stripe=evento["id"],
+        tipo=evento["type"],
+        payload=json.dumps(evento),
+    ))
+    try:
+        await db.commit()
+        return True
+    except IntegrityError:
+        await db.rollback()
+        return False
+
+# Finaliza la compra pendiente creada en /crear-sesion-pago (su id viaja en los
+# metadatos de la sesión). El UPDATE condicional hace la operación idempotente:
+# si la compra ya está pagada no se vuelve a tocar el stock ni las ventas.
+def finalizar_compra_stripe(db: Session, session) -> list:
+    id_compra = session["metadata"].get("id_compra")
+    if not id_compra:
+        logging.error(f"La sesión {session['id']} no tiene id_compra en los metadatos")
+        return []
+    id_compra = int(id_compra)
+
+    db_compra = db.execute(
+        update(models.Compra)
+        .where(models.Compra.id_compra == id_compra)
+        .where(models.Compra.estado != "pagada")
+        .values(estado="pagada")
+        .returning(models.Compra.total)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if db_compra is None:
+        logging.info(f"La compra {id_compra} ya estaba pagada o no existe")
+        return []
+    if session.get("amount_total") is not None and round(session["amount_total"] / 100, 2) != round(db_compra.total, 2):
+        logging.warning(f"El importe cobrado en la sesión {session['id']} no coincide con el total de la compra {id_compra}")
+
+    # El stock de las reservas activas ya está descontado; las líneas cuya reserva
+    # caducó se descuentan ahora. El pago ya está hecho, así que las que no tengan
+    # stock suficiente solo se registran
+    lineas = db.query(models.DetalleCompra.id_producto, models.DetalleCompra.cantidad).filter(
+        models.DetalleCompra.id_compra == id_compra
+    ).all()
+    pendientes = agrupar_lineas(lineas)
+    for id_producto, cantidad in convertir_reservas(db, id_compra):
+        pendientes[id_producto] -= cantidad
+    for fallo in descontar_stock(db, [(i, c) for i, c in pendientes.items() if c > 0]):
+        logging.error(f"No se pudo descontar stock en la compra {id_compra}: {fallo}")
+
+    encolar_ventas(db, [id_compra])
+    return list(pendientes)
+
+def _sesion_completada(db: Session, session) -> list:
+    # Con métodos de pago asíncronos el cobro se confirma después, en async_payment_succeeded
+    if session.get("payment_status", "paid") == "unpaid":
+        return []
+    return finalizar_compra_stripe(db, session)
+
+def _sesion_no_pagada(db: Session, session) -> list:
+    # La sesión no se pagó: devuelve el stock reservado sin esperar al barrido
+    id_compra_pendiente = session["metadata"].get("id_compra")
+    if not id_compra_pendiente:
+        return []
+    return [r.id_producto for r in liberar_reservas(db, int(id_compra_pendiente))]
+
+# Manejador de cada tipo de evento; devuelven los productos cuyo stock cambió.
+# Los tipos sin manejador se marcan como procesados sin hacer nada
+MANEJADORES = {
+    "checkout.session.completed": _sesion_completada,
+    "checkout.session.async_payment_succeeded": finalizar_compra_stripe,
+    "checkout.session.expired": _sesion_no_pagada,
+    "checkout.session.async_payment_failed": _sesion_no_pagada,
+    "payment_intent.succeeded": actualizar_desde_webhook,
+    "payment_intent.payment_failed": actualizar_desde_webhook,
+    "payment_intent.processing": actualizar_desde_webhook,
+    "payment_intent.requires_action": actualizar_desde_webhook,
+    "payment_intent.canceled": actualizar_desde_webhook,
+}
+
+# Reclama un lote de eventos pendientes (o con el bloqueo vencido).
+# El UPDATE condicional garantiza que dos workers no reclamen el mismo evento;
+# en PostgreSQL, además, SKIP LOCKED evita que se esperen entre ellos.
+def _reclamar_eventos(db: Session) -> list:
+    ahora = datetime.utcnow()
+    reclamable = (
+        models.EventoWebhook.estado.in_(("pendiente", "procesando")),
+        models.EventoWebhook.proximo_intento <= ahora,
+    )
+    ids = db.execute(
+        select(models.EventoWebhook.id_evento)
+        .where(*reclamable)
+        .order_by(models.EventoWebhook.proximo_intento)
+        .limit(LOTE_EVENTOS)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not ids:
+        db.rollback()
+        return []
+    reclamados = db.execute(
+        update(models.EventoWebhook)
+        .where(models.EventoWebhook.id_evento.in_(ids), *reclamable)
+        .values(
+            estado="procesando",
+            intentos=models.EventoWebhook.intentos + 1,
+            proximo_intento=ahora + DURACION_BLOQUEO,
+        )
+        .returning(
+            models.EventoWebhook.id_evento,
+            models.EventoWebhook.id_evento_stripe,
+            models.EventoWebhook.tipo,
+            models.EventoWebhook.payload,
+            models.EventoWebhook.intentos,
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return reclamados
+
+def _retraso_reintento(intentos: int) -> timedelta:
+    segundos = min(RETRASO_BASE * 2 ** (intentos - 1), RETRASO_MAX)
+    # Un poco de aleatoriedad para que los reintentos de una ráfaga no coincidan
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+def _marcar_procesado(db: Session, id_evento: int):
+    db.execute(
+        update(models.EventoWebhook)
+        .where(models.EventoWebhook.id_evento == id_evento)
+        .values(estado="procesado", error=None, procesado_en=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+# Procesa un evento en su propia transacción: la entrada en el registro de
+# eventos procesados, sus efectos y el cambio de estado se confirman juntos.
+# Si falla, se deshace todo y se programa el reintento
+def _procesar_evento(db: Session, evento) -> bool:
+    manejador = MANEJADORES.get(evento.tipo)
+    try:
+        try:
+            db.execute(insert(models.EventoProcesado).values(
+                id_evento_stripe=evento.id_evento_stripe, tipo=evento.tipo
+            ))
+        except IntegrityError:
+            # Otro worker ya lo aplicó (por ejemplo, tras vencer el bloqueo)
+            db.rollback()
+            _marcar_procesado(db, evento.id_evento)
+            db.commit()
+            return True
+        productos = manejador(db, json.loads(evento.payload)["data"]["object"]) if manejador else []
+        _marcar_procesado(db, evento.id_evento)
+        db.commit()
+        invalidar_productos(productos)
+        return True
+    except Exception as e:
+        db.rollback()
+        agotado = evento.intentos >= MAX_INTENTOS
+        logging.error(f"Error procesando el evento {evento.id_evento} ({evento.tipo}), intento {evento.intentos}: {e}")
+        db.execute(
+            update(models.EventoWebhook)
+            .where(models.EventoWebhook.id_evento == evento.id_evento)
+            .values(
+                estado="fallido" if agotado else "pendiente",
+                error=str(e),
+                proximo_intento=datetime.utcnow() + _retraso_reintento(evento.intentos),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return False
+
+# Tarea de cada worker: vacía la bandeja lote a lote
+def procesar_eventos_pendientes() -> int:
+    procesados = 0
+    db = SessionLocal()
+    try:
+        while True:
+            eventos = _reclamar_eventos(db)
+            if not eventos:
+                break
+            for evento in eventos:
+                procesados += _procesar_evento(db, evento)
+    finally:
+        db.close()
+    return procesados
+
+# Tareas de fondo del pool de workers, para iniciar_tareas
+def tareas_webhooks() -> list:
+    return [
+        (f"webhooks_{i}", procesar_eventos_pendientes, WEBHOOK_INTERVALO)
+        for i in range(WEBHOOK_WORKERS)
+    ]
+
+# Eventos de la bandeja por estado
+def estado_bandeja(db: Session) -> dict:
+    return dict(
+        db.query(models.EventoWebhook.estado, func.count(models.EventoWebhook.id_evento))
+        .group_by(models.EventoWebhook.estado)
+        .all()
+    )
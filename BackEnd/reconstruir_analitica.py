@@ -0,0 +1,29 @@
+import argparse
+from datetime import date
+
+from database import SessionLocal, engine, Base, crear_indices_pendientes
+from analitica import reconstruir_ventas
+
+# Recalcula los resúmenes de ventas a partir de las compras registradas.
+# Sin fechas se reconstruye todo el historial:
+#   python reconstruir_analitica.py --desde 2025-01-01 --hasta 2025-01-31
+def reconstruir_analitica(desde=None, hasta=None):
+    Base.metadata.create_all(bind=engine)
+    crear_indices_pendientes(engine)
+    db = SessionLocal()
+    try:
+        reconstruir_ventas(db, desde, hasta)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    print("Resúmenes de ventas reconstruidos correctamente.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruye los resúmenes de ventas")
+    parser.add_argument("--desde", type=date.fromisoformat, default=None)
+    parser.add_argument("--hasta", type=date.fromisoformat, default=None)
+    args = parser.parse_args()
+    reconstruir_analitica(args.desde, args.hasta)
@@ -0,0 +1,123 @@
+import logging
+import math
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+from inventario import descontar_stock, reponer_stock
+from cache import invalidar_productos
+
+# Segundos que la sesión de Stripe dura por encima del TTL de la reserva
+HOLGURA_SESION = 60
+
+# Stripe exige que una sesión de checkout caduque entre 30 minutos y 24 horas
+# después de crearse: el TTL se acota para que también quepa la holgura
+def acotar_ttl(minutos: int) -> int:
+    return min(max(minutos, 30), 24 * 60 - math.ceil(HOLGURA_SESION / 60))
+
+# Duración de la reserva
+RESERVA_TTL_MINUTOS = acotar_ttl(int(os.getenv("RESERVA_TTL_MINUTOS", "30")))
+# Margen para que la reserva no caduque antes que la sesión de Stripe
+MARGEN_RESERVA = timedelta(minutes=5)
+# Reservas caducadas que se procesan por iteración del barrido
+LOTE_BARRIDO = 500
+
+# Momento en que debe caducar la sesión de pago asociada a una reserva creada ahora
+def expiracion_sesion() -> datetime:
+    return datetime.utcnow() + timedelta(minutes=RESERVA_TTL_MINUTOS, seconds=HOLGURA_SESION)
+
+# Retiene el stock de una compra pendiente: las unidades se descuentan ya de
+# `productos.cantidad` (así el stock disponible es siempre una lectura directa)
+# y se devuelven si la reserva caduca sin pago.
+# Devuelve las líneas que no se pudieron reservar; en ese caso hay que hacer rollback.
+def reservar_stock(db: Session, id_compra: int, lineas) -> list:
+    fallos = descontar_stock(db, lineas)
+    if fallos:
+        return fallos
+    expira_en = expiracion_sesion() + MARGEN_RESERVA
+    db.execute(insert(models.ReservaStock), [
+        {"id_compra": id_compra, "id_producto": id_producto, "cantidad": cantidad, "expira_en": expira_en}
+        for id_producto, cantidad in lineas
+    ])
+    return []
+
+# Marca como convertidas las reservas activas de una compra pagada y devuelve
+# sus líneas (id_producto, cantidad). Las líneas de la compra que no aparezcan
+# ya no retenían stock (la reserva caducó) y el llamador debe descontarlas.
+def convertir_reservas(db: Session, id_compra: int) -> list:
+    return db.execute(
+        update(models.ReservaStock)
+        .where(models.ReservaStock.id_compra == id_compra)
+        .where(models.ReservaStock.estado == "activa")
+        .values(estado="convertida")
+        .returning(models.ReservaStock.id_producto, models.ReservaStock.cantidad)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+# Devuelve al stock las reservas activas indicadas y cancela sus compras pendientes.
+# La condición sobre el estado hace que un barrido concurrente o el webhook de pago
+# no puedan procesar la misma reserva dos veces.
+def _liberar(db: Session, condicion) -> list:
+    liberadas = db.execute(
+        update(models.ReservaStock)
+        .where(condicion)
+        .where(models.ReservaStock.estado == "activa")
+        .values(estado="expirada")
+        .returning(models.ReservaStock.id_compra, models.ReservaStock.id_producto, models.ReservaStock.cantidad)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not liberadas:
+        return []
+    reponer_stock(db, [(r.id_producto, r.cantidad) for r in liberadas])
+    db.execute(
+        update(models.Compra)
+        .where(models.Compra.id_compra.in_({r.id_compra for r in liberadas}))
+        .where(models.Compra.estado == "pendiente")
+        .values(estado="cancelada")
+        .execution_options(synchronize_session=False)
+    )
+    return liberadas
+
+# Libera las reservas de una compra (sesión de Stripe caducada o fallida)
+def liberar_reservas(db: Session, id_compra: int) -> list:
+    return _liberar(db, models.ReservaStock.id_compra == id_compra)
+
+# Tarea periódica: libera las reservas caducadas por lotes usando el índice (estado, expira_en)
+def liberar_reservas_expiradas() -> int:
+    total = 0
+    db = SessionLocal()
+    try:
+        while True:
+            ids = db.query(models.ReservaStock.id_reserva).filter(
+                models.ReservaStock.estado == "activa",
+                models.ReservaStock.expira_en <= datetime.utcnow(),
+            ).limit(LOTE_BARRIDO).all()
+            if not ids:
+                break
+            liberadas = _liberar(db, models.ReservaStock.id_reserva.in_([i for (i,) in ids]))
+            db.commit()
+            invalidar_productos({r.id_producto for r in liberadas})
+            total += len(liberadas)
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error liberando reservas caducadas: {e}")
+    finally:
+        db.close()
+    if total:
+        logging.info(f"Reservas caducadas liberadas: {total}")
+    return total
+
+# Unidades retenidas por reservas activas y no caducadas, por producto
+def stock_reservado(db: Session, ids_producto) -> dict:
+    filas = db.query(
+        models.ReservaStock.id_producto, func.sum(models.ReservaStock.cantidad)
+    ).filter(
+        models.ReservaStock.id_producto.in_(ids_producto),
+        models.ReservaStock.estado == "activa",
+        models.ReservaStock.expira_en > datetime.utcnow(),
+    ).group_by(models.ReservaStock.id_producto).all()
+    return {id_producto: int(cantidad) for id_producto, cantidad in filas}
@@ -0,0 +1,108 @@
+from datetime import date, timedelta
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import get_db
+import models, schemas
+
+router = APIRouter(
+    prefix="/analitica",
+    tags=["analitica"],
+)
+
+# Días que se muestran si no se indica un rango
+DIAS_POR_DEFECTO = 30
+
+# Rango de fechas de la consulta (por defecto los últimos 30 días, ambos incluidos)
+def rango_fechas(desde: Optional[date] = None, hasta: Optional[date] = None):
+    hasta = hasta or date.today()
+    desde = desde or hasta - timedelta(days=DIAS_POR_DEFECTO - 1)
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="La fecha inicial no puede ser posterior a la final")
+    return desde, hasta
+
+# Totales del periodo, sumando los resúmenes diarios
+@router.get("/ventas/resumen", response_model=schemas.ResumenVentas)
+def read_resumen_ventas(rango=Depends(rango_fechas), db: Session = Depends(get_db)):
+    desde, hasta = rango
+    compras, unidades, ingresos = db.query(
+        func.coalesce(func.sum(models.VentaDiaria.compras), 0),
+        func.coalesce(func.sum(models.VentaDiaria.unidades), 0),
+        func.coalesce(func.sum(models.VentaDiaria.ingresos), 0),
+    ).filter(models.VentaDiaria.fecha.between(desde, hasta)).one()
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "compras": compras,
+        "unidades": unidades,
+        "ingresos": ingresos,
+        "ticket_medio": ingresos / compras if compras else 0,
+    }
+
+# Serie diaria de compras, unidades e ingresos (solo aparecen los días con ventas)
+@router.get("/ventas/diarias", response_model=List[schemas.VentaDia])
+def read_ventas_diarias(rango=Depends(rango_fechas), db: Session = Depends(get_db)):
+    desde, hasta = rango
+    return db.query(models.VentaDiaria).filter(
+        models.VentaDiaria.fecha.between(desde, hasta)
+    ).order_by(models.VentaDiaria.fecha).all()
+
+# Ventas del periodo agregadas por producto, categoría o proveedor
+def _ventas_agrupadas(db: Session, columna, modelo, clave, desde, hasta, orden, limit):
+    unidades = func.sum(models.VentaDiariaProducto.unidades)
+    ingresos = func.sum(models.VentaDiariaProducto.ingresos)
+    filas = db.query(
+        columna.label("id"),
+        modelo.nombre.label("nombre"),
+        unidades.label("unidades"),
+        ingresos.label("ingresos"),
+    ).outerjoin(
+        modelo, clave == columna
+    ).filter(
+        models.VentaDiariaProducto.fecha.between(desde, hasta)
+    ).group_by(columna, modelo.nombre).order_by(
+        (ingresos if orden == "ingresos" else unidades).desc(), columna
+    ).limit(limit).all()
+    return [fila._asdict() for fila in filas]
+
+@router.get("/ventas/productos", response_model=List[schemas.VentaAgrupada])
+def read_ventas_productos(
+    rango=Depends(rango_fechas),
+    orden: Literal["ingresos", "unidades"] = "ingresos",
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    desde, hasta = rango
+    return _ventas_agrupadas(
+        db, models.VentaDiariaProducto.id_producto, models.Producto, models.Producto.id_producto,
+        desde, hasta, orden, limit,
+    )
+
+@router.get("/ventas/categorias", response_model=List[schemas.VentaAgrupada])
+def read_ventas_categorias(
+    rango=Depends(rango_fechas),
+    orden: Literal["ingresos", "unidades"] = "ingresos",
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    desde, hasta = rango
+    return _ventas_agrupadas(
+        db, models.VentaDiariaProducto.id_categoria, models.Categoria, models.Categoria.id_categoria,
+        desde, hasta, orden, limit,
+    )
+
+@router.get("/ventas/proveedores", response_model=List[schemas.VentaAgrupada])
+def read_ventas_proveedores(
+    rango=Depends(rango_fechas),
+    orden: Literal["ingresos", "unidades"] = "ingresos",
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    desde, hasta = rango
+    return _ventas_agrupadas(
+        db, models.VentaDiariaProducto.id_proveedor, models.Proveedor, models.Proveedor.id_proveedor,
+        desde, hasta, orden, limit,
+    )
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from database import get_db
 import models, schemas
+from paginacion import paginar
+from cache import leer_con_cache, invalidar_categorias
 
 router = APIRouter(
     prefix="/categorias",
@@ -17,11 +19,17 @@ def create_categoria(categoria: schemas.CategoriaCreate, db: Session = Depends(g
     db.add(db_categoria)
     db.commit()
     db.refresh(db_categoria)
+    invalidar_categorias()
     return db_categoria
 
 @router.get("/", response_model=List[schemas.Categoria])
-def read_categorias(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    categorias = db.query(models.Categoria).offset(skip).limit(limit).all()
+def read_categorias(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    categorias = leer_con_cache(
+        ("categorias", skip, limit, cursor),
+        lambda: paginar(db.query(models.Categoria), [models.Categoria.id_categoria], skip, limit, cursor, response),
+        schemas.Categoria,
+        response,
+    )
     return categorias
 
 @router.get("/{categoria_id}", response_model=schemas.Categoria)
@@ -41,6 +49,7 @@ def update_categoria(categoria_id: int, categoria: schemas.CategoriaCreate, db:
     
     db.commit()
     db.refresh(db_categoria)
+    invalidar_categorias()
     return db_categoria
 
 @router.delete("/{categoria_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -51,4 +60,5 @@ def delete_categoria(categoria_id: int, db: Session = Depends(get_db)):
     
     db.delete(db_categoria)
     db.commit()
+    invalidar_categorias()
     return None
\ No newline at end of file
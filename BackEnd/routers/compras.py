@@ -1,9 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import List, Literal, Optional
+from datetime import datetime
 
 from database import get_db
 import models, schemas
+from auth.jwt import get_current_admin_user
+from paginacion import paginar
+from cache import invalidar_productos
+from inventario import descontar_stock, mensaje_fallo
+from analitica import encolar_ventas
+from exportacion import exportar_csv, exportar_parquet, parquet_disponible
 
 router = APIRouter(
     prefix="/compras",
@@ -11,6 +20,10 @@ router = APIRouter(
     responses={404: {"description": "No encontrado"}},
 )
 
+# Filtro por estado de los listados y exportaciones. Por defecto solo las
+# compras pagadas: las pendientes y canceladas son checkouts sin cobrar
+FiltroEstado = Literal["pagada", "pendiente", "cancelada", "todas"]
+
 @router.post("/", response_model=schemas.Compra, status_code=status.HTTP_201_CREATED)
 def create_compra(compra: schemas.CompraCreate, db: Session = Depends(get_db)):
     # Verificar que el usuario existe
@@ -18,58 +31,123 @@ def create_compra(compra: schemas.CompraCreate, db: Session = Depends(get_db)):
     if db_usuario is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
+    # Descontar el stock de todas las líneas de forma atómica antes de registrar la compra
+    fallos = descontar_stock(db, [(d.id_producto, d.cantidad) for d in compra.detalles])
+    if fallos:
+        db.rollback()
+        codigo = 404 if fallos[0]["motivo"] == "no_encontrado" else 400
+        raise HTTPException(status_code=codigo, detail="; ".join(mensaje_fallo(f) for f in fallos))
+
     # Crear la compra
     db_compra = models.Compra(
         id_usuario=compra.id_usuario,
         total=compra.total
     )
     db.add(db_compra)
-    db.commit()
-    db.refresh(db_compra)
+    db.flush()
     
-    # Crear los detalles de la compra
-    for detalle in compra.detalles:
-        # Verificar que el producto existe
-        db_producto = db.query(models.Producto).filter(models.Producto.id_producto == detalle.id_producto).first()
-        if db_producto is None:
-            raise HTTPException(status_code=404, detail=f"Producto con ID {detalle.id_producto} no encontrado")
-        
-        # Verificar stock disponible
-        if db_producto.cantidad < detalle.cantidad:
-            raise HTTPException(status_code=400, detail=f"Stock insuficiente para el producto {db_producto.nombre}")
-        
-        # Actualizar stock del producto
-        db_producto.cantidad -= detalle.cantidad
-        
-        # Crear el detalle de compra
-        db_detalle = models.DetalleCompra(
-            id_compra=db_compra.id_compra,
-            id_producto=detalle.id_producto,
-            cantidad=detalle.cantidad,
-            precio_unitario=detalle.precio_unitario
-        )
-        db.add(db_detalle)
+    # Crear todos los detalles de la compra con una sola inserción
+    db.execute(insert(models.DetalleCompra), [
+        {
+            "id_compra": db_compra.id_compra,
+            "id_producto": detalle.id_producto,
+            "cantidad": detalle.cantidad,
+            "precio_unitario": detalle.precio_unitario
+        }
+        for detalle in compra.detalles
+    ])
+    encolar_ventas(db, [db_compra.id_compra])
     
+    # Compra, detalles, stock y venta pendiente de sumar se confirman en la misma transacción
     db.commit()
+    invalidar_productos([detalle.id_producto for detalle in compra.detalles])
     db.refresh(db_compra)
     return db_compra
 
 @router.get("/", response_model=List[schemas.CompraConUsuario])
-def read_compras(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    compras = db.query(models.Compra).offset(skip).limit(limit).all()
-    compras_con_usuario = []
-    for compra in compras:
-        usuario = db.query(models.Usuario).filter(models.Usuario.id_usuario == compra.id_usuario).first()
-        compras_con_usuario.append({
+def read_compras(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fecha_desde: Optional[datetime] = None,
+    fecha_hasta: Optional[datetime] = None,
+    email: Optional[str] = None,
+    total_min: Optional[float] = None,
+    total_max: Optional[float] = None,
+    orden: Literal["id_compra", "fecha_compra", "total"] = "id_compra",
+    direccion: Literal["asc", "desc"] = "asc",
+    estado: FiltroEstado = "pagada",
+    db: Session = Depends(get_db),
+):
+    # Compra y usuario en una sola consulta
+    query = db.query(
+        models.Compra.id_compra,
+        models.Compra.id_usuario,
+        models.Compra.fecha_compra,
+        models.Compra.total,
+        models.Compra.estado,
+        models.Usuario.nombre.label("usuario_nombre"),
+        models.Usuario.email.label("usuario_email"),
+    ).outerjoin(models.Usuario, models.Usuario.id_usuario == models.Compra.id_usuario)
+
+    if estado != "todas":
+        query = query.filter(models.Compra.estado == estado)
+    if fecha_desde is not None:
+        query = query.filter(models.Compra.fecha_compra >= fecha_desde)
+    if fecha_hasta is not None:
+        query = query.filter(models.Compra.fecha_compra <= fecha_hasta)
+    if email:
+        query = query.filter(models.Usuario.email == email)
+    if total_min is not None:
+        query = query.filter(models.Compra.total >= total_min)
+    if total_max is not None:
+        query = query.filter(models.Compra.total <= total_max)
+
+    # El id de la compra desempata para que el orden (y el cursor) sean estables
+    columnas = [models.Compra.id_compra]
+    if orden != "id_compra":
+        columnas.insert(0, getattr(models.Compra, orden))
+    compras = paginar(query, columnas, skip, limit, cursor, response, descendente=direccion == "desc")
+
+    return [
+        {
             "id_compra": compra.id_compra,
             "id_usuario": compra.id_usuario,
-            "usuario_nombre": usuario.nombre if usuario else "",
-            "usuario_email": usuario.email if usuario else "",
+            "usuario_nombre": compra.usuario_nombre or "",
+            "usuario_email": compra.usuario_email or "",
             "fecha_compra": compra.fecha_compra,
             "total": compra.total,
-            "metodo_pago": getattr(compra, "metodo_pago", "Tarjeta") or "Tarjeta", 
-        })
-    return compras_con_usuario
+            "estado": compra.estado,
+            "metodo_pago": "Tarjeta",
+        }
+        for compra in compras
+    ]
+
+# Exportación completa de compras y sus líneas para contabilidad, solo para
+# administradores. Se envía en streaming a medida que se lee de la base de datos
+@router.get("/exportar", dependencies=[Depends(get_current_admin_user)])
+def exportar_compras(
+    formato: Literal["csv", "parquet"] = "csv",
+    fecha_desde: Optional[datetime] = None,
+    fecha_hasta: Optional[datetime] = None,
+    estado: FiltroEstado = "pagada",
+):
+    filtro_estado = None if estado == "todas" else estado
+    marca = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    if formato == "parquet":
+        if not parquet_disponible():
+            raise HTTPException(status_code=400, detail="La exportación a Parquet requiere pyarrow instalado en el servidor")
+        return StreamingResponse(
+            exportar_parquet(fecha_desde, fecha_hasta, filtro_estado),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": f'attachment; filename="compras-{marca}.parquet"'},
+        )
+    return StreamingResponse(
+        exportar_csv(fecha_desde, fecha_hasta, filtro_estado),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="compras-{marca}.csv"'},
+    )
 
 @router.get("/{compra_id}", response_model=schemas.Compra)
 def read_compra(compra_id: int, db: Session = Depends(get_db)):
@@ -80,5 +158,44 @@ def read_compra(compra_id: int, db: Session = Depends(get_db)):
 
 @router.get("/usuario/{usuario_id}", response_model=List[schemas.Compra])
 def read_compras_by_usuario(usuario_id: int, db: Session = Depends(get_db)):
-    compras = db.query(models.Compra).filter(models.Compra.id_usuario == usuario_id).all()
+    # Los detalles de todas las compras se cargan en una segunda consulta en lugar de una por compra
+    compras = db.query(models.Compra).options(
+        selectinload(models.Compra.detalles)
+    ).filter(models.Compra.id_usuario == usuario_id).all()
     return compras
+
+# Compras que se muestran al cliente como tales: solo las cobradas, ni los checkouts
+# abandonados ni los cancelados. El historial y el resumen usan la misma regla
+def _compras_del_cliente(usuario_id: int) -> tuple:
+    return (models.Compra.id_usuario == usuario_id, models.Compra.estado == "pagada")
+
+# Historial paginado de un cliente, de la compra más reciente a la más antigua.
+# Siempre son dos consultas por página: las compras y sus detalles con el producto
+# (solo nombre e imagen), sin importar cuántas compras o líneas tenga el cliente.
+@router.get("/usuario/{usuario_id}/historial", response_model=List[schemas.CompraHistorial])
+def read_historial_usuario(
+    usuario_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    query = db.query(models.Compra).options(
+        selectinload(models.Compra.detalles)
+        .joinedload(models.DetalleCompra.producto)
+        .load_only(models.Producto.nombre, models.Producto.imagen_url)
+    ).filter(*_compras_del_cliente(usuario_id))
+    return paginar(
+        query, [models.Compra.fecha_compra, models.Compra.id_compra],
+        skip, limit, cursor, response, descendente=True,
+    )
+
+# Número de compras pagadas y total gastado, agregados en la base de datos
+@router.get("/usuario/{usuario_id}/resumen", response_model=schemas.ResumenComprasUsuario)
+def read_resumen_usuario(usuario_id: int, db: Session = Depends(get_db)):
+    numero, total = db.query(
+        func.count(models.Compra.id_compra),
+        func.coalesce(func.sum(models.Compra.total), 0),
+    ).filter(*_compras_del_cliente(usuario_id)).one()
+    return {"numero_compras": numero, "total_gastado": total}
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List, Optional
 
 from database import get_db
 import models, schemas
+from paginacion import paginar
 
 router = APIRouter(
     prefix="/detalles-compra",
@@ -11,11 +12,44 @@ router = APIRouter(
     responses={404: {"description": "No encontrado"}},
 )
 
+# Máximo de compras que se pueden pedir en una sola llamada por lotes
+MAX_COMPRAS_LOTE = 500
+
 @router.get("/", response_model=List[schemas.DetalleCompra])
-def read_detalles_compra(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    detalles = db.query(models.DetalleCompra).offset(skip).limit(limit).all()
+def read_detalles_compra(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    detalles = paginar(db.query(models.DetalleCompra), [models.DetalleCompra.id_detalle], skip, limit, cursor, response)
     return detalles
 
+# Detalles de varias compras agrupados por compra, con producto y categoría,
+# en una sola consulta: /detalles-compra/compras?ids=1&ids=2&ids=3
+@router.get("/compras", response_model=Dict[int, List[schemas.DetalleCompraConProducto]])
+def read_detalles_by_compras(ids: List[int] = Query(...), db: Session = Depends(get_db)):
+    ids = set(ids)
+    if len(ids) > MAX_COMPRAS_LOTE:
+        raise HTTPException(status_code=400, detail=f"Se pueden consultar como máximo {MAX_COMPRAS_LOTE} compras a la vez")
+
+    filas = db.query(
+        models.DetalleCompra.id_detalle,
+        models.DetalleCompra.id_compra,
+        models.DetalleCompra.id_producto,
+        models.DetalleCompra.cantidad,
+        models.DetalleCompra.precio_unitario,
+        models.Producto.nombre.label("producto_nombre"),
+        models.Categoria.nombre.label("categoria_nombre"),
+    ).outerjoin(
+        models.Producto, models.Producto.id_producto == models.DetalleCompra.id_producto
+    ).outerjoin(
+        models.Categoria, models.Categoria.id_categoria == models.Producto.id_categoria
+    ).filter(
+        models.DetalleCompra.id_compra.in_(ids)
+    ).order_by(models.DetalleCompra.id_compra, models.DetalleCompra.id_detalle).all()
+
+    # Todas las compras pedidas aparecen en la respuesta, aunque no tengan detalles
+    agrupados = {id_compra: [] for id_compra in sorted(ids)}
+    for fila in filas:
+        agrupados[fila.id_compra].append(fila._asdict())
+    return agrupados
+
 @router.get("/{detalle_id}", response_model=schemas.DetalleCompra)
 def read_detalle_compra(detalle_id: int, db: Session = Depends(get_db)):
     db_detalle = db.query(models.DetalleCompra).filter(models.DetalleCompra.id_detalle == detalle_id).first()
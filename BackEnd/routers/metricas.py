@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from cache import cache_catalogo
+from correo import estado_bandeja_correo, conexion_smtp
+from database import engine, async_engine, estado_pool, get_db
+from auth.jwt import cache_usuarios, get_current_admin_user
+from auth.limites import limitador_bcrypt
+from payment.webhooks import estado_bandeja
+from payment.stripe_utils import circuito_stripe
+from payment.sincronizacion import estado_cola
+
+# Las métricas exponen datos internos: solo para administradores
+router = APIRouter(
+    prefix="/metricas",
+    tags=["metricas"],
+    dependencies=[Depends(get_current_admin_user)],
+)
+
+# Aciertos, fallos e invalidaciones de las cachés del catálogo y de usuarios autenticados
+@router.get("/cache")
+def read_metricas_cache():
+    return {"catalogo": cache_catalogo.estadisticas(), "usuarios": cache_usuarios.estadisticas()}
+
+# Uso de los pools de conexiones de este worker
+@router.get("/pool")
+def read_metricas_pool():
+    return {
+        "sincrono": estado_pool(engine),
+        "asincrono": estado_pool(async_engine.sync_engine),
+    }
+
+# Eventos de webhook por estado (una cola de "pendiente" creciendo indica que los workers no dan abasto)
+@router.get("/webhooks")
+def read_metricas_webhooks(db: Session = Depends(get_db)):
+    return {"eventos": estado_bandeja(db)}
+
+# Estado del cortacircuitos de Stripe
+@router.get("/stripe")
+def read_metricas_stripe():
+    return {"circuito": circuito_stripe.estadisticas()}
+
+# Trabajos de sincronización del catálogo con Stripe por estado
+@router.get("/sincronizacion")
+def read_metricas_sincronizacion(db: Session = Depends(get_db)):
+    return {"trabajos": estado_cola(db)}
+
+# Admisiones y rechazos (429) de las rutas que calculan bcrypt
+@router.get("/limites")
+def read_metricas_limites():
+    return {"bcrypt": limitador_bcrypt.estadisticas()}
+
+# Correos de la bandeja de salida por estado y conexiones SMTP abiertas desde el arranque
+@router.get("/correo")
+def read_metricas_correo(db: Session = Depends(get_db)):
+    return {"correos": estado_bandeja_correo(db), "conexiones_smtp": conexion_smtp.conexiones}
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
 
 from database import get_db
 import models, schemas
-from payment.stripe_utils import crear_producto_stripe, crear_precio_stripe  # Nombres actualizados
+from paginacion import paginar, CABECERA_TOTAL
+from busqueda import filtrar_texto
+from cache import leer_con_cache, invalidar_productos
+from reservas import stock_reservado
+from payment.sincronizacion import encolar_sincronizacion
 
 router = APIRouter(
     prefix="/productos",
@@ -24,21 +28,8 @@ def create_producto(producto: schemas.ProductoCreate, db: Session = Depends(get_
     if db_proveedor is None:
         raise HTTPException(status_code=404, detail="Proveedor no encontrado")
     
-    # Crear el producto en Stripe
-    imagenes = [producto.imagen_url] if producto.imagen_url else []
-    producto_stripe = crear_producto_stripe(
-        nombre=producto.nombre,
-        descripcion=producto.descripción,
-        imagenes=imagenes
-    )
-    
-    # Crear el precio en Stripe
-    precio_stripe = crear_precio_stripe(
-        id_producto=producto_stripe.id,
-        precio_unitario=producto.precio
-    )
-    
-    # Crear el producto en la base de datos
+    # Crear el producto en la base de datos; el alta en Stripe (producto y precio)
+    # la hace el worker de sincronización a partir de la cola
     db_producto = models.Producto(
         nombre=producto.nombre,
         descripción=producto.descripción,
@@ -47,25 +38,90 @@ def create_producto(producto: schemas.ProductoCreate, db: Session = Depends(get_
         id_categoria=producto.id_categoria,
         id_proveedor=producto.id_proveedor,
         imagen_url=producto.imagen_url,
-        id_producto_stripe=producto_stripe.id,  # Nombre actualizado
-        id_precio_stripe=precio_stripe.id       # Nombre actualizado
+        estado_sync="pendiente"
     )
     db.add(db_producto)
+    db.flush()
+    encolar_sincronizacion(db, db_producto)
     db.commit()
     db.refresh(db_producto)
+    invalidar_productos()
     return db_producto
 
 @router.get("/", response_model=List[schemas.Producto])
-def read_productos(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    productos = db.query(models.Producto).offset(skip).limit(limit).all()
+def read_productos(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    productos = leer_con_cache(
+        ("productos", skip, limit, cursor),
+        lambda: paginar(db.query(models.Producto), [models.Producto.id_producto], skip, limit, cursor, response),
+        schemas.Producto,
+        response,
+    )
+    return productos
+
+@router.get("/search", response_model=List[schemas.Producto])
+def search_productos(
+    response: Response,
+    q: Optional[str] = None,
+    id_categoria: Optional[int] = None,
+    id_proveedor: Optional[int] = None,
+    precio_min: Optional[float] = None,
+    precio_max: Optional[float] = None,
+    en_stock: bool = False,
+    orden: Literal["relevancia", "nombre", "precio-asc", "precio-desc", "recientes"] = "relevancia",
+    skip: int = 0,
+    limit: int = Query(24, le=100),
+    db: Session = Depends(get_db),
+):
+    query = db.query(models.Producto)
+    relevancia = None
+    if q and q.strip():
+        query, relevancia = filtrar_texto(query, db.get_bind().dialect.name, q.strip())
+
+    # Filtros resueltos en la base de datos con los índices de productos
+    if id_categoria is not None:
+        query = query.filter(models.Producto.id_categoria == id_categoria)
+    if id_proveedor is not None:
+        query = query.filter(models.Producto.id_proveedor == id_proveedor)
+    if precio_min is not None:
+        query = query.filter(models.Producto.precio >= precio_min)
+    if precio_max is not None:
+        query = query.filter(models.Producto.precio <= precio_max)
+    if en_stock:
+        query = query.filter(models.Producto.cantidad > 0)
+
+    response.headers[CABECERA_TOTAL] = str(query.order_by(None).count())
+
+    ordenes = {
+        "nombre": [models.Producto.nombre.asc()],
+        "precio-asc": [models.Producto.precio.asc()],
+        "precio-desc": [models.Producto.precio.desc()],
+        "recientes": [models.Producto.id_producto.desc()],
+        "relevancia": [relevancia] if relevancia is not None else [models.Producto.nombre.asc()],
+    }
+    # El id como último criterio garantiza un orden estable entre páginas
+    productos = query.order_by(*ordenes[orden], models.Producto.id_producto.asc()).offset(skip).limit(limit).all()
     return productos
 
 @router.get("/{producto_id}", response_model=schemas.Producto)
 def read_producto(producto_id: int, db: Session = Depends(get_db)):
-    db_producto = db.query(models.Producto).filter(models.Producto.id_producto == producto_id).first()
+    def buscar():
+        db_producto = db.query(models.Producto).filter(models.Producto.id_producto == producto_id).first()
+        if db_producto is None:
+            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        return db_producto
+    return leer_con_cache(("producto", producto_id), buscar, schemas.Producto)
+
+# Stock disponible (ya descontadas las reservas) y unidades retenidas en sesiones de pago abiertas
+@router.get("/{producto_id}/disponibilidad")
+def read_disponibilidad_producto(producto_id: int, db: Session = Depends(get_db)):
+    db_producto = db.query(models.Producto.cantidad).filter(models.Producto.id_producto == producto_id).first()
     if db_producto is None:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return db_producto
+    return {
+        "id_producto": producto_id,
+        "disponible": db_producto.cantidad,
+        "reservado": stock_reservado(db, [producto_id]).get(producto_id, 0),
+    }
 
 @router.put("/{producto_id}", response_model=schemas.Producto)
 def update_producto(producto_id: int, producto: schemas.ProductoCreate, db: Session = Depends(get_db)):
@@ -89,9 +145,12 @@ def update_producto(producto_id: int, producto: schemas.ProductoCreate, db: Sess
     db_producto.cantidad = producto.cantidad
     db_producto.id_categoria = producto.id_categoria
     db_producto.id_proveedor = producto.id_proveedor
+    # Nombre, descripción y precio se propagan a Stripe en segundo plano
+    encolar_sincronizacion(db, db_producto)
     
     db.commit()
     db.refresh(db_producto)
+    invalidar_productos([producto_id])
     return db_producto
 
 @router.delete("/{producto_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -100,6 +159,9 @@ def delete_producto(producto_id: int, db: Session = Depends(get_db)):
     if db_producto is None:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
+    # El producto se archiva en Stripe en segundo plano
+    encolar_sincronizacion(db, db_producto, "archivar")
     db.delete(db_producto)
     db.commit()
+    invalidar_productos([producto_id])
     return None
\ No newline at end of file
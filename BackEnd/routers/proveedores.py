@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from database import get_db
 import models, schemas
+from paginacion import paginar
 
 router = APIRouter(
     prefix="/proveedores",
@@ -23,8 +24,8 @@ def create_proveedor(proveedor: schemas.ProveedorCreate, db: Session = Depends(g
     return db_proveedor
 
 @router.get("/", response_model=List[schemas.Proveedor])
-def read_proveedores(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    proveedores = db.query(models.Proveedor).offset(skip).limit(limit).all()
+def read_proveedores(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    proveedores = paginar(db.query(models.Proveedor), [models.Proveedor.id_proveedor], skip, limit, cursor, response)
     return proveedores
 
 @router.get("/{proveedor_id}", response_model=schemas.Proveedor)
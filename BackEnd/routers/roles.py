@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from database import get_db
 import models, schemas
+from paginacion import paginar
 
 router = APIRouter(
     prefix="/roles",
@@ -20,8 +21,8 @@ def create_rol(rol: schemas.RolCreate, db: Session = Depends(get_db)):
     return db_rol
 
 @router.get("/", response_model=List[schemas.Rol])
-def read_roles(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    roles = db.query(models.Rol).offset(skip).limit(limit).all()
+def read_roles(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    roles = paginar(db.query(models.Rol), [models.Rol.id_rol], skip, limit, cursor, response)
     return roles
 
 @router.get("/{rol_id}", response_model=schemas.Rol)
@@ -0,0 +1,39 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+from payment.cliente_stripe import cliente
+from payment.stripe_utils import verificar_evento_webhook
+from payment.webhooks import guardar_evento
+
+# Rutas de apoyo del Stripe en memoria (STRIPE_FAKE=1): main.py solo las incluye
+# si el cliente activo es el falso. Sustituyen al navegador que paga en Stripe y
+# a la entrega del webhook, para recorrer checkout -> webhook por HTTP
+router = APIRouter(
+    prefix="/stripe-falso",
+    tags=["stripe-falso"],
+    responses={404: {"description": "No encontrado"}},
+)
+
+TIPOS_EVENTO = {
+    "completar": "checkout.session.completed",
+    "expirar": "checkout.session.expired",
+}
+
+# Paga (o deja caducar) una sesión de checkout y guarda en la bandeja el webhook
+# que enviaría Stripe; los workers de webhooks lo procesan como uno real
+@router.post("/sesiones/{id_sesion}/{accion}")
+async def simular_evento_sesion(
+    id_sesion: str,
+    accion: Literal["completar", "expirar"],
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        cuerpo = cliente.evento_sesion(id_sesion, TIPOS_EVENTO[accion])
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Sesión de checkout no encontrada")
+    evento = verificar_evento_webhook(cuerpo, None)
+    await guardar_evento(db, evento)
+    return {"id_evento": evento["id"], "tipo": evento["type"]}
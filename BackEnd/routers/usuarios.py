@@ -1,19 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Body
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+from typing import List, Optional
 import jwt
 import os
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
 from pydantic import BaseModel
 
 load_dotenv()
 
-from database import get_db
+from database import get_db, get_async_db
 import models, schemas
+from paginacion import paginar
 from auth import jwt as auth_jwt  # Asegúrate de que el import es correcto
+from auth.passwords import hashear
+from auth.limites import limitar_bcrypt
+from correo import encolar_correo
+from auth.refresco import emitir_token_refresco, rotar_token_refresco, revocar_token_refresco, revocar_tokens_usuario
 
 router = APIRouter(
     prefix="/usuarios",
@@ -24,20 +28,7 @@ router = APIRouter(
 SECRET_KEY = os.getenv("SECRET_KEY")  # Usa una variable de entorno en producción
 ALGORITHM = os.getenv("ALGORITHM")
 
-conf = ConnectionConfig(
-    MAIL_USERNAME = "novaforgegamesstore@gmail.com",
-    MAIL_PASSWORD = "vezm vpqf acoe gzew",
-    MAIL_FROM = "novaforgegamesstore@gmail.com",
-    MAIL_PORT = 587,
-    MAIL_SERVER = "smtp.gmail.com",
-    MAIL_STARTTLS = True,      # <--- Cambia esto
-    MAIL_SSL_TLS = False,      # <--- Cambia esto
-    USE_CREDENTIALS = True
-)
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-@router.get("/confirmar-email")
+@router.get("/confirmar-email", dependencies=[Depends(limitar_bcrypt)])
 def confirmar_email(token: str, db: Session = Depends(get_db)):
     try:
         data = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -71,7 +62,7 @@ def confirmar_email(token: str, db: Session = Depends(get_db)):
     db_usuario = models.Usuario(
         nombre=nombre,
         email=email,
-        contraseña=pwd_context.hash(contraseña),  # Hashea aquí
+        contraseña=hashear(contraseña),  # Hashea aquí
         id_rol=id_rol_int,
         is_active=is_active,
         telefono=telefono
@@ -81,7 +72,7 @@ def confirmar_email(token: str, db: Session = Depends(get_db)):
     db.refresh(db_usuario)
     return {"msg": "Usuario confirmado y registrado correctamente"}
 
-@router.post("/", response_model=schemas.Usuario)
+@router.post("/", response_model=schemas.Usuario, dependencies=[Depends(limitar_bcrypt)])
 def create_usuario(usuario: schemas.UsuarioCreate, db: Session = Depends(get_db)):
     # Verificar si el email ya existe
     db_usuario = db.query(models.Usuario).filter(models.Usuario.email == usuario.email).first()
@@ -92,7 +83,7 @@ def create_usuario(usuario: schemas.UsuarioCreate, db: Session = Depends(get_db)
     db_usuario = models.Usuario(
         nombre=usuario.nombre,
         email=usuario.email,
-        contraseña=pwd_context.hash(usuario.contraseña),  # Hashea aquí
+        contraseña=hashear(usuario.contraseña),  # Hashea aquí
         id_rol=usuario.id_rol,
         is_active=usuario.is_active,
         telefono=usuario.telefono
@@ -103,8 +94,8 @@ def create_usuario(usuario: schemas.UsuarioCreate, db: Session = Depends(get_db)
     return db_usuario
 
 @router.get("/", response_model=List[schemas.Usuario])
-def read_usuarios(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    usuarios = db.query(models.Usuario).offset(skip).limit(limit).all()
+def read_usuarios(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    usuarios = paginar(db.query(models.Usuario), [models.Usuario.id_usuario], skip, limit, cursor, response)
     return usuarios
 
 @router.get("/{usuario_id}", response_model=schemas.Usuario)
@@ -119,6 +110,7 @@ def update_usuario(usuario_id: int, usuario: schemas.UsuarioUpdate, db: Session
     db_usuario = db.query(models.Usuario).filter(models.Usuario.id_usuario == usuario_id).first()
     if db_usuario is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    email_anterior = db_usuario.email
     
     db_usuario.nombre = usuario.nombre
     db_usuario.email = usuario.email
@@ -127,8 +119,10 @@ def update_usuario(usuario_id: int, usuario: schemas.UsuarioUpdate, db: Session
     db_usuario.is_active = usuario.is_active
     if usuario.contraseña:
         db_usuario.contraseña = usuario.contraseña
+        revocar_tokens_usuario(db, usuario_id)
     db.commit()
     db.refresh(db_usuario)
+    auth_jwt.invalidar_usuario(email_anterior, db_usuario.email)
     return db_usuario
 
 @router.delete("/{usuario_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -137,12 +131,14 @@ def delete_usuario(usuario_id: int, db: Session = Depends(get_db)):
     if db_usuario is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
+    revocar_tokens_usuario(db, usuario_id)
     db.delete(db_usuario)
     db.commit()
+    auth_jwt.invalidar_usuario(db_usuario.email)
     return None
 
 @router.post("/pre-registro")
-async def pre_registro(usuario: schemas.UsuarioCreate):
+async def pre_registro(usuario: schemas.UsuarioCreate, db: AsyncSession = Depends(get_async_db)):
     # Genera un token de confirmación
     token_data = {
         "email": usuario.email,
@@ -157,18 +153,23 @@ async def pre_registro(usuario: schemas.UsuarioCreate):
     # Enlace de confirmación
     confirm_url = f"{os.getenv('FRONTEND_URL')}/confirmar-email?token={token}"
 
-    # Envía el email
-    message = MessageSchema(
-        subject="Confirma tu registro en NovaForgeGames",
-        recipients=[usuario.email],
-        body=f"Hola {usuario.nombre}, haz clic en el siguiente enlace para confirmar tu registro: {confirm_url}",
-        subtype="plain"
+    # Deja el email en la bandeja de salida; lo envía el worker de correo
+    encolar_correo(
+        db,
+        usuario.email,
+        "Confirma tu registro en NovaForgeGames",
+        f"Hola {usuario.nombre}, haz clic en el siguiente enlace para confirmar tu registro: {confirm_url}",
     )
-    fm = FastMail(conf)
-    await fm.send_message(message)
+    await db.commit()
     return {"msg": "Email de confirmación enviado"}
 
-@router.post("/login")
+def _crear_token_acceso(user: models.Usuario) -> str:
+    return auth_jwt.create_access_token(
+        data={"sub": user.email, "id_usuario": user.id_usuario, "rol": user.id_rol},
+        expires_delta=timedelta(minutes=auth_jwt.ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+
+@router.post("/login", dependencies=[Depends(limitar_bcrypt)])
 def login(
     email: str = Body(...),
     password: str = Body(...),
@@ -177,12 +178,13 @@ def login(
     user = auth_jwt.authenticate_user(db, email, password)
     if not user:
         raise HTTPException(status_code=400, detail="Email o contraseña incorrectos")
-    # Crea el token de acceso
-    access_token = auth_jwt.create_access_token(
-        data={"sub": user.email, "id_usuario": user.id_usuario, "rol": user.id_rol}
-    )
+    # Crea el token de acceso y el de refresco, con el que se renueva sin volver a enviar la contraseña
+    access_token = _crear_token_acceso(user)
+    refresh_token = emitir_token_refresco(db, user.id_usuario)
+    db.commit()
     return {
         "access_token": access_token,
+        "refresh_token": refresh_token,
         "token_type": "bearer",
         "user": {
             "id_usuario": user.id_usuario,
@@ -194,6 +196,23 @@ def login(
         }
     }
 
+# Canjea el token de refresco por un token de acceso nuevo y otro de refresco
+# (el anterior deja de valer). No verifica la contraseña, así que no pasa por bcrypt
+@router.post("/refrescar", response_model=schemas.Token)
+def refrescar_token(datos: schemas.TokenRefrescoRequest, db: Session = Depends(get_db)):
+    user, refresh_token = rotar_token_refresco(db, datos.refresh_token)
+    return {
+        "access_token": _crear_token_acceso(user),
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+    }
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(datos: schemas.TokenRefrescoRequest, db: Session = Depends(get_db)):
+    revocar_token_refresco(db, datos.refresh_token)
+    db.commit()
+    return None
+
 @router.post("/cambiar-contraseña", status_code=200)
 def cambiar_contraseña(
     usuario_id: int = Body(...),
@@ -203,8 +222,11 @@ def cambiar_contraseña(
     db_usuario = db.query(models.Usuario).filter(models.Usuario.id_usuario == usuario_id).first()
     if db_usuario is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    db_usuario.contraseña = pwd_context.hash(nueva_contraseña)
+    db_usuario.contraseña = hashear(nueva_contraseña)
+    # Las sesiones abiertas en otros dispositivos dejan de poder refrescarse
+    revocar_tokens_usuario(db, usuario_id)
     db.commit()
+    auth_jwt.invalidar_usuario(db_usuario.email)
     return {"msg": "Contraseña actualizada correctamente"}
 
 class EmailRequest(BaseModel):
@@ -213,10 +235,10 @@ class EmailRequest(BaseModel):
 @router.post("/recuperar-contraseña", status_code=200)
 async def recuperar_contraseña(
     data: EmailRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     print("EMAIL RECIBIDO:", data.email)
-    usuario = db.query(models.Usuario).filter(models.Usuario.email == data.email).first()
+    usuario = await auth_jwt.get_user_async(db, data.email)
     if not usuario:
         raise HTTPException(status_code=404, detail="No existe un usuario con ese email")
 
@@ -231,14 +253,13 @@ async def recuperar_contraseña(
 
     reset_url = f"{os.getenv('FRONTEND_URL')}/resetear-contraseña?token={token}"
 
-    message = MessageSchema(
-        subject="Recupera tu contraseña en NovaForgeGames",
-        recipients=[usuario.email],
-        body=f"Hola {usuario.nombre}, haz clic en el siguiente enlace para restablecer tu contraseña: {reset_url}",
-        subtype="plain"
+    encolar_correo(
+        db,
+        usuario.email,
+        "Recupera tu contraseña en NovaForgeGames",
+        f"Hola {usuario.nombre}, haz clic en el siguiente enlace para restablecer tu contraseña: {reset_url}",
     )
-    fm = FastMail(conf)
-    await fm.send_message(message)
+    await db.commit()
     return {"msg": "Email de recuperación enviado"}
 
 @router.post("/resetear-contraseña", status_code=200)
@@ -259,8 +280,10 @@ def resetear_contraseña(
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-    usuario.contraseña = pwd_context.hash(nueva_contraseña)  # Hashea aquí
+    usuario.contraseña = hashear(nueva_contraseña)  # Hashea aquí
+    revocar_tokens_usuario(db, usuario.id_usuario)
     db.commit()
+    auth_jwt.invalidar_usuario(usuario.email)
     return {"msg": "Contraseña restablecida correctamente"}
 
     usuario.contraseña = nueva_contraseña  # En producción, hashea la contraseña
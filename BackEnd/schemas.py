@@ -1,5 +1,5 @@
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime
 from pydantic import BaseModel, validator, Field
 import re
 
@@ -97,6 +97,7 @@ class Producto(ProductoBase):
     id_producto: int
     id_producto_stripe: Optional[str] = None  # Cambiado de stripe_product_id
     id_precio_stripe: Optional[str] = None    # Cambiado de stripe_price_id
+    estado_sync: Optional[str] = None
     
     class Config:
         orm_mode = True
@@ -117,6 +118,11 @@ class DetalleCompra(DetalleCompraBase):
     class Config:
         orm_mode = True
 
+# Detalle con el nombre del producto y de su categoría, para la revisión de pedidos
+class DetalleCompraConProducto(DetalleCompra):
+    producto_nombre: Optional[str] = None
+    categoria_nombre: Optional[str] = None
+
 # Esquemas para Compra
 class CompraBase(BaseModel):
     id_usuario: int
@@ -128,15 +134,39 @@ class CompraCreate(CompraBase):
 class Compra(CompraBase):
     id_compra: int
     fecha_compra: datetime
+    estado: Optional[str] = None
     detalles: List[DetalleCompra] = []
     
     class Config:
         orm_mode = True
 
+# Esquemas para el historial de compras de un cliente
+class ProductoResumen(BaseModel):
+    id_producto: int
+    nombre: str
+    imagen_url: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class DetalleCompraHistorial(DetalleCompra):
+    producto: Optional[ProductoResumen] = None
+
+class CompraHistorial(Compra):
+    detalles: List[DetalleCompraHistorial] = []
+
+class ResumenComprasUsuario(BaseModel):
+    numero_compras: int
+    total_gastado: float
+
 # Esquemas para autenticación
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class TokenRefrescoRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     email: Optional[str] = None
@@ -149,7 +179,31 @@ class CompraConUsuario(BaseModel):
     usuario_email: str
     fecha_compra: datetime
     total: float
+    estado: str
     metodo_pago: str
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+# Esquemas para la analítica de ventas
+class VentaDia(BaseModel):
+    fecha: date
+    compras: int
+    unidades: int
+    ingresos: float
+
+    class Config:
+        from_attributes = True
+
+class VentaAgrupada(BaseModel):
+    id: Optional[int] = None
+    nombre: Optional[str] = None
+    unidades: int
+    ingresos: float
+
+class ResumenVentas(BaseModel):
+    desde: date
+    hasta: date
+    compras: int
+    unidades: int
+    ingresos: float
+    ticket_medio: float
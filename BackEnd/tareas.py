@@ -0,0 +1,32 @@
+import asyncio
+import logging
+
+from starlette.concurrency import run_in_threadpool
+
+# Ejecuta una función cada `intervalo` segundos sin bloquear el event loop: las
+# síncronas en el pool de hilos y las corrutinas directamente en el loop.
+# Los errores se registran y el bucle continúa.
+async def ejecutar_periodicamente(nombre: str, funcion, intervalo: float):
+    while True:
+        try:
+            if asyncio.iscoroutinefunction(funcion):
+                await funcion()
+            else:
+                await run_in_threadpool(funcion)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Error en la tarea periódica {nombre}: {e}")
+        await asyncio.sleep(intervalo)
+
+# Lanza las tareas de fondo y devuelve los objetos Task para poder cancelarlas al apagar
+def iniciar_tareas(tareas) -> list:
+    return [
+        asyncio.create_task(ejecutar_periodicamente(nombre, funcion, intervalo), name=nombre)
+        for nombre, funcion, intervalo in tareas
+    ]
+
+async def detener_tareas(tareas: list):
+    for tarea in tareas:
+        tarea.cancel()
+    await asyncio.gather(*tareas, return_exceptions=True)
@@ -0,0 +1,93 @@
+import os
+import sys
+import tempfile
+
+# Entorno de pruebas: SQLite en un directorio temporal y Stripe en memoria.
+# Tiene que fijarse antes de importar los módulos de la aplicación
+_directorio = tempfile.mkdtemp(prefix="novaforge-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_directorio, 'tests.db')}",
+    SECRET_KEY="clave-de-pruebas",
+    ALGORITHM="HS256",
+    ACCESS_TOKEN_EXPIRE_MINUTES="30",
+    STRIPE_FAKE="1",
+    BCRYPT_ROUNDS="4",
+    LOGIN_RAFAGA="1000",
+    LOGIN_CONCURRENCIA="1000",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import models
+from database import Base, SessionLocal, engine
+from cache import cache_catalogo
+from auth.jwt import cache_usuarios
+
+# Deja la base de datos y las cachés vacías antes de cada prueba
+@pytest.fixture(autouse=True)
+def base_limpia():
+    with engine.begin() as conn:
+        for tabla in reversed(Base.metadata.sorted_tables):
+            conn.execute(tabla.delete())
+    cache_catalogo.limpiar()
+    cache_usuarios.limpiar()
+    yield
+
+@pytest.fixture
+def db():
+    sesion = SessionLocal()
+    yield sesion
+    sesion.close()
+
+# Sin `with`, para que no arranquen las tareas de fondo: las pruebas las ejecutan a mano
+@pytest.fixture
+def cliente():
+    return TestClient(main.app)
+
+# Catálogo mínimo: dos categorías, un proveedor, los roles y cuatro productos
+@pytest.fixture
+def catalogo(db):
+    categorias = [models.Categoria(nombre="Aventura"), models.Categoria(nombre="Carreras")]
+    proveedor = models.Proveedor(nombre="Nintendo")
+    db.add_all([*categorias, proveedor, models.Rol(nombre_rol="admin"), models.Rol(nombre_rol="cliente")])
+    db.flush()
+    productos = [
+        models.Producto(nombre=nombre, descripción=descripcion, precio=precio, cantidad=cantidad,
+                        id_categoria=categorias[i % 2].id_categoria, id_proveedor=proveedor.id_proveedor,
+                        id_precio_stripe=f"price_{i}")
+        for i, (nombre, descripcion, precio, cantidad) in enumerate([
+            ("The Legend of Zelda", "Aventura épica en Hyrule", 59.99, 10),
+            ("Mario Kart", "Carreras locas con amigos", 49.99, 0),
+            ("Zelda Link's Awakening", "Remake de aventura clásica", 39.99, 5),
+            ("Forza", "Conducción realista", 69.99, 3),
+        ])
+    ]
+    db.add_all(productos)
+    db.commit()
+    return {"categorias": categorias, "proveedor": proveedor, "productos": productos}
+
+def _rol(db, nombre: str) -> int:
+    return db.query(models.Rol.id_rol).filter(models.Rol.nombre_rol == nombre).scalar()
+
+# Crea un usuario y devuelve las cabeceras con su token de acceso
+@pytest.fixture
+def autenticar(cliente, db, catalogo):
+    def crear(email: str = "cliente@example.com", rol: str = "cliente", contraseña: str = "secreta"):
+        respuesta = cliente.post("/usuarios/", json={
+            "nombre": email.split("@")[0], "email": email, "id_rol": _rol(db, rol), "contraseña": contraseña,
+        })
+        assert respuesta.status_code == 200, respuesta.text
+        token = cliente.post("/token", data={"username": email, "password": contraseña}).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return crear
+
+@pytest.fixture
+def cabeceras(autenticar):
+    return autenticar()
+
+@pytest.fixture
+def cabeceras_admin(autenticar):
+    return autenticar("admin@example.com", "admin")
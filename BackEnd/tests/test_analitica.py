@@ -0,0 +1,90 @@
+from datetime import date
+
+from sqlalchemy import event
+
+import models
+from analitica import encolar_ventas, procesar_ventas_pendientes, reconstruir_ventas
+from database import engine
+
+def _comprar(cliente, db, lineas):
+    id_usuario = db.query(models.Usuario.id_usuario).scalar()
+    respuesta = cliente.post("/compras/", json={
+        "id_usuario": id_usuario,
+        "total": sum(cantidad * precio for _, cantidad, precio in lineas),
+        "detalles": [
+            {"id_producto": id_producto, "cantidad": cantidad, "precio_unitario": precio}
+            for id_producto, cantidad, precio in lineas
+        ],
+    })
+    assert respuesta.status_code == 201, respuesta.text
+    return respuesta.json()["id_compra"]
+
+def _resumenes(db):
+    db.expire_all()
+    por_dia = [(v.compras, v.unidades, round(v.ingresos, 2)) for v in db.query(models.VentaDiaria)]
+    por_producto = {
+        v.id_producto: (v.unidades, round(v.ingresos, 2))
+        for v in db.query(models.VentaDiariaProducto)
+    }
+    return por_dia, por_producto
+
+# La venta solo deja su fila en la cola; los resúmenes se suman después
+def test_la_venta_se_suma_despues_del_commit(cliente, db, catalogo, cabeceras):
+    zelda, _, awakening, _ = [p.id_producto for p in catalogo["productos"]]
+    id_compra = _comprar(cliente, db, [(zelda, 2, 59.99), (awakening, 1, 39.99)])
+    assert [v.id_compra for v in db.query(models.VentaPendiente)] == [id_compra]
+    assert _resumenes(db) == ([], {})
+
+    assert procesar_ventas_pendientes() == 1
+    assert _resumenes(db) == ([(1, 3, 159.97)], {zelda: (2, 119.98), awakening: (1, 39.99)})
+    assert db.query(models.VentaPendiente).count() == 0
+    assert procesar_ventas_pendientes() == 0
+
+def test_los_lotes_suman_lo_mismo_que_la_reconstruccion(cliente, db, catalogo, cabeceras):
+    zelda, _, awakening, forza = [p.id_producto for p in catalogo["productos"]]
+    _comprar(cliente, db, [(zelda, 1, 59.99)])
+    _comprar(cliente, db, [(forza, 2, 69.99), (zelda, 1, 59.99)])
+    assert procesar_ventas_pendientes() == 2
+    _comprar(cliente, db, [(awakening, 1, 39.99)])
+    assert procesar_ventas_pendientes() == 1
+    incremental = _resumenes(db)
+
+    reconstruir_ventas(db)
+    db.commit()
+    assert _resumenes(db) == incremental
+    assert incremental[0] == [(3, 5, round(59.99 * 2 + 69.99 * 2 + 39.99, 2))]
+
+# La reconstrucción ya cuenta las ventas que seguían en la cola
+def test_reconstruir_vacia_la_cola(cliente, db, catalogo, cabeceras):
+    zelda = catalogo["productos"][0].id_producto
+    _comprar(cliente, db, [(zelda, 1, 59.99)])
+    reconstruir_ventas(db, desde=date(2000, 1, 1))
+    db.commit()
+    assert db.query(models.VentaPendiente).count() == 0
+    assert procesar_ventas_pendientes() == 0
+    assert _resumenes(db)[0] == [(1, 1, 59.99)]
+
+def test_solo_se_suman_compras_pagadas(db, catalogo, cabeceras):
+    id_usuario = db.query(models.Usuario.id_usuario).scalar()
+    compra = models.Compra(id_usuario=id_usuario, total=10, estado="pendiente")
+    db.add(compra)
+    db.flush()
+    encolar_ventas(db, [compra.id_compra])
+    db.commit()
+    assert procesar_ventas_pendientes() == 1
+    assert _resumenes(db) == ([], {})
+
+# Primero las filas por (fecha, producto) y al final la fila del día, que comparten todas las ventas
+def test_la_fila_del_dia_se_escribe_la_ultima(cliente, db, catalogo, cabeceras):
+    zelda, _, awakening, _ = [p.id_producto for p in catalogo["productos"]]
+    _comprar(cliente, db, [(awakening, 1, 39.99), (zelda, 1, 59.99)])
+    inserciones = []
+    def registrar(conn, cursor, sql, parametros, contexto, executemany):
+        if sql.startswith("INSERT INTO ventas_diarias"):
+            inserciones.append(sql.split()[2])
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        procesar_ventas_pendientes()
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+    assert inserciones == ["ventas_diarias_producto", "ventas_diarias"]
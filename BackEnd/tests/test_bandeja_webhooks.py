@@ -0,0 +1,114 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import models
+from database import SessionLocal
+from payment import webhooks
+from payment.webhooks import _reclamar_eventos, procesar_eventos_pendientes
+
+def _evento(id_evento: str, tipo: str = "prueba.evento") -> bytes:
+    return json.dumps({"id": id_evento, "object": "event", "type": tipo, "data": {"object": {}}}).encode()
+
+def _recibir(cliente, *ids, tipo: str = "prueba.evento"):
+    for id_evento in ids:
+        respuesta = cliente.post("/webhook", content=_evento(id_evento, tipo))
+        assert respuesta.status_code == 200, respuesta.text
+
+def _eventos(db) -> dict:
+    db.expire_all()
+    return {e.id_evento_stripe: e for e in db.query(models.EventoWebhook)}
+
+# Los reenvíos de Stripe no duplican el evento en la bandeja
+def test_reenvio_del_mismo_evento(cliente, db, catalogo):
+    _recibir(cliente, "evt_1", "evt_1")
+    assert list(_eventos(db)) == ["evt_1"]
+    assert _eventos(db)["evt_1"].estado == "pendiente"
+
+def test_reclamar_retiene_el_evento_hasta_que_vence_el_bloqueo(cliente, db, catalogo):
+    _recibir(cliente, "evt_1")
+    reclamados = _reclamar_eventos(db)
+    assert [(e.id_evento_stripe, e.intentos) for e in reclamados] == [("evt_1", 1)]
+    evento = _eventos(db)["evt_1"]
+    assert evento.estado == "procesando"
+    assert evento.proximo_intento > datetime.utcnow() + timedelta(minutes=4)
+    # Mientras dura el bloqueo nadie más lo reclama
+    assert _reclamar_eventos(db) == []
+
+    # Si el worker se cae, el evento se retoma al vencer el bloqueo
+    evento.proximo_intento = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    assert [(e.id_evento_stripe, e.intentos) for e in _reclamar_eventos(db)] == [("evt_1", 2)]
+
+# Varios workers a la vez nunca reclaman el mismo evento
+def test_reclamos_concurrentes_no_se_solapan(cliente, catalogo):
+    _recibir(cliente, *[f"evt_{i}" for i in range(30)])
+    barrera = threading.Barrier(4)
+    reclamados = []
+
+    def worker():
+        sesion = SessionLocal()
+        try:
+            barrera.wait()
+            while True:
+                lote = _reclamar_eventos(sesion)
+                if not lote:
+                    break
+                reclamados.extend(e.id_evento_stripe for e in lote)
+        finally:
+            sesion.close()
+
+    hilos = [threading.Thread(target=worker) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(reclamados) == sorted(f"evt_{i}" for i in range(30))
+
+def test_un_fallo_programa_el_reintento(monkeypatch, cliente, db, catalogo):
+    def fallar(db, objeto):
+        raise RuntimeError("fallo de prueba")
+    monkeypatch.setitem(webhooks.MANEJADORES, "prueba.evento", fallar)
+    _recibir(cliente, "evt_1")
+
+    assert procesar_eventos_pendientes() == 0
+    evento = _eventos(db)["evt_1"]
+    assert (evento.estado, evento.intentos, evento.error) == ("pendiente", 1, "fallo de prueba")
+    # Primer reintento a los 5 segundos, con un 20 % de aleatoriedad
+    espera = evento.proximo_intento - datetime.utcnow()
+    assert timedelta(seconds=3) < espera <= timedelta(seconds=6)
+    # Nada de lo que hizo el intento fallido queda registrado
+    assert db.query(models.EventoProcesado).count() == 0
+
+    # Cuando el manejador vuelve a funcionar, el reintento lo procesa
+    monkeypatch.setitem(webhooks.MANEJADORES, "prueba.evento", lambda db, objeto: [])
+    evento.proximo_intento = datetime.utcnow()
+    db.commit()
+    assert procesar_eventos_pendientes() == 1
+    evento = _eventos(db)["evt_1"]
+    assert (evento.estado, evento.intentos, evento.error) == ("procesado", 2, None)
+
+@pytest.mark.parametrize("intentos, retraso", [(1, 5), (2, 10), (4, 40), (20, 60 * 60)])
+def test_espera_exponencial_acotada(intentos, retraso):
+    espera = webhooks._retraso_reintento(intentos).total_seconds()
+    assert retraso * 0.8 <= espera <= retraso * 1.2
+
+def test_agotar_los_intentos_marca_el_evento_fallido(monkeypatch, cliente, db, catalogo):
+    monkeypatch.setitem(webhooks.MANEJADORES, "prueba.evento", lambda db, objeto: 1 / 0)
+    _recibir(cliente, "evt_1")
+    evento = _eventos(db)["evt_1"]
+    evento.intentos = webhooks.MAX_INTENTOS - 1
+    db.commit()
+    procesar_eventos_pendientes()
+    evento = _eventos(db)["evt_1"]
+    assert (evento.estado, evento.intentos) == ("fallido", webhooks.MAX_INTENTOS)
+    evento.proximo_intento = datetime.utcnow()
+    db.commit()
+    assert _reclamar_eventos(db) == []
+
+def test_tipos_sin_manejador_se_marcan_procesados(cliente, db, catalogo):
+    _recibir(cliente, "evt_1", tipo="customer.created")
+    assert procesar_eventos_pendientes() == 1
+    assert _eventos(db)["evt_1"].estado == "procesado"
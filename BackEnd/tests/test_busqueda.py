@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+
+import models
+from busqueda import filtrar_texto
+from paginacion import CABECERA_TOTAL
+
+def _nombres(respuesta):
+    return [p["nombre"] for p in respuesta.json()]
+
+def test_busqueda_por_prefijo_y_sin_tildes(cliente, catalogo):
+    respuesta = cliente.get("/productos/search", params={"q": "zeld"})
+    assert respuesta.status_code == 200
+    assert set(_nombres(respuesta)) == {"The Legend of Zelda", "Zelda Link's Awakening"}
+    assert respuesta.headers[CABECERA_TOTAL] == "2"
+    assert _nombres(cliente.get("/productos/search", params={"q": "epica"})) == ["The Legend of Zelda"]
+
+def test_filtros_de_precio_y_stock(cliente, catalogo):
+    respuesta = cliente.get("/productos/search", params={"precio_min": 45, "en_stock": True, "orden": "precio-asc"})
+    assert _nombres(respuesta) == ["The Legend of Zelda", "Forza"]
+
+def test_filtro_por_categoria(cliente, catalogo):
+    id_categoria = catalogo["categorias"][1].id_categoria
+    respuesta = cliente.get("/productos/search", params={"id_categoria": id_categoria, "orden": "nombre"})
+    assert _nombres(respuesta) == ["Forza", "Mario Kart"]
+
+def test_el_indice_sigue_los_cambios_de_nombre(cliente, db, catalogo):
+    producto = catalogo["productos"][3]
+    producto.nombre = "Gran Turismo"
+    db.commit()
+    assert _nombres(cliente.get("/productos/search", params={"q": "turismo"})) == ["Gran Turismo"]
+    assert _nombres(cliente.get("/productos/search", params={"q": "forza"})) == []
+
+def test_paginacion_de_resultados(cliente, catalogo):
+    primera = cliente.get("/productos/search", params={"orden": "nombre", "limit": 2})
+    segunda = cliente.get("/productos/search", params={"orden": "nombre", "limit": 2, "skip": 2})
+    assert primera.headers[CABECERA_TOTAL] == "4"
+    assert len(set(_nombres(primera)) | set(_nombres(segunda))) == 4
+
+# "%" y "_" se buscan literalmente, no como comodines
+@pytest.mark.parametrize("termino, esperados", [
+    ("%", []),
+    ("_", []),
+    ("zelda%", []),
+    ("Mario_Kart", []),
+    ("Link's", ["Zelda Link's Awakening"]),
+])
+def test_comodines_escapados_en_like(db, catalogo, termino, esperados):
+    consulta, _ = filtrar_texto(db.query(models.Producto), "otro", termino)
+    assert [p.nombre for p in consulta] == esperados
+
+def test_comodines_escapados_en_postgres(db):
+    consulta, _ = filtrar_texto(db.query(models.Producto), "postgresql", "50%_\\")
+    sql = consulta.statement.compile(dialect=postgresql.dialect())
+    assert "%50\\%\\_\\\\%" in sql.params.values()
+    assert "ESCAPE" in str(sql)
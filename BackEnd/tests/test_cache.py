@@ -0,0 +1,54 @@
+import time
+
+from cache import CacheLRU, cache_catalogo
+
+def test_lru_expulsa_la_entrada_menos_usada():
+    cache = CacheLRU("prueba", max_entradas=2)
+    cache.guardar("a", 1)
+    cache.guardar("b", 2)
+    cache.obtener("a")
+    cache.guardar("c", 3)
+    assert cache.obtener("b") == (False, None)
+    assert cache.obtener("a") == (True, 1)
+    assert cache.expulsiones == 1
+
+def test_las_entradas_caducan():
+    cache = CacheLRU("prueba", ttl=0.01)
+    cache.guardar("a", 1)
+    time.sleep(0.02)
+    assert cache.obtener("a") == (False, None)
+
+# Un valor calculado antes de una invalidación no debe quedarse en la caché
+def test_guardar_con_generacion_antigua_se_descarta():
+    cache = CacheLRU("prueba")
+    generacion = cache.generacion
+    cache.invalidar("a")
+    cache.guardar("a", "obsoleto", generacion)
+    assert cache.obtener("a") == (False, None)
+
+def test_invalidar_prefijo():
+    cache = CacheLRU("prueba")
+    cache.guardar(("productos", 0), 1)
+    cache.guardar(("producto", 1), 2)
+    cache.invalidar_prefijo("productos")
+    assert cache.obtener(("productos", 0)) == (False, None)
+    assert cache.obtener(("producto", 1)) == (True, 2)
+
+def test_la_escritura_invalida_la_ficha_cacheada(cliente, catalogo):
+    producto = catalogo["productos"][0]
+    assert cliente.get(f"/productos/{producto.id_producto}").json()["cantidad"] == 10
+    aciertos = cache_catalogo.aciertos
+    cliente.get(f"/productos/{producto.id_producto}")
+    assert cache_catalogo.aciertos == aciertos + 1
+
+    cuerpo = {
+        "nombre": producto.nombre, "descripción": producto.descripción, "precio": producto.precio,
+        "cantidad": 7, "id_categoria": producto.id_categoria, "id_proveedor": producto.id_proveedor,
+    }
+    assert cliente.put(f"/productos/{producto.id_producto}", json=cuerpo).status_code == 200
+    assert cliente.get(f"/productos/{producto.id_producto}").json()["cantidad"] == 7
+
+def test_la_escritura_invalida_los_listados_de_categorias(cliente, catalogo):
+    assert len(cliente.get("/categorias/").json()) == 2
+    cliente.post("/categorias/", json={"nombre": "Puzles"})
+    assert len(cliente.get("/categorias/").json()) == 3
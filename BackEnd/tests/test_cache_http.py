@@ -0,0 +1,66 @@
+import cache_http
+import models
+from cache import cache_catalogo, invalidar_categorias
+
+def test_etag_debil_y_304(cliente, catalogo):
+    respuesta = cliente.get("/productos/")
+    etag = respuesta.headers["etag"]
+    assert etag.startswith('W/"')
+    assert "accept-encoding" in respuesta.headers["vary"].lower()
+
+    no_modificado = cliente.get("/productos/", headers={"If-None-Match": etag})
+    assert no_modificado.status_code == 304
+    assert no_modificado.headers["etag"] == etag
+    assert no_modificado.headers["vary"] == "Accept-Encoding"
+    # Comparación débil: también vale la etiqueta sin el prefijo W/
+    assert cliente.get("/productos/", headers={"If-None-Match": etag[2:]}).status_code == 304
+
+def test_misma_etiqueta_con_y_sin_compresion(cliente, catalogo):
+    comprimida = cliente.get("/productos/", headers={"Accept-Encoding": "gzip"})
+    plana = cliente.get("/productos/", headers={"Accept-Encoding": "identity"})
+    assert comprimida.headers.get("content-encoding") in ("gzip", "br")
+    assert "content-encoding" not in plana.headers
+    assert comprimida.headers["etag"] == plana.headers["etag"]
+    # La compresión ya añade Vary: no se repite
+    assert comprimida.headers["vary"].lower().count("accept-encoding") == 1
+
+def test_un_cambio_en_el_catalogo_cambia_la_etiqueta(cliente, catalogo):
+    etag = cliente.get("/categorias/").headers["etag"]
+    cliente.post("/categorias/", json={"nombre": "Puzles"})
+    respuesta = cliente.get("/categorias/", headers={"If-None-Match": etag})
+    assert respuesta.status_code == 200
+    assert respuesta.headers["etag"] != etag
+
+def test_el_304_lleva_cabeceras_cors(cliente, catalogo):
+    etag = cliente.get("/productos/").headers["etag"]
+    respuesta = cliente.get("/productos/", headers={"If-None-Match": etag, "Origin": "http://localhost:5173"})
+    assert respuesta.status_code == 304
+    assert respuesta.headers["access-control-allow-origin"] == "*"
+
+# Un worker recién arrancado (sin caché ni versión vista) da el mismo ETag: la
+# versión está en la base de datos y no depende del proceso ni de la hora
+def test_la_etiqueta_no_depende_del_worker(monkeypatch, cliente, catalogo):
+    invalidar_categorias()
+    respuesta = cliente.get("/categorias/")
+    monkeypatch.setattr(cache_http, "_version_vista", None)
+    cache_catalogo.limpiar()
+    otra = cliente.get("/categorias/", headers={"If-None-Match": respuesta.headers["etag"]})
+    assert otra.status_code == 304
+    assert otra.headers["last-modified"] == respuesta.headers["last-modified"]
+    assert cliente.get("/categorias/", headers={
+        "If-Modified-Since": respuesta.headers["last-modified"],
+    }).status_code == 304
+
+# Un cambio hecho por otro worker solo llega aquí a través de la versión
+# compartida: cambia la etiqueta y se vacía la caché local
+def test_cambio_hecho_en_otro_worker(cliente, db, catalogo):
+    invalidar_categorias()
+    respuesta = cliente.get("/categorias/")
+    categoria = catalogo["categorias"][0]
+    categoria.nombre = "Aventura gráfica"
+    db.query(models.VersionCatalogo).update({"version": models.VersionCatalogo.version + 1})
+    db.commit()
+
+    nueva = cliente.get("/categorias/", headers={"If-None-Match": respuesta.headers["etag"]})
+    assert nueva.status_code == 200
+    assert "Aventura gráfica" in [c["nombre"] for c in nueva.json()]
@@ -0,0 +1,64 @@
+import pytest
+
+import models
+from auth import jwt as auth_jwt
+from auth.jwt import cache_usuarios, invalidar_usuario
+
+# Cuenta las búsquedas del usuario en la base de datos; `durante` se ejecuta en
+# mitad de la búsqueda para simular un cambio concurrente
+@pytest.fixture
+def busquedas(monkeypatch):
+    busquedas = {"total": 0, "durante": None}
+    original = auth_jwt.get_user_async
+    async def buscar(db, email):
+        busquedas["total"] += 1
+        usuario = await original(db, email)
+        if busquedas["durante"]:
+            busquedas["durante"]()
+        return usuario
+    monkeypatch.setattr(auth_jwt, "get_user_async", buscar)
+    return busquedas
+
+def _yo(cliente, cabeceras):
+    return cliente.get("/users/me", headers=cabeceras)
+
+def _editar(cliente, db, **cambios):
+    usuario = db.query(models.Usuario).filter_by(email="cliente@example.com").one()
+    datos = {
+        "nombre": usuario.nombre, "email": usuario.email, "id_rol": usuario.id_rol,
+        "telefono": "600123456", "is_active": usuario.is_active, **cambios,
+    }
+    assert cliente.put(f"/usuarios/{usuario.id_usuario}", json=datos).status_code == 200
+
+def test_peticiones_seguidas_no_consultan_la_base_de_datos(cliente, cabeceras, busquedas):
+    for _ in range(3):
+        assert _yo(cliente, cabeceras).json()["email"] == "cliente@example.com"
+    assert busquedas["total"] == 1
+    # Se guarda el esquema público, sin el hash de la contraseña
+    encontrado, usuario = cache_usuarios.obtener("cliente@example.com")
+    assert encontrado and not hasattr(usuario, "contraseña")
+
+def test_editar_el_usuario_invalida_la_cache(cliente, db, cabeceras, busquedas):
+    _yo(cliente, cabeceras)
+    _editar(cliente, db, nombre="Renombrado")
+    assert _yo(cliente, cabeceras).json()["nombre"] == "Renombrado"
+    assert busquedas["total"] == 2
+    # Desactivarlo surte efecto en la siguiente petición, sin esperar al TTL
+    _editar(cliente, db, is_active=False)
+    assert _yo(cliente, cabeceras).status_code == 400
+
+def test_borrar_el_usuario_invalida_la_cache(cliente, db, cabeceras):
+    _yo(cliente, cabeceras)
+    usuario = db.query(models.Usuario).filter_by(email="cliente@example.com").one()
+    assert cliente.delete(f"/usuarios/{usuario.id_usuario}").status_code == 204
+    assert _yo(cliente, cabeceras).status_code == 401
+
+# Un usuario leído antes de una invalidación no se guarda: podría estar desfasado
+def test_lectura_concurrente_con_una_invalidacion(cliente, cabeceras, busquedas):
+    busquedas["durante"] = lambda: invalidar_usuario("cliente@example.com")
+    assert _yo(cliente, cabeceras).status_code == 200
+    assert cache_usuarios.obtener("cliente@example.com") == (False, None)
+    busquedas["durante"] = None
+    _yo(cliente, cabeceras)
+    _yo(cliente, cabeceras)
+    assert busquedas["total"] == 2
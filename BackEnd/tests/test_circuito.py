@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+import stripe
+from fastapi import HTTPException
+
+import models
+from payment import circuito, stripe_utils
+from payment.circuito import Circuito, CircuitoAbierto
+
+# Reloj manual para recorrer la ventana y la espera sin dormir
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(circuito.time, "monotonic", reloj)
+    return reloj
+
+def _circuito(**opciones) -> Circuito:
+    return Circuito("prueba", **{"umbral_fallos": 0.5, "minimo_llamadas": 4, "ventana": 30, "espera": 20, **opciones})
+
+def test_se_abre_al_superar_el_umbral(reloj):
+    c = _circuito()
+    for _ in range(3):
+        c.registrar_fallo()
+    # Con menos llamadas que el mínimo no se abre aunque todas fallen
+    c.permitir()
+    c.registrar_exito()
+    assert c.estadisticas()["estado"] == "cerrado"
+    c.registrar_fallo()
+    assert c.abierto()
+    with pytest.raises(CircuitoAbierto) as error:
+        c.permitir()
+    assert error.value.reintentar_en == 20
+    assert c.reintentar_en() == 20
+    assert c.estadisticas()["rechazadas"] == 1
+
+def test_los_fallos_antiguos_salen_de_la_ventana(reloj):
+    c = _circuito()
+    for _ in range(3):
+        c.registrar_fallo()
+    reloj.ahora += 31
+    c.registrar_fallo()
+    c.registrar_exito()
+    assert c.estadisticas() == {
+        "estado": "cerrado", "llamadas_ventana": 2, "fallos_ventana": 1, "rechazadas": 0, "aperturas": 0,
+    }
+
+def test_semiabierto_deja_pasar_una_sola_prueba(reloj):
+    c = _circuito(minimo_llamadas=1)
+    c.registrar_fallo()
+    reloj.ahora += 20
+    assert not c.abierto()
+    c.permitir()
+    with pytest.raises(CircuitoAbierto):
+        c.permitir()
+    # La prueba falla: vuelve a abrirse con la espera completa
+    c.registrar_fallo()
+    assert c.abierto() and c.reintentar_en() == 20
+    reloj.ahora += 20
+    c.permitir()
+    c.registrar_exito()
+    assert c.estadisticas()["estado"] == "cerrado"
+    c.permitir()
+
+def test_prueba_unica_con_llamadas_concurrentes(reloj):
+    c = _circuito(minimo_llamadas=1)
+    c.registrar_fallo()
+    reloj.ahora += 20
+    barrera = threading.Barrier(8)
+    admitidas = []
+
+    def llamar():
+        barrera.wait()
+        try:
+            c.permitir()
+            admitidas.append(True)
+        except CircuitoAbierto:
+            pass
+
+    hilos = [threading.Thread(target=llamar) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert admitidas == [True]
+
+@pytest.fixture
+def circuito_stripe(monkeypatch):
+    c = _circuito(minimo_llamadas=2, umbral_fallos=0.6)
+    monkeypatch.setattr(stripe_utils, "circuito_stripe", c)
+    return c
+
+def _caido():
+    raise stripe.APIConnectionError("sin red")
+
+def _peticion_invalida():
+    raise stripe.InvalidRequestError("No such price", "price")
+
+# Los errores de red dan 503 y cuentan como fallo; los de la petición dan 400 y no
+def test_llamar_stripe_clasifica_los_errores(circuito_stripe):
+    with pytest.raises(HTTPException) as error:
+        stripe_utils.llamar_stripe("Error de prueba", _peticion_invalida)
+    assert error.value.status_code == 400
+    assert error.value.detail.startswith("Error de prueba: ")
+
+    with pytest.raises(HTTPException) as error:
+        stripe_utils.llamar_stripe("Error de prueba", _caido)
+    assert error.value.status_code == 503
+    assert not circuito_stripe.abierto()
+    with pytest.raises(HTTPException):
+        stripe_utils.llamar_stripe("Error de prueba", _caido)
+    assert circuito_stripe.abierto()
+
+    # Abierto: se responde 503 con Retry-After sin llegar a llamar
+    llamadas = []
+    with pytest.raises(HTTPException) as error:
+        stripe_utils.llamar_stripe("Error de prueba", lambda: llamadas.append(1))
+    assert error.value.status_code == 503
+    assert int(error.value.headers["Retry-After"]) >= 1
+    assert llamadas == []
+
+# Con el circuito abierto el checkout falla antes de reservar stock
+def test_checkout_con_el_circuito_abierto(cliente, db, catalogo, cabeceras, circuito_stripe):
+    for _ in range(2):
+        circuito_stripe.registrar_fallo()
+    zelda = catalogo["productos"][0].id_producto
+    respuesta = cliente.post("/crear-sesion-pago", headers=cabeceras, json=[{"id_producto": zelda, "cantidad": 1}])
+    assert respuesta.status_code == 503
+    assert "Retry-After" in respuesta.headers
+    assert db.query(models.Compra).count() == 0
+    assert db.query(models.ReservaStock).count() == 0
@@ -0,0 +1,87 @@
+import pytest
+import stripe
+
+from payment import cliente_stripe as modulo
+from payment.cliente_stripe import ClienteStripe
+
+# Reloj manual: dormir solo avanza el reloj
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+    def dormir(self, segundos):
+        self.ahora += segundos
+
+# Cliente real con las llamadas a Stripe sustituidas: cada intento consume
+# `duracion` segundos y devuelve o lanza lo siguiente de `respuestas`
+@pytest.fixture
+def llamadas(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(modulo.time, "monotonic", reloj)
+    monkeypatch.setattr(modulo.time, "sleep", reloj.dormir)
+    monkeypatch.setattr(modulo.random, "uniform", lambda a, b: b)
+    llamadas = {"reloj": reloj, "duracion": 0, "respuestas": [], "intentos": []}
+
+    class StripeClientFalso:
+        def __init__(self, timeout):
+            self.timeout = timeout
+            self.prices = self
+
+        def create(self, params, options):
+            llamadas["intentos"].append((self.timeout, options.get("idempotency_key")))
+            reloj.ahora += llamadas["duracion"]
+            respuesta = llamadas["respuestas"].pop(0)
+            if isinstance(respuesta, Exception):
+                raise respuesta
+            return respuesta
+
+        retrieve = lambda self, id_precio: self.create({}, {})
+
+    cliente = ClienteStripe("sk_test")
+    monkeypatch.setattr(cliente, "_stripe", lambda timeout: StripeClientFalso(max(1, int(timeout))))
+    llamadas["cliente"] = cliente
+    yield llamadas
+    cliente.cerrar()
+
+def _error_de_red():
+    return stripe.APIConnectionError("Connection reset", should_retry=True)
+
+def test_reintenta_con_la_misma_clave_de_idempotencia(monkeypatch, llamadas):
+    monkeypatch.setitem(modulo.LIMITES_OPERACION, "crear_precio", (10, 2))
+    llamadas["respuestas"] = [_error_de_red(), stripe.APIError("Internal", http_status=500), "precio"]
+    assert llamadas["cliente"].crear_precio("prod_1", 5999) == "precio"
+    claves = [clave for _, clave in llamadas["intentos"]]
+    assert len(claves) == 3 and len(set(claves)) == 1 and claves[0]
+    # Con clave propia se usa esa
+    llamadas["respuestas"] = ["precio"]
+    llamadas["cliente"].crear_precio("prod_1", 5999, clave_idempotencia="precio-1")
+    assert llamadas["intentos"][-1][1] == "precio-1"
+
+# El plazo es de toda la operación: cada intento solo dispone de lo que queda,
+# y no se reintenta si no da tiempo a esperar y volver a intentar
+def test_el_plazo_incluye_los_reintentos(monkeypatch, llamadas):
+    monkeypatch.setitem(modulo.LIMITES_OPERACION, "crear_precio", (10, 5))
+    llamadas["duracion"] = 3
+    llamadas["respuestas"] = [_error_de_red() for _ in range(5)]
+    inicio = llamadas["reloj"].ahora
+    with pytest.raises(stripe.APIConnectionError):
+        llamadas["cliente"].crear_precio("prod_1", 5999)
+    # 0-3s, espera 0.5s, 3.5-6.5s, espera 1s, 7.5-10s (el tiempo que queda)
+    assert [timeout for timeout, _ in llamadas["intentos"]] == [10, 6, 2]
+    assert llamadas["reloj"].ahora - inicio <= 10.5
+
+def test_no_se_reintentan_los_errores_del_cliente(llamadas):
+    llamadas["respuestas"] = [stripe.InvalidRequestError("No such product", "product", http_status=400)]
+    with pytest.raises(stripe.InvalidRequestError):
+        llamadas["cliente"].crear_precio("prod_1", 5999)
+    assert len(llamadas["intentos"]) == 1
+
+def test_lecturas_sin_clave_y_con_limite_de_reintentos(monkeypatch, llamadas):
+    monkeypatch.setitem(modulo.LIMITES_OPERACION, "obtener_precio", (60, 2))
+    llamadas["respuestas"] = [_error_de_red() for _ in range(4)]
+    with pytest.raises(stripe.APIConnectionError):
+        llamadas["cliente"].obtener_precio("price_1")
+    assert [clave for _, clave in llamadas["intentos"]] == [None] * 3
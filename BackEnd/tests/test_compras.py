@@ -0,0 +1,102 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+import models
+from cache import invalidar_productos
+from database import engine
+
+# Cuenta las sentencias SQL que llegan a la base de datos
+@contextmanager
+def contar_sentencias():
+    sentencias = []
+    def registrar(conn, cursor, sql, parametros, contexto, executemany):
+        sentencias.append(sql)
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        yield sentencias
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+def _id_usuario(db) -> int:
+    return db.query(models.Usuario.id_usuario).filter_by(email="cliente@example.com").scalar()
+
+def _comprar(cliente, id_usuario, lineas):
+    return cliente.post("/compras/", json={
+        "id_usuario": id_usuario,
+        "total": sum(cantidad * precio for _, cantidad, precio in lineas),
+        "detalles": [
+            {"id_producto": id_producto, "cantidad": cantidad, "precio_unitario": precio}
+            for id_producto, cantidad, precio in lineas
+        ],
+    })
+
+def test_crear_compra_con_varias_lineas(cliente, db, catalogo, cabeceras):
+    zelda, _, awakening, forza = catalogo["productos"]
+    respuesta = _comprar(cliente, _id_usuario(db), [
+        (zelda.id_producto, 1, 59.99), (awakening.id_producto, 2, 39.99), (forza.id_producto, 1, 69.99),
+    ])
+    assert respuesta.status_code == 201, respuesta.text
+    compra = respuesta.json()
+    assert sorted((d["id_producto"], d["cantidad"]) for d in compra["detalles"]) == sorted([
+        (zelda.id_producto, 1), (awakening.id_producto, 2), (forza.id_producto, 1),
+    ])
+    assert db.query(models.DetalleCompra).filter_by(id_compra=compra["id_compra"]).count() == 3
+
+# Un carrito grande cuesta las mismas sentencias que uno de una sola línea
+def test_las_sentencias_no_crecen_con_las_lineas(cliente, db, catalogo, cabeceras):
+    zelda, _, awakening, forza = [p.id_producto for p in catalogo["productos"]]
+    id_usuario = _id_usuario(db)
+    # La fila de la versión del catálogo se crea con el primer cambio: que exista ya
+    invalidar_productos()
+    with contar_sentencias() as una_linea:
+        assert _comprar(cliente, id_usuario, [(zelda, 1, 59.99)]).status_code == 201
+    with contar_sentencias() as tres_lineas:
+        assert _comprar(cliente, id_usuario, [
+            (zelda, 1, 59.99), (awakening, 1, 39.99), (forza, 1, 69.99),
+        ]).status_code == 201
+    assert len(tres_lineas) == len(una_linea)
+
+# Una compra en cada estado, con una línea del primer producto
+def _compras_por_estado(db, catalogo) -> dict:
+    id_usuario = _id_usuario(db)
+    zelda = catalogo["productos"][0]
+    compras = {}
+    for estado in ("pagada", "pendiente", "cancelada"):
+        compra = models.Compra(id_usuario=id_usuario, total=59.99, estado=estado)
+        compra.detalles = [models.DetalleCompra(id_producto=zelda.id_producto, cantidad=1, precio_unitario=59.99)]
+        db.add(compra)
+        db.flush()
+        compras[estado] = compra.id_compra
+    db.commit()
+    return compras
+
+def test_listado_solo_compras_pagadas_por_defecto(cliente, db, catalogo, cabeceras):
+    compras = _compras_por_estado(db, catalogo)
+    respuesta = cliente.get("/compras/")
+    assert [(c["id_compra"], c["estado"]) for c in respuesta.json()] == [(compras["pagada"], "pagada")]
+
+    pendientes = cliente.get("/compras/", params={"estado": "pendiente"}).json()
+    assert [c["id_compra"] for c in pendientes] == [compras["pendiente"]]
+    todas = cliente.get("/compras/", params={"estado": "todas"}).json()
+    assert {c["estado"] for c in todas} == {"pagada", "pendiente", "cancelada"}
+    assert cliente.get("/compras/", params={"estado": "otra"}).status_code == 422
+
+def test_exportacion_filtra_por_estado(cliente, db, catalogo, cabeceras, cabeceras_admin):
+    compras = _compras_por_estado(db, catalogo)
+    def exportar(**params):
+        filas = cliente.get("/compras/exportar", params=params, headers=cabeceras_admin).text.strip().splitlines()
+        return sorted((int(f.split(",")[0]), f.split(",")[2]) for f in filas[1:])
+    assert exportar() == [(compras["pagada"], "pagada")]
+    assert exportar(estado="cancelada") == [(compras["cancelada"], "cancelada")]
+    assert exportar(estado="todas") == sorted((i, e) for e, i in compras.items())
+
+# El historial y el resumen del cliente cuentan las mismas compras
+def test_historial_y_resumen_con_la_misma_regla(cliente, db, catalogo, cabeceras):
+    compras = _compras_por_estado(db, catalogo)
+    id_usuario = _id_usuario(db)
+    historial = cliente.get(f"/compras/usuario/{id_usuario}/historial").json()
+    resumen = cliente.get(f"/compras/usuario/{id_usuario}/resumen").json()
+    assert [c["id_compra"] for c in historial] == [compras["pagada"]]
+    assert historial[0]["detalles"][0]["producto"]["nombre"] == "The Legend of Zelda"
+    assert resumen == {"numero_compras": len(historial), "total_gastado": sum(c["total"] for c in historial)}
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import aiosmtplib
+import pytest
+
+import correo
+import models
+from correo import ConexionSMTP, _reclamar_correos, encolar_correo, enviar_correos_pendientes, tareas_correo
+
+# Servidor SMTP de mentira: `fallos` asigna a un destinatario el error que
+# devuelve al enviarle
+@pytest.fixture
+def smtp(monkeypatch):
+    smtp = {"enviados": [], "fallos": {}}
+    async def enviar(mensaje):
+        error = smtp["fallos"].get(mensaje["To"])
+        if error:
+            raise error
+        smtp["enviados"].append(mensaje)
+    async def sin_esperar():
+        pass
+    monkeypatch.setattr(correo.conexion_smtp, "enviar", enviar)
+    monkeypatch.setattr(correo.ritmo_smtp, "esperar", sin_esperar)
+    monkeypatch.setattr(correo, "SMTP_REMITENTE", "tienda@example.com")
+    return smtp
+
+def _encolar(db, *destinatarios):
+    for destinatario in destinatarios:
+        encolar_correo(db, destinatario, "Asunto", "Cuerpo")
+    db.commit()
+
+def _correos(db) -> dict:
+    db.expire_all()
+    return {c.destinatario: c for c in db.query(models.CorreoSaliente)}
+
+def _enviar() -> int:
+    return asyncio.run(enviar_correos_pendientes())
+
+def test_envia_la_bandeja(db, smtp):
+    _encolar(db, "a@example.com", "b@example.com")
+    assert _enviar() == 2
+    assert [m["To"] for m in smtp["enviados"]] == ["a@example.com", "b@example.com"]
+    assert smtp["enviados"][0]["From"] == "tienda@example.com"
+    assert {(c.estado, c.intentos) for c in _correos(db).values()} == {("enviado", 1)}
+    assert all(c.enviado_en for c in _correos(db).values())
+    assert _enviar() == 0
+
+def test_reclamar_retiene_el_correo_hasta_que_vence_el_bloqueo(db):
+    _encolar(db, "a@example.com")
+    assert [(c.destinatario, c.intentos) for c in _reclamar_correos()] == [("a@example.com", 1)]
+    assert _correos(db)["a@example.com"].estado == "enviando"
+    assert _reclamar_correos() == []
+    # Si el worker se cae, el correo se retoma al vencer el bloqueo
+    _correos(db)["a@example.com"].proximo_intento = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    assert [c.intentos for c in _reclamar_correos()] == [2]
+
+def test_reclamos_concurrentes_no_se_solapan(db):
+    _encolar(db, *[f"{i}@example.com" for i in range(50)])
+    barrera = threading.Barrier(4)
+    reclamados = []
+
+    def worker():
+        barrera.wait()
+        while True:
+            lote = _reclamar_correos()
+            if not lote:
+                break
+            reclamados.extend(c.id_correo for c in lote)
+
+    hilos = [threading.Thread(target=worker) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert len(reclamados) == len(set(reclamados)) == 50
+
+# Un rechazo definitivo no se reintenta; uno temporal sí, con espera. El resto del
+# lote se envía igualmente
+def test_rechazos_definitivos_y_temporales(db, smtp):
+    smtp["fallos"] = {
+        "no-existe@example.com": aiosmtplib.SMTPResponseException(550, "No such user"),
+        "lleno@example.com": aiosmtplib.SMTPResponseException(452, "Mailbox full"),
+    }
+    _encolar(db, "no-existe@example.com", "lleno@example.com", "a@example.com")
+    assert _enviar() == 1
+    correos = _correos(db)
+    assert correos["no-existe@example.com"].estado == "fallido"
+    assert (correos["lleno@example.com"].estado, correos["lleno@example.com"].intentos) == ("pendiente", 1)
+    assert "Mailbox full" in correos["lleno@example.com"].error
+    espera = correos["lleno@example.com"].proximo_intento - datetime.utcnow()
+    assert timedelta(seconds=20) < espera <= timedelta(seconds=36)
+    assert correos["a@example.com"].estado == "enviado"
+
+def test_agotar_los_intentos_marca_el_correo_fallido(db, smtp):
+    smtp["fallos"] = {"lleno@example.com": aiosmtplib.SMTPResponseException(452, "Mailbox full")}
+    _encolar(db, "lleno@example.com")
+    _correos(db)["lleno@example.com"].intentos = correo.MAX_INTENTOS - 1
+    db.commit()
+    _enviar()
+    assert _correos(db)["lleno@example.com"].estado == "fallido"
+
+# Sin conexión se deja el lote entero para más tarde en lugar de probar correo a correo
+def test_un_error_de_conexion_detiene_el_lote(db, smtp):
+    smtp["fallos"] = {"a@example.com": aiosmtplib.SMTPConnectError("Connection refused")}
+    _encolar(db, "a@example.com", "b@example.com", "c@example.com")
+    assert _enviar() == 0
+    assert smtp["enviados"] == []
+    correos = _correos(db)
+    # Sin contar como intento
+    assert {(c.estado, c.intentos) for c in correos.values()} == {("pendiente", 0)}
+    assert all(c.proximo_intento > datetime.utcnow() for c in correos.values())
+
+# Las caídas del servidor no agotan los intentos de los correos
+def test_un_error_de_conexion_no_gasta_intentos(db, smtp):
+    smtp["fallos"] = {"a@example.com": aiosmtplib.SMTPConnectError("Connection refused")}
+    _encolar(db, "a@example.com")
+    _correos(db)["a@example.com"].intentos = correo.MAX_INTENTOS - 1
+    db.commit()
+    for _ in range(3):
+        _enviar()
+        _correos(db)["a@example.com"].proximo_intento = datetime.utcnow()
+        db.commit()
+    pendiente = _correos(db)["a@example.com"]
+    assert (pendiente.estado, pendiente.intentos) == ("pendiente", correo.MAX_INTENTOS - 1)
+    smtp["fallos"] = {}
+    assert _enviar() == 1
+
+# Cliente SMTP de mentira para la conexión persistente
+class SMTPFalso:
+    instancias = []
+
+    def __init__(self, **opciones):
+        self.opciones = opciones
+        self.is_connected = False
+        self.enviados = 0
+        self.desconectar = False
+        SMTPFalso.instancias.append(self)
+
+    async def connect(self):
+        self.is_connected = True
+
+    async def send_message(self, mensaje):
+        if self.desconectar:
+            self.is_connected = False
+            raise aiosmtplib.SMTPServerDisconnected("Connection lost")
+        self.enviados += 1
+
+    async def quit(self):
+        self.is_connected = False
+
+@pytest.fixture
+def smtp_falso(monkeypatch):
+    SMTPFalso.instancias = []
+    monkeypatch.setattr(correo.aiosmtplib, "SMTP", SMTPFalso)
+    return SMTPFalso
+
+def test_la_conexion_se_reutiliza_y_se_reabre(monkeypatch, smtp_falso):
+    monkeypatch.setattr(correo, "SMTP_USUARIO", "tienda@example.com")
+    monkeypatch.setattr(correo, "SMTP_PASSWORD", "contraseña")
+    conexion = ConexionSMTP()
+
+    async def enviar_varios():
+        for _ in range(3):
+            await conexion.enviar(correo.EmailMessage())
+        # El servidor cerró la conexión: se reabre y se reintenta una vez
+        smtp_falso.instancias[-1].desconectar = True
+        await conexion.enviar(correo.EmailMessage())
+        await conexion.cerrar()
+
+    asyncio.run(enviar_varios())
+    assert conexion.conexiones == 2
+    assert [s.enviados for s in smtp_falso.instancias] == [3, 1]
+    assert smtp_falso.instancias[0].opciones["username"] == "tienda@example.com"
+    assert not smtp_falso.instancias[1].is_connected
+
+def test_sin_autenticacion_no_se_inicia_sesion(monkeypatch, smtp_falso):
+    monkeypatch.setattr(correo, "SMTP_USUARIO", "tienda@example.com")
+    monkeypatch.setattr(correo, "SMTP_SIN_AUTENTICACION", True)
+    asyncio.run(ConexionSMTP().enviar(correo.EmailMessage()))
+    assert smtp_falso.instancias[0].opciones["username"] is None
+    assert smtp_falso.instancias[0].opciones["password"] is None
+
+# Sin credenciales el worker no arranca
+@pytest.mark.parametrize("usuario, password, sin_autenticacion, remitente, arranca", [
+    (None, None, False, None, False),
+    ("tienda@example.com", None, False, "tienda@example.com", False),
+    ("tienda@example.com", "contraseña", False, "tienda@example.com", True),
+    (None, None, True, None, False),
+    (None, None, True, "tienda@example.com", True),
+])
+def test_tareas_segun_la_configuracion(monkeypatch, caplog, usuario, password, sin_autenticacion, remitente, arranca):
+    monkeypatch.setattr(correo, "SMTP_USUARIO", usuario)
+    monkeypatch.setattr(correo, "SMTP_PASSWORD", password)
+    monkeypatch.setattr(correo, "SMTP_SIN_AUTENTICACION", sin_autenticacion)
+    monkeypatch.setattr(correo, "SMTP_REMITENTE", remitente)
+    with caplog.at_level(logging.WARNING):
+        tareas = tareas_correo()
+    assert [nombre for nombre, _, _ in tareas] == (["enviar_correos"] if arranca else [])
+    assert ("Envío de correo desactivado" in caplog.text) != arranca
@@ -0,0 +1,37 @@
+import models
+from routers.detalles_compra import MAX_COMPRAS_LOTE
+
+def _compra(db, usuario, lineas) -> int:
+    compra = models.Compra(id_usuario=usuario, total=sum(c * p.precio for p, c in lineas))
+    compra.detalles = [
+        models.DetalleCompra(id_producto=p.id_producto, cantidad=c, precio_unitario=p.precio) for p, c in lineas
+    ]
+    db.add(compra)
+    db.commit()
+    return compra.id_compra
+
+def test_detalles_de_varias_compras_agrupados(cliente, db, catalogo, cabeceras):
+    zelda, _, awakening, forza = catalogo["productos"]
+    id_usuario = db.query(models.Usuario.id_usuario).scalar()
+    primera = _compra(db, id_usuario, [(zelda, 1), (forza, 2)])
+    segunda = _compra(db, id_usuario, [(awakening, 1)])
+    vacia = _compra(db, id_usuario, [])
+
+    respuesta = cliente.get("/detalles-compra/compras", params={"ids": [segunda, primera, vacia, primera]})
+    assert respuesta.status_code == 200
+    agrupados = respuesta.json()
+    assert list(agrupados) == [str(primera), str(segunda), str(vacia)]
+    assert [(d["producto_nombre"], d["categoria_nombre"], d["cantidad"]) for d in agrupados[str(primera)]] == [
+        ("The Legend of Zelda", "Aventura", 1), ("Forza", "Carreras", 2),
+    ]
+    assert [d["producto_nombre"] for d in agrupados[str(segunda)]] == ["Zelda Link's Awakening"]
+    assert agrupados[str(vacia)] == []
+
+def test_compras_inexistentes_salen_vacias(cliente, catalogo):
+    assert cliente.get("/detalles-compra/compras", params={"ids": [12345]}).json() == {"12345": []}
+
+def test_limite_de_compras_por_lote(cliente, catalogo):
+    ids = list(range(1, MAX_COMPRAS_LOTE + 2))
+    assert cliente.get("/detalles-compra/compras", params={"ids": ids}).status_code == 400
+    assert cliente.get("/detalles-compra/compras", params={"ids": ids[:-1]}).status_code == 200
+    assert cliente.get("/detalles-compra/compras").status_code == 422
@@ -0,0 +1,85 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+import stripe
+
+import models
+from payment import stripe_utils
+from payment.circuito import Circuito
+from payment.cliente_stripe import cliente as cliente_stripe
+from payment.estados_pago import ESTADO_PAGO_TTL, guardar_estado_pago
+from payment.webhooks import procesar_eventos_pendientes
+
+# Cuenta las consultas a Stripe; `fallar` simula que Stripe no responde. Los
+# fallos se anotan en un circuito propio para no afectar a otras pruebas
+@pytest.fixture
+def consultas(monkeypatch):
+    monkeypatch.setattr(stripe_utils, "circuito_stripe", Circuito("prueba"))
+    consultas = {"total": 0, "fallar": False}
+    original = cliente_stripe.obtener_intencion_pago
+    def obtener(id_intencion):
+        consultas["total"] += 1
+        if consultas["fallar"]:
+            raise stripe.APIConnectionError("sin red")
+        return original(id_intencion)
+    monkeypatch.setattr(cliente_stripe, "obtener_intencion_pago", obtener)
+    return consultas
+
+def _crear_intencion(cliente, cabeceras) -> str:
+    respuesta = cliente.post("/crear-intencion-pago", params={"monto": 59.99}, headers=cabeceras)
+    assert respuesta.status_code == 200, respuesta.text
+    return respuesta.json()["payment_intent_id"]
+
+def _envejecer(db, id_intencion):
+    db.query(models.EstadoPago).filter_by(id_intencion_pago=id_intencion).update(
+        {"actualizado_en": datetime.utcnow() - ESTADO_PAGO_TTL - timedelta(seconds=1)}
+    )
+    db.commit()
+
+def test_estado_reciente_sin_consultar_a_stripe(cliente, cabeceras, consultas):
+    id_intencion = _crear_intencion(cliente, cabeceras)
+    respuesta = cliente.get(f"/estado-pago/{id_intencion}", headers=cabeceras)
+    assert respuesta.json()["status"] == "requires_payment_method"
+    assert respuesta.json()["amount"] == 59.99
+    assert consultas["total"] == 0
+
+def test_estado_intermedio_antiguo_se_refresca(cliente, db, cabeceras, consultas):
+    id_intencion = _crear_intencion(cliente, cabeceras)
+    _envejecer(db, id_intencion)
+    cliente_stripe.intenciones[id_intencion]["status"] = "processing"
+    assert cliente.get(f"/estado-pago/{id_intencion}", headers=cabeceras).json()["status"] == "processing"
+    assert consultas["total"] == 1
+    # Ya está al día: la siguiente consulta sale de la base de datos
+    cliente.get(f"/estado-pago/{id_intencion}", headers=cabeceras)
+    assert consultas["total"] == 1
+
+def test_con_stripe_caido_se_sirve_el_estado_guardado(cliente, db, cabeceras, consultas):
+    id_intencion = _crear_intencion(cliente, cabeceras)
+    _envejecer(db, id_intencion)
+    consultas["fallar"] = True
+    respuesta = cliente.get(f"/estado-pago/{id_intencion}", headers=cabeceras)
+    assert respuesta.status_code == 200
+    assert respuesta.json()["status"] == "requires_payment_method"
+    # Sin nada guardado no hay estado que devolver
+    assert cliente.get("/estado-pago/pi_desconocido", headers=cabeceras).status_code == 503
+
+# El webhook deja el estado final, que ya no se vuelve a consultar aunque envejezca
+def test_webhook_guarda_el_estado_final(cliente, db, cabeceras, consultas):
+    id_intencion = _crear_intencion(cliente, cabeceras)
+    intencion = dict(cliente_stripe.intenciones[id_intencion], status="succeeded", amount=5999)
+    evento = {"id": "evt_pago", "object": "event", "type": "payment_intent.succeeded", "data": {"object": intencion}}
+    assert cliente.post("/webhook", content=json.dumps(evento)).status_code == 200
+    procesar_eventos_pendientes()
+    _envejecer(db, id_intencion)
+    assert cliente.get(f"/estado-pago/{id_intencion}", headers=cabeceras).json()["status"] == "succeeded"
+    assert consultas["total"] == 0
+
+# Los webhooks llegan desordenados: un estado intermedio no pisa uno final
+def test_un_estado_final_no_se_sustituye(db):
+    guardar_estado_pago(db, "pi_1", {"status": "succeeded", "amount": 10, "currency": "eur"})
+    db.commit()
+    guardar_estado_pago(db, "pi_1", {"status": "processing", "amount": 10, "currency": "eur"})
+    db.commit()
+    db.expire_all()
+    assert db.get(models.EstadoPago, "pi_1").estado == "succeeded"
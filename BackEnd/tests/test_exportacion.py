@@ -0,0 +1,71 @@
+import csv
+import io
+
+import pytest
+
+import exportacion
+import models
+from exportacion import COLUMNAS_EXPORTACION, exportar_csv, parquet_disponible
+
+@pytest.fixture
+def compras(db, catalogo, cabeceras):
+    zelda, _, awakening, forza = catalogo["productos"]
+    id_usuario = db.query(models.Usuario.id_usuario).scalar()
+    lineas_por_compra = [[(zelda, 1), (forza, 2)], [(awakening, 3)], [], [(zelda, 1)]]
+    for lineas in lineas_por_compra:
+        compra = models.Compra(id_usuario=id_usuario, total=sum(p.precio * c for p, c in lineas))
+        compra.detalles = [
+            models.DetalleCompra(id_producto=p.id_producto, cantidad=c, precio_unitario=p.precio) for p, c in lineas
+        ]
+        db.add(compra)
+    db.commit()
+    return lineas_por_compra
+
+def _filas(contenido: bytes) -> list:
+    return list(csv.DictReader(io.StringIO(contenido.decode("utf-8"))))
+
+# Con lotes pequeños la exportación sale en varios bloques y el resultado es el mismo
+def test_csv_por_bloques(monkeypatch, compras):
+    completo = b"".join(exportar_csv())
+    monkeypatch.setattr(exportacion, "FILAS_POR_LOTE", 2)
+    bloques = list(exportar_csv())
+    assert len(bloques) >= 3
+    assert b"".join(bloques) == completo
+
+    filas = _filas(completo)
+    assert list(filas[0]) == COLUMNAS_EXPORTACION
+    # Una fila por línea y la compra sin líneas una sola vez con el detalle vacío
+    assert len(filas) == 5
+    sin_lineas = [f for f in filas if not f["id_detalle"]]
+    assert len(sin_lineas) == 1 and sin_lineas[0]["producto_nombre"] == ""
+    forza = next(f for f in filas if f["producto_nombre"] == "Forza")
+    assert (forza["cantidad"], forza["subtotal"], forza["estado"]) == ("2", "139.98", "pagada")
+
+def test_endpoint_csv(cliente, compras, cabeceras_admin):
+    respuesta = cliente.get("/compras/exportar", headers=cabeceras_admin)
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"] == "text/csv; charset=utf-8"
+    assert respuesta.headers["content-disposition"].startswith('attachment; filename="compras-')
+    assert len(_filas(respuesta.content)) == 5
+
+def test_filtro_de_fechas(cliente, compras, cabeceras_admin):
+    respuesta = cliente.get("/compras/exportar", params={"fecha_hasta": "2000-01-01T00:00:00"}, headers=cabeceras_admin)
+    assert _filas(respuesta.content) == []
+
+# Contiene el historial de compras y los emails de los clientes: solo para administradores
+def test_exportar_requiere_administrador(cliente, compras, cabeceras):
+    assert cliente.get("/compras/exportar").status_code == 401
+    assert cliente.get("/compras/exportar", headers=cabeceras).status_code == 403
+
+@pytest.mark.skipif(parquet_disponible(), reason="pyarrow instalado")
+def test_parquet_sin_pyarrow(cliente, compras, cabeceras_admin):
+    respuesta = cliente.get("/compras/exportar", params={"formato": "parquet"}, headers=cabeceras_admin)
+    assert respuesta.status_code == 400
+
+@pytest.mark.skipif(not parquet_disponible(), reason="pyarrow no instalado")
+def test_parquet(cliente, compras, cabeceras_admin):
+    import pyarrow.parquet as pq
+    respuesta = cliente.get("/compras/exportar", params={"formato": "parquet"}, headers=cabeceras_admin)
+    tabla = pq.read_table(io.BytesIO(respuesta.content))
+    assert tabla.num_rows == 5
+    assert tabla.column_names == COLUMNAS_EXPORTACION
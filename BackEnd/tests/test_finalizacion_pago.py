@@ -0,0 +1,111 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+import models
+from database import SessionLocal
+from payment.cliente_stripe import cliente as cliente_stripe
+from payment.webhooks import finalizar_compra_stripe, procesar_eventos_pendientes
+from reservas import liberar_reservas_expiradas
+
+def _stock(db, id_producto) -> int:
+    db.expire_all()
+    return db.query(models.Producto.cantidad).filter(models.Producto.id_producto == id_producto).scalar()
+
+def _compra(db) -> models.Compra:
+    db.expire_all()
+    return db.query(models.Compra).one()
+
+# Abre un checkout y devuelve el id de la sesión de Stripe
+def _checkout(cliente, cabeceras, lineas) -> str:
+    respuesta = cliente.post("/crear-sesion-pago", headers=cabeceras, json=[
+        {"id_producto": id_producto, "cantidad": cantidad} for id_producto, cantidad in lineas
+    ])
+    assert respuesta.status_code == 200, respuesta.text
+    return respuesta.json()["url_pago"].split("session_id=")[1]
+
+def _webhook(cliente, cuerpo: bytes):
+    assert cliente.post("/webhook", content=cuerpo).status_code == 200
+    procesar_eventos_pendientes()
+
+def test_pago_completado_finaliza_la_compra(cliente, db, catalogo, cabeceras):
+    zelda = catalogo["productos"][0].id_producto
+    id_sesion = _checkout(cliente, cabeceras, [(zelda, 2)])
+    _webhook(cliente, cliente_stripe.evento_sesion(id_sesion))
+
+    compra = _compra(db)
+    assert compra.estado == "pagada"
+    # El stock ya se descontó al reservar: pagar no lo vuelve a tocar
+    assert _stock(db, zelda) == 8
+    assert {r.estado for r in db.query(models.ReservaStock)} == {"convertida"}
+    assert [v.id_compra for v in db.query(models.VentaPendiente)] == [compra.id_compra]
+
+# Stripe puede entregar el mismo evento varias veces, y también eventos distintos
+# para el mismo pago (completed y async_payment_succeeded)
+def test_eventos_repetidos_no_descuentan_dos_veces(cliente, db, catalogo, cabeceras):
+    zelda = catalogo["productos"][0].id_producto
+    id_sesion = _checkout(cliente, cabeceras, [(zelda, 2)])
+    evento = cliente_stripe.evento_sesion(id_sesion)
+    _webhook(cliente, evento)
+    _webhook(cliente, evento)
+    otro = json.loads(cliente_stripe.evento_sesion(id_sesion))
+    otro["type"] = "checkout.session.async_payment_succeeded"
+    _webhook(cliente, json.dumps(otro).encode())
+
+    assert db.query(models.EventoWebhook).count() == 2
+    assert db.query(models.EventoProcesado).count() == 2
+    assert _stock(db, zelda) == 8
+    assert db.query(models.VentaPendiente).count() == 1
+    # Una caducidad que llega tarde no libera la reserva de una compra pagada
+    _webhook(cliente, cliente_stripe.evento_sesion(id_sesion, "checkout.session.expired"))
+    assert _compra(db).estado == "pagada"
+    assert _stock(db, zelda) == 8
+
+# Dos workers finalizando la misma sesión a la vez: solo uno la aplica
+def test_finalizaciones_concurrentes(cliente, db, catalogo, cabeceras):
+    forza = catalogo["productos"][3].id_producto
+    id_sesion = _checkout(cliente, cabeceras, [(forza, 1)])
+    sesion = json.loads(cliente_stripe.evento_sesion(id_sesion))["data"]["object"]
+    barrera = threading.Barrier(4)
+    aplicadas = []
+
+    def finalizar():
+        db_hilo = SessionLocal()
+        try:
+            barrera.wait()
+            aplicadas.append(bool(finalizar_compra_stripe(db_hilo, sesion)))
+            db_hilo.commit()
+        finally:
+            db_hilo.close()
+
+    hilos = [threading.Thread(target=finalizar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(aplicadas) == [False, False, False, True]
+    assert _stock(db, forza) == 2
+    assert db.query(models.VentaPendiente).count() == 1
+
+# Si la reserva caducó antes de llegar el pago, el stock se descuenta al finalizar
+def test_pago_tras_caducar_la_reserva(cliente, db, catalogo, cabeceras):
+    awakening = catalogo["productos"][2].id_producto
+    id_sesion = _checkout(cliente, cabeceras, [(awakening, 2)])
+    db.query(models.ReservaStock).update({"expira_en": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    liberar_reservas_expiradas()
+    assert _stock(db, awakening) == 5
+    assert _compra(db).estado == "cancelada"
+
+    _webhook(cliente, cliente_stripe.evento_sesion(id_sesion))
+    assert _compra(db).estado == "pagada"
+    assert _stock(db, awakening) == 3
+
+def test_sesion_caducada_devuelve_el_stock(cliente, db, catalogo, cabeceras):
+    zelda = catalogo["productos"][0].id_producto
+    id_sesion = _checkout(cliente, cabeceras, [(zelda, 4)])
+    assert _stock(db, zelda) == 6
+    _webhook(cliente, cliente_stripe.evento_sesion(id_sesion, "checkout.session.expired"))
+    assert _stock(db, zelda) == 10
+    assert _compra(db).estado == "cancelada"
+    assert db.query(models.VentaPendiente).count() == 0
@@ -0,0 +1,83 @@
+import threading
+
+import models
+from database import SessionLocal
+from inventario import descontar_stock, mensaje_fallo, reponer_stock
+
+def _stock(db, producto) -> int:
+    db.expire_all()
+    return db.query(models.Producto.cantidad).filter(models.Producto.id_producto == producto.id_producto).scalar()
+
+def test_descuenta_varias_lineas_agrupando_repetidos(db, catalogo):
+    zelda, _, awakening, _ = catalogo["productos"]
+    fallos = descontar_stock(db, [(zelda.id_producto, 2), (awakening.id_producto, 1), (zelda.id_producto, 3)])
+    db.commit()
+    assert fallos == []
+    assert _stock(db, zelda) == 5
+    assert _stock(db, awakening) == 4
+
+def test_stock_insuficiente_y_producto_inexistente(db, catalogo):
+    zelda, _, _, forza = catalogo["productos"]
+    fallos = descontar_stock(db, [(zelda.id_producto, 1), (forza.id_producto, 4), (9999, 1)])
+    assert [(f["id_producto"], f["motivo"]) for f in fallos] == [
+        (forza.id_producto, "stock_insuficiente"),
+        (9999, "no_encontrado"),
+    ]
+    assert fallos[0]["disponible"] == 3 and fallos[0]["solicitado"] == 4
+    assert mensaje_fallo(fallos[0]) == "Stock insuficiente para el producto Forza"
+    assert mensaje_fallo(fallos[1]) == "Producto con ID 9999 no encontrado"
+    # El llamador deshace también las líneas que sí se habían descontado
+    db.rollback()
+    assert _stock(db, zelda) == 10
+    assert _stock(db, forza) == 3
+
+def test_reponer_stock(db, catalogo):
+    _, mario, _, forza = catalogo["productos"]
+    reponer_stock(db, [(mario.id_producto, 2), (forza.id_producto, 1), (mario.id_producto, 1)])
+    db.commit()
+    assert _stock(db, mario) == 3
+    assert _stock(db, forza) == 4
+
+# Muchas compras a la vez de un producto con 3 unidades: nunca se venden más de 3
+def test_compras_concurrentes_no_venden_de_mas(db, catalogo):
+    forza = catalogo["productos"][3]
+    id_producto = forza.id_producto
+    barrera = threading.Barrier(12)
+    resultados = []
+
+    def comprar():
+        sesion = SessionLocal()
+        try:
+            barrera.wait()
+            fallos = descontar_stock(sesion, [(id_producto, 1)])
+            if fallos:
+                sesion.rollback()
+            else:
+                sesion.commit()
+            resultados.append(not fallos)
+        finally:
+            sesion.close()
+
+    hilos = [threading.Thread(target=comprar) for _ in range(12)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert len(resultados) == 12
+    assert resultados.count(True) == 3
+    assert _stock(db, forza) == 0
+
+def test_compra_sin_stock_no_registra_nada(cliente, db, catalogo, cabeceras):
+    zelda, mario, _, _ = catalogo["productos"]
+    id_usuario = db.query(models.Usuario.id_usuario).scalar()
+    respuesta = cliente.post("/compras/", json={
+        "id_usuario": id_usuario, "total": 109.98,
+        "detalles": [
+            {"id_producto": zelda.id_producto, "cantidad": 1, "precio_unitario": 59.99},
+            {"id_producto": mario.id_producto, "cantidad": 1, "precio_unitario": 49.99},
+        ],
+    })
+    assert respuesta.status_code == 400
+    assert respuesta.json()["detail"] == "Stock insuficiente para el producto Mario Kart"
+    assert _stock(db, zelda) == 10
+    assert db.query(models.Compra).count() == 0
@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from auth import limites
+from auth.limites import LimitadorBcrypt
+
+# Reloj manual para recargar el cubo sin dormir
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(limites.time, "monotonic", reloj)
+    return reloj
+
+def _limitador(**opciones) -> LimitadorBcrypt:
+    return LimitadorBcrypt(**{"tasa": 0.2, "rafaga": 3, "concurrencia": 100, "max_clientes": 100, **opciones})
+
+# Entra y sale; devuelve los segundos de Retry-After si se rechaza
+def _intentar(limitador, cliente: str = "1.1.1.1"):
+    try:
+        limitador.entrar(cliente)
+    except HTTPException as e:
+        assert e.status_code == 429
+        return int(e.headers["Retry-After"])
+    limitador.salir()
+    return 0
+
+def test_rafaga_y_recarga(reloj):
+    limitador = _limitador()
+    assert [_intentar(limitador) for _ in range(4)] == [0, 0, 0, 5]
+    # Las fichas se recargan a `tasa` por segundo
+    reloj.ahora += 3
+    assert _intentar(limitador) == 2
+    reloj.ahora += 2
+    assert _intentar(limitador) == 0
+    # Nunca se acumulan más de `rafaga`
+    reloj.ahora += 3600
+    assert [_intentar(limitador) for _ in range(4)] == [0, 0, 0, 5]
+
+def test_cada_cliente_tiene_su_cubo(reloj):
+    limitador = _limitador(rafaga=1)
+    assert _intentar(limitador, "1.1.1.1") == 0
+    assert _intentar(limitador, "1.1.1.1") == 5
+    assert _intentar(limitador, "2.2.2.2") == 0
+    assert limitador.estadisticas()["rechazadas_cliente"] == 1
+
+def test_se_descartan_los_clientes_mas_antiguos(reloj):
+    limitador = _limitador(rafaga=1, max_clientes=2)
+    for cliente in ("a", "b", "c"):
+        _intentar(limitador, cliente)
+    assert limitador.estadisticas()["clientes"] == 2
+    # "a" se descartó y empieza con el cubo lleno
+    assert _intentar(limitador, "a") == 0
+    assert _intentar(limitador, "c") == 5
+
+# Al superar la concurrencia se rechaza sin gastar fichas del cliente
+def test_limite_de_concurrencia(reloj):
+    limitador = _limitador(rafaga=2, concurrencia=1)
+    limitador.entrar("a")
+    assert _intentar(limitador, "b") == 1
+    assert limitador.estadisticas()["rechazadas_global"] == 1
+    limitador.salir()
+    assert [_intentar(limitador, "b") for _ in range(3)] == [0, 0, 5]
+    assert limitador.estadisticas()["en_curso"] == 0
+
+def _en_hilos(funcion, n: int):
+    barrera = threading.Barrier(n)
+    def ejecutar():
+        barrera.wait()
+        funcion()
+    hilos = [threading.Thread(target=ejecutar) for _ in range(n)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+# Con muchas peticiones a la vez del mismo cliente solo pasan `rafaga`
+def test_cubo_con_peticiones_concurrentes(reloj):
+    limitador = _limitador(rafaga=5)
+    resultados = []
+    _en_hilos(lambda: resultados.append(_intentar(limitador)), 20)
+    assert resultados.count(0) == 5
+    assert limitador.estadisticas()["admitidas"] == 5
+
+def test_concurrencia_con_peticiones_simultaneas(reloj):
+    limitador = _limitador(concurrencia=3)
+    admitidas = []
+    def entrar():
+        try:
+            limitador.entrar(f"cliente-{threading.get_ident()}")
+            admitidas.append(True)
+        except HTTPException:
+            pass
+    _en_hilos(entrar, 12)
+    assert len(admitidas) == 3
+    assert limitador.estadisticas()["en_curso"] == 3
+
+# En la aplicación: 429 con Retry-After, y la plaza se libera aunque el login falle
+def test_rutas_de_login_limitadas(monkeypatch, cliente, cabeceras, reloj):
+    limitador = _limitador(rafaga=2)
+    monkeypatch.setattr(limites, "limitador_bcrypt", limitador)
+    datos = {"username": "cliente@example.com", "password": "otra"}
+    assert cliente.post("/token", data=datos).status_code == 401
+    assert cliente.post("/usuarios/login", json={"email": "cliente@example.com", "password": "otra"}).status_code == 400
+    respuesta = cliente.post("/token", data=datos)
+    assert respuesta.status_code == 429
+    assert respuesta.headers["Retry-After"] == "5"
+    assert limitador.estadisticas()["en_curso"] == 0
+    # Las rutas que no calculan bcrypt no cuentan
+    assert cliente.get("/users/me", headers=cabeceras).status_code == 200
@@ -0,0 +1,17 @@
+import pytest
+
+RUTAS = ["cache", "pool", "webhooks", "stripe", "sincronizacion", "limites", "correo"]
+
+@pytest.mark.parametrize("ruta", RUTAS)
+def test_metricas_requieren_token(cliente, catalogo, ruta):
+    assert cliente.get(f"/metricas/{ruta}").status_code == 401
+
+@pytest.mark.parametrize("ruta", RUTAS)
+def test_metricas_prohibidas_para_clientes(cliente, cabeceras, ruta):
+    respuesta = cliente.get(f"/metricas/{ruta}", headers=cabeceras)
+    assert respuesta.status_code == 403
+
+@pytest.mark.parametrize("ruta", RUTAS)
+def test_metricas_para_administradores(cliente, cabeceras_admin, ruta):
+    respuesta = cliente.get(f"/metricas/{ruta}", headers=cabeceras_admin)
+    assert respuesta.status_code == 200, respuesta.text
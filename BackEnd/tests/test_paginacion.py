@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from fastapi import Response
+
+import models
+from paginacion import CABECERA_CURSOR, codificar_cursor, decodificar_cursor, paginar
+
+def test_recorre_todas_las_paginas_con_cursor(cliente, catalogo):
+    vistos, cursor = [], None
+    while True:
+        respuesta = cliente.get("/productos/", params={"limit": 3, **({"cursor": cursor} if cursor else {})})
+        assert respuesta.status_code == 200
+        vistos += [p["id_producto"] for p in respuesta.json()]
+        cursor = respuesta.headers.get(CABECERA_CURSOR)
+        if cursor is None:
+            break
+    assert vistos == sorted(p.id_producto for p in catalogo["productos"])
+
+def test_ultima_pagina_no_devuelve_cursor(cliente, catalogo):
+    respuesta = cliente.get("/productos/", params={"limit": 4})
+    assert len(respuesta.json()) == 4
+    assert CABECERA_CURSOR not in respuesta.headers
+
+def test_cursor_invalido_da_400(cliente, catalogo):
+    assert cliente.get("/productos/", params={"cursor": "no-es-un-cursor"}).status_code == 400
+
+def test_cursor_con_fechas_ida_y_vuelta():
+    columnas = [models.Compra.fecha_compra, models.Compra.id_compra]
+    fecha = datetime(2024, 5, 1, 12, 30)
+    assert decodificar_cursor(codificar_cursor([fecha, 7]), columnas) == [fecha, 7]
+
+# Con varias compras en la misma fecha el id desempata y ninguna se repite ni se pierde
+def test_orden_descendente_con_empates(db, catalogo):
+    usuario = models.Usuario(nombre="a", email="a@example.com", contraseña="x",
+                             id_rol=db.query(models.Rol.id_rol).first()[0])
+    db.add(usuario)
+    db.flush()
+    fecha = datetime(2024, 1, 1)
+    db.add_all([models.Compra(id_usuario=usuario.id_usuario, total=1, fecha_compra=fecha) for _ in range(5)])
+    db.commit()
+
+    columnas = [models.Compra.fecha_compra, models.Compra.id_compra]
+    ids, cursor = [], None
+    while True:
+        respuesta = Response()
+        filas = paginar(db.query(models.Compra), columnas, 0, 2, cursor, respuesta, descendente=True)
+        ids += [c.id_compra for c in filas]
+        cursor = respuesta.headers.get(CABECERA_CURSOR)
+        if cursor is None:
+            break
+    assert ids == sorted(ids, reverse=True) and len(ids) == 5
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+import pytest
+from passlib.hash import bcrypt
+
+import models
+from auth import jwt as auth_jwt
+from auth.passwords import BCRYPT_ROUNDS, hashear, hashear_async, verificar, verificar_async
+from database import SessionLocal
+
+EMAIL = "cliente@example.com"
+
+def _coste(hash_guardado: str) -> int:
+    return int(hash_guardado.split("$")[2])
+
+def _guardar_hash(db, hash_guardado: str):
+    db.query(models.Usuario).filter_by(email=EMAIL).update({"contraseña": hash_guardado})
+    db.commit()
+
+def _hash_guardado(db) -> str:
+    db.expire_all()
+    return db.query(models.Usuario.contraseña).filter_by(email=EMAIL).scalar()
+
+def _token(cliente, contraseña: str = "secreta"):
+    return cliente.post("/token", data={"username": EMAIL, "password": contraseña})
+
+def _login(cliente, contraseña: str = "secreta"):
+    return cliente.post("/usuarios/login", json={"email": EMAIL, "password": contraseña})
+
+def test_hashear_y_verificar():
+    hash_guardado = hashear("secreta")
+    assert _coste(hash_guardado) == BCRYPT_ROUNDS
+    assert verificar("secreta", hash_guardado) == (True, None)
+    assert verificar("otra", hash_guardado) == (False, None)
+    assert asyncio.run(verificar_async("secreta", asyncio.run(hashear_async("secreta")))) == (True, None)
+
+# Un hash con otro coste se rehace al iniciar sesión, por cualquiera de las dos rutas
+@pytest.mark.parametrize("iniciar_sesion", [_token, _login])
+def test_login_rehace_un_hash_con_otro_coste(cliente, db, cabeceras, iniciar_sesion):
+    _guardar_hash(db, bcrypt.using(rounds=BCRYPT_ROUNDS + 1).hash("secreta"))
+    assert iniciar_sesion(cliente).status_code == 200
+    nuevo_hash = _hash_guardado(db)
+    assert _coste(nuevo_hash) == BCRYPT_ROUNDS
+    assert verificar("secreta", nuevo_hash) == (True, None)
+    # Ya con el coste actual, el siguiente inicio de sesión no lo toca
+    assert iniciar_sesion(cliente).status_code == 200
+    assert _hash_guardado(db) == nuevo_hash
+
+def test_contraseña_incorrecta_no_rehace_el_hash(cliente, db, cabeceras):
+    hash_antiguo = bcrypt.using(rounds=BCRYPT_ROUNDS + 1).hash("secreta")
+    _guardar_hash(db, hash_antiguo)
+    assert _token(cliente, "otra").status_code == 401
+    assert _hash_guardado(db) == hash_antiguo
+
+# La contraseña cambia mientras se verifica la antigua: el hash rehecho de la
+# antigua no pisa la nueva
+def test_el_rehash_no_pisa_un_cambio_de_contraseña(monkeypatch, cliente, db, cabeceras):
+    _guardar_hash(db, bcrypt.using(rounds=BCRYPT_ROUNDS + 1).hash("secreta"))
+    hash_nuevo = hashear("nueva")
+
+    async def verificar_y_cambiar(contraseña, hash_guardado):
+        resultado = await verificar_async(contraseña, hash_guardado)
+        otra_sesion = SessionLocal()
+        try:
+            _guardar_hash(otra_sesion, hash_nuevo)
+        finally:
+            otra_sesion.close()
+        return resultado
+    monkeypatch.setattr(auth_jwt, "verificar_async", verificar_y_cambiar)
+
+    assert _token(cliente).status_code == 200
+    assert _hash_guardado(db) == hash_nuevo
+
+# Las verificaciones simultáneas se reparten en el pool de bcrypt
+def test_verificaciones_concurrentes():
+    hash_guardado = hashear("secreta")
+    resultados = []
+
+    def verificar_en_hilo(contraseña):
+        resultados.append(verificar(contraseña, hash_guardado)[0])
+
+    hilos = [threading.Thread(target=verificar_en_hilo, args=(c,)) for c in ["secreta", "otra"] * 8]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(resultados) == [False] * 8 + [True] * 8
@@ -0,0 +1,126 @@
+import threading
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+
+import models
+from auth.refresco import _hash, purgar_tokens_caducados, rotar_token_refresco
+from database import SessionLocal
+
+EMAIL = "cliente@example.com"
+
+def _login(cliente) -> dict:
+    respuesta = cliente.post("/usuarios/login", json={"email": EMAIL, "password": "secreta"})
+    assert respuesta.status_code == 200, respuesta.text
+    return respuesta.json()
+
+def _refrescar(cliente, token: str):
+    return cliente.post("/usuarios/refrescar", json={"refresh_token": token})
+
+def _tokens(db) -> list:
+    db.expire_all()
+    return db.query(models.TokenRefresco).order_by(models.TokenRefresco.id_token).all()
+
+def _familia(db, token: str) -> list:
+    familia = db.query(models.TokenRefresco.familia).filter_by(hash_token=_hash(token)).scalar()
+    return [t for t in _tokens(db) if t.familia == familia]
+
+def test_rotacion(cliente, db, cabeceras):
+    primero = _login(cliente)["refresh_token"]
+    respuesta = _refrescar(cliente, primero)
+    assert respuesta.status_code == 200
+    segundo = respuesta.json()["refresh_token"]
+    assert segundo != primero
+    acceso = {"Authorization": f"Bearer {respuesta.json()['access_token']}"}
+    assert cliente.get("/users/me", headers=acceso).json()["email"] == EMAIL
+    # Solo se guarda el hash del token, y el nuevo sigue en la misma familia
+    assert primero not in {t.hash_token for t in _tokens(db)}
+    assert [(t.hash_token, t.revocado) for t in _familia(db, primero)] == [(_hash(primero), True), (_hash(segundo), False)]
+    assert _refrescar(cliente, segundo).status_code == 200
+
+# Presentar un token ya canjeado revoca la familia: el token robado y el
+# legítimo dejan de valer, pero no las sesiones de otros dispositivos
+def test_reutilizacion_revoca_la_familia(cliente, db, cabeceras):
+    robado = _login(cliente)["refresh_token"]
+    otro_dispositivo = _login(cliente)["refresh_token"]
+    legitimo = _refrescar(cliente, robado).json()["refresh_token"]
+
+    assert _refrescar(cliente, robado).status_code == 401
+    assert _refrescar(cliente, legitimo).status_code == 401
+    assert _refrescar(cliente, otro_dispositivo).status_code == 200
+
+def test_token_caducado_o_desconocido(cliente, db, cabeceras):
+    token = _login(cliente)["refresh_token"]
+    db.query(models.TokenRefresco).update({"expira_en": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    assert _refrescar(cliente, token).status_code == 401
+    assert _refrescar(cliente, "no-existe").status_code == 401
+
+# El mismo token presentado a la vez desde varios hilos solo se canjea una vez
+def test_canjes_concurrentes(cliente, db, cabeceras):
+    token = _login(cliente)["refresh_token"]
+    barrera = threading.Barrier(6)
+    resultados = []
+
+    def canjear():
+        sesion = SessionLocal()
+        try:
+            barrera.wait()
+            try:
+                rotar_token_refresco(sesion, token)
+                resultados.append(200)
+            except HTTPException as e:
+                resultados.append(e.status_code)
+        finally:
+            sesion.close()
+
+    hilos = [threading.Thread(target=canjear) for _ in range(6)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(resultados) == [200] + [401] * 5
+    # Los demás canjes cuentan como reutilización: la familia entera queda revocada
+    familia = _familia(db, token)
+    assert len(familia) == 2 and all(t.revocado for t in familia)
+
+def test_logout(cliente, db, cabeceras):
+    token = _login(cliente)["refresh_token"]
+    rotado = _refrescar(cliente, token).json()["refresh_token"]
+    otro_dispositivo = _login(cliente)["refresh_token"]
+    assert cliente.post("/usuarios/logout", json={"refresh_token": rotado}).status_code == 204
+    assert _refrescar(cliente, rotado).status_code == 401
+    assert _refrescar(cliente, otro_dispositivo).status_code == 200
+    # Cerrar sesión con un token que no existe no falla
+    assert cliente.post("/usuarios/logout", json={"refresh_token": "no-existe"}).status_code == 204
+
+def test_cambiar_la_contraseña_cierra_todas_las_sesiones(cliente, db, cabeceras):
+    tokens = [_login(cliente)["refresh_token"] for _ in range(2)]
+    usuario = db.query(models.Usuario).filter_by(email=EMAIL).one()
+    respuesta = cliente.post("/usuarios/cambiar-contraseña", json={"usuario_id": usuario.id_usuario, "nueva_contraseña": "nueva"})
+    assert respuesta.status_code == 200
+    assert [_refrescar(cliente, t).status_code for t in tokens] == [401, 401]
+    assert _tokens(db) == []
+
+def test_usuario_desactivado_no_refresca(cliente, db, cabeceras):
+    token = _login(cliente)["refresh_token"]
+    db.query(models.Usuario).filter_by(email=EMAIL).update({"is_active": False})
+    db.commit()
+    assert _refrescar(cliente, token).status_code == 401
+
+# Los caducados se borran; los revocados vigentes se conservan para detectar su reutilización
+def test_purgar_tokens_caducados(cliente, db, cabeceras):
+    revocado = _login(cliente)["refresh_token"]
+    _refrescar(cliente, revocado)
+    caducado = _login(cliente)["refresh_token"]
+    db.query(models.TokenRefresco).filter_by(hash_token=_hash(caducado)).update(
+        {"expira_en": datetime.utcnow() - timedelta(seconds=1)}
+    )
+    db.commit()
+    total = len(_tokens(db))
+
+    assert purgar_tokens_caducados() == 1
+    assert len(_tokens(db)) == total - 1
+    assert [t.revocado for t in _familia(db, revocado)] == [True, False]
+    assert _refrescar(cliente, caducado).status_code == 401
+    assert _refrescar(cliente, revocado).status_code == 401
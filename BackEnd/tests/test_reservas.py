@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import models
+import reservas
+from payment.cliente_stripe import cliente as cliente_stripe
+from reservas import acotar_ttl, expiracion_sesion, liberar_reservas_expiradas
+
+def _stock(db, id_producto) -> int:
+    db.expire_all()
+    return db.query(models.Producto.cantidad).filter(models.Producto.id_producto == id_producto).scalar()
+
+def _pagar(cliente, cabeceras, lineas):
+    return cliente.post("/crear-sesion-pago", headers=cabeceras, json=[
+        {"id_producto": id_producto, "cantidad": cantidad} for id_producto, cantidad in lineas
+    ])
+
+@pytest.mark.parametrize("minutos, esperado", [(0, 30), (30, 30), (120, 120), (24 * 60, 24 * 60 - 1), (10 ** 6, 24 * 60 - 1)])
+def test_ttl_acotado_a_los_limites_de_stripe(minutos, esperado):
+    assert acotar_ttl(minutos) == esperado
+
+# Con el TTL máximo, la sesión (TTL + holgura) sigue cabiendo en las 24 horas de Stripe
+@pytest.mark.parametrize("minutos", [0, 10 ** 6])
+def test_la_sesion_caduca_dentro_del_margen_de_stripe(monkeypatch, minutos):
+    monkeypatch.setattr(reservas, "RESERVA_TTL_MINUTOS", acotar_ttl(minutos))
+    duracion = expiracion_sesion() - datetime.utcnow()
+    assert timedelta(minutes=30) <= duracion <= timedelta(hours=24)
+
+def test_checkout_con_el_ttl_maximo(monkeypatch, cliente, db, catalogo, cabeceras):
+    monkeypatch.setattr(reservas, "RESERVA_TTL_MINUTOS", acotar_ttl(10 ** 6))
+    forza = catalogo["productos"][3]
+    respuesta = _pagar(cliente, cabeceras, [(forza.id_producto, 2)])
+    assert respuesta.status_code == 200, respuesta.text
+    assert _stock(db, forza.id_producto) == 1
+
+def test_checkout_reserva_stock_y_crea_la_sesion(cliente, db, catalogo, cabeceras):
+    zelda, _, awakening, _ = catalogo["productos"]
+    respuesta = _pagar(cliente, cabeceras, [(zelda.id_producto, 2), (awakening.id_producto, 1)])
+    assert respuesta.status_code == 200, respuesta.text
+    id_sesion = respuesta.json()["url_pago"].split("session_id=")[1]
+
+    compra = db.query(models.Compra).one()
+    assert compra.estado == "pendiente"
+    assert cliente_stripe.sesiones[id_sesion].metadata["id_compra"] == str(compra.id_compra)
+    reservadas = {r.id_producto: r.cantidad for r in db.query(models.ReservaStock).filter_by(estado="activa")}
+    assert reservadas == {zelda.id_producto: 2, awakening.id_producto: 1}
+    assert _stock(db, zelda.id_producto) == 8
+    # La reserva dura más que la sesión de Stripe
+    reserva = db.query(models.ReservaStock).first()
+    expira_sesion = datetime.utcfromtimestamp(cliente_stripe.sesiones[id_sesion].expires_at)
+    assert reserva.expira_en > expira_sesion
+
+def test_checkout_sin_stock_no_reserva_nada(cliente, db, catalogo, cabeceras):
+    zelda, _, _, forza = catalogo["productos"]
+    respuesta = _pagar(cliente, cabeceras, [(zelda.id_producto, 1), (forza.id_producto, 4)])
+    assert respuesta.status_code == 400
+    assert respuesta.json()["detail"] == "Stock insuficiente para el producto Forza"
+    assert _stock(db, zelda.id_producto) == 10
+    assert db.query(models.ReservaStock).count() == 0
+    assert db.query(models.Compra).count() == 0
+
+def test_el_barrido_libera_solo_las_reservas_caducadas(cliente, db, catalogo, cabeceras):
+    zelda, _, awakening, _ = catalogo["productos"]
+    assert _pagar(cliente, cabeceras, [(zelda.id_producto, 3)]).status_code == 200
+    assert _pagar(cliente, cabeceras, [(awakening.id_producto, 2)]).status_code == 200
+    caducada = db.query(models.ReservaStock).filter_by(id_producto=zelda.id_producto).one()
+    caducada.expira_en = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+    assert liberar_reservas_expiradas() == 1
+    assert _stock(db, zelda.id_producto) == 10
+    assert _stock(db, awakening.id_producto) == 3
+    estados = {c.id_compra: c.estado for c in db.query(models.Compra)}
+    assert estados == {caducada.id_compra: "cancelada", **{i: "pendiente" for i in estados if i != caducada.id_compra}}
+    # Una segunda pasada no devuelve las mismas unidades otra vez
+    assert liberar_reservas_expiradas() == 0
+    assert _stock(db, zelda.id_producto) == 10
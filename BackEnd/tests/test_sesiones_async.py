@@ -0,0 +1,38 @@
+import pytest
+
+import models
+from database import _url_asincrona
+
+@pytest.mark.parametrize("url, esperada", [
+    ("postgresql://u:p@db/tienda", "postgresql+asyncpg://u:p@db/tienda"),
+    ("postgresql+psycopg2://u:p@db/tienda", "postgresql+asyncpg://u:p@db/tienda"),
+    ("postgres://u:p@db/tienda", "postgresql+asyncpg://u:p@db/tienda"),
+    ("sqlite:///./tienda.db", "sqlite+aiosqlite:///./tienda.db"),
+    ("postgresql+asyncpg://u:p@db/tienda", "postgresql+asyncpg://u:p@db/tienda"),
+])
+def test_url_del_motor_asincrono(url, esperada):
+    assert _url_asincrona(url) == esperada
+
+def test_login_y_usuario_actual_con_la_sesion_asincrona(cliente, cabeceras):
+    respuesta = cliente.get("/users/me", headers=cabeceras)
+    assert respuesta.status_code == 200
+    assert respuesta.json()["email"] == "cliente@example.com"
+
+def test_login_con_contraseña_incorrecta(cliente, cabeceras):
+    respuesta = cliente.post("/token", data={"username": "cliente@example.com", "password": "otra"})
+    assert respuesta.status_code == 401
+    respuesta = cliente.post("/token", data={"username": "nadie@example.com", "password": "secreta"})
+    assert respuesta.status_code == 401
+
+def test_token_invalido(cliente, catalogo):
+    respuesta = cliente.get("/users/me", headers={"Authorization": "Bearer no-es-un-jwt"})
+    assert respuesta.status_code == 401
+
+# La recuperación de contraseña escribe en la bandeja de correo con la sesión asíncrona
+def test_recuperar_contraseña_encola_el_correo(cliente, db, cabeceras):
+    respuesta = cliente.post("/usuarios/recuperar-contraseña", json={"email": "cliente@example.com"})
+    assert respuesta.status_code == 200
+    correo = db.query(models.CorreoSaliente).filter_by(asunto="Recupera tu contraseña en NovaForgeGames").one()
+    assert correo.destinatario == "cliente@example.com"
+    assert correo.estado == "pendiente"
+    assert cliente.post("/usuarios/recuperar-contraseña", json={"email": "nadie@example.com"}).status_code == 404
@@ -0,0 +1,147 @@
+from datetime import datetime
+
+import stripe
+
+import models
+from database import SessionLocal
+from payment import stripe_utils
+from payment.circuito import Circuito
+from payment.cliente_stripe import cliente as cliente_stripe
+from payment.sincronizacion import _reclamar_trabajos, procesar_sincronizaciones_pendientes
+
+def _datos(catalogo, **cambios) -> dict:
+    return {
+        "nombre": "Metroid", "descripción": "Exploración espacial", "precio": 19.99, "cantidad": 4,
+        "id_categoria": catalogo["categorias"][0].id_categoria,
+        "id_proveedor": catalogo["proveedor"].id_proveedor,
+        **cambios,
+    }
+
+def _crear(cliente, catalogo) -> int:
+    respuesta = cliente.post("/productos/", json=_datos(catalogo))
+    assert respuesta.status_code == 201, respuesta.text
+    assert respuesta.json()["estado_sync"] == "pendiente"
+    return respuesta.json()["id_producto"]
+
+def _producto(db, id_producto) -> models.Producto:
+    db.expire_all()
+    return db.get(models.Producto, id_producto)
+
+def _trabajos(db, id_producto) -> list:
+    db.expire_all()
+    return db.query(models.SincronizacionStripe).filter_by(id_producto=id_producto).order_by(
+        models.SincronizacionStripe.id_sincronizacion
+    ).all()
+
+def test_alta_crea_el_producto_con_su_precio(cliente, db, catalogo):
+    id_producto = _crear(cliente, catalogo)
+    assert procesar_sincronizaciones_pendientes() == 1
+
+    producto = _producto(db, id_producto)
+    assert producto.estado_sync == "sincronizado"
+    producto_stripe = cliente_stripe.productos[producto.id_producto_stripe]
+    assert producto_stripe["default_price"] == producto.id_precio_stripe
+    assert cliente_stripe.precios[producto.id_precio_stripe]["unit_amount"] == 1999
+    # El trabajo guarda el id de Stripe que creó
+    assert [t.id_producto_stripe for t in _trabajos(db, id_producto)] == [producto.id_producto_stripe]
+
+# Los precios de Stripe no se modifican: se crea otro y se archiva el anterior
+def test_cambio_de_precio(cliente, db, catalogo):
+    id_producto = _crear(cliente, catalogo)
+    procesar_sincronizaciones_pendientes()
+    precio_anterior = _producto(db, id_producto).id_precio_stripe
+
+    assert cliente.put(f"/productos/{id_producto}", json=_datos(catalogo, precio=24.99)).status_code == 200
+    assert procesar_sincronizaciones_pendientes() == 1
+    producto = _producto(db, id_producto)
+    assert producto.id_precio_stripe != precio_anterior
+    assert cliente_stripe.precios[producto.id_precio_stripe]["unit_amount"] == 2499
+    assert cliente_stripe.precios[precio_anterior]["active"] is False
+    assert cliente_stripe.productos[producto.id_producto_stripe]["default_price"] == producto.id_precio_stripe
+
+# El borrado llega mientras el producto se está creando en Stripe: el trabajo de
+# archivar se encola sin id de Stripe y lo toma del de sincronizar
+def test_borrado_durante_la_creacion_en_stripe(monkeypatch, cliente, db, catalogo):
+    id_producto = _crear(cliente, catalogo)
+    creados = []
+    original = cliente_stripe.crear_producto
+    def crear_y_borrar(*args, **kwargs):
+        producto = original(*args, **kwargs)
+        creados.append(producto.id)
+        assert cliente.delete(f"/productos/{id_producto}").status_code == 204
+        return producto
+    monkeypatch.setattr(cliente_stripe, "crear_producto", crear_y_borrar)
+
+    assert procesar_sincronizaciones_pendientes() == 2
+    sincronizar, archivar = _trabajos(db, id_producto)
+    assert archivar.operacion == "archivar" and archivar.id_producto_stripe is None
+    assert {sincronizar.estado, archivar.estado} == {"completada"}
+    assert sincronizar.id_producto_stripe == creados[0]
+    assert cliente_stripe.productos[creados[0]]["active"] is False
+
+# Si se borra antes de que el worker lo cree, no llega a Stripe
+def test_borrado_antes_de_sincronizar(cliente, db, catalogo):
+    id_producto = _crear(cliente, catalogo)
+    productos_stripe = len(cliente_stripe.productos)
+    assert cliente.delete(f"/productos/{id_producto}").status_code == 204
+    # El de archivar espera a que termine el de sincronizar
+    assert [t.operacion for t in _reclamar_trabajos(db)] == ["sincronizar"]
+    db.query(models.SincronizacionStripe).update({"estado": "pendiente", "proximo_intento": datetime.utcnow()})
+    db.commit()
+
+    assert procesar_sincronizaciones_pendientes() == 2
+    assert len(cliente_stripe.productos) == productos_stripe
+
+def test_un_fallo_de_stripe_se_reintenta(monkeypatch, cliente, db, catalogo):
+    monkeypatch.setattr(stripe_utils, "circuito_stripe", Circuito("prueba"))
+    id_producto = _crear(cliente, catalogo)
+    original = cliente_stripe.crear_producto
+    def caido(*args, **kwargs):
+        raise stripe.APIConnectionError("sin red")
+    monkeypatch.setattr(cliente_stripe, "crear_producto", caido)
+
+    assert procesar_sincronizaciones_pendientes() == 0
+    [trabajo] = _trabajos(db, id_producto)
+    assert (trabajo.estado, trabajo.intentos) == ("pendiente", 1)
+    assert trabajo.error.startswith("El servicio de pagos no está disponible")
+    assert trabajo.proximo_intento > datetime.utcnow()
+    assert _producto(db, id_producto).estado_sync == "pendiente"
+
+    monkeypatch.setattr(cliente_stripe, "crear_producto", original)
+    trabajo.proximo_intento = datetime.utcnow()
+    db.commit()
+    assert procesar_sincronizaciones_pendientes() == 1
+    assert _producto(db, id_producto).estado_sync == "sincronizado"
+
+# Los cambios sobre un trabajo aún no reclamado se funden con él; uno que llega
+# después de que el worker lo reclame necesita su propio trabajo
+def test_cambios_fundidos_solo_antes_de_reclamar(cliente, db, catalogo):
+    id_producto = _crear(cliente, catalogo)
+    assert cliente.put(f"/productos/{id_producto}", json=_datos(catalogo, precio=21.99)).status_code == 200
+    assert len(_trabajos(db, id_producto)) == 1
+
+    [reclamado] = _reclamar_trabajos(db)
+    assert cliente.put(f"/productos/{id_producto}", json=_datos(catalogo, precio=24.99)).status_code == 200
+    trabajos = _trabajos(db, id_producto)
+    assert [(t.estado, t.intentos) for t in trabajos] == [("procesando", 1), ("pendiente", 0)]
+
+# Un cambio del producto mientras se sincroniza (aún sin su trabajo a la vista
+# del worker) no se pierde: el producto no se marca sincronizado
+def test_cambio_durante_la_sincronizacion(monkeypatch, cliente, db, catalogo):
+    id_producto = _crear(cliente, catalogo)
+    original = cliente_stripe.crear_producto
+    def crear_y_cambiar(*args, **kwargs):
+        otra_sesion = SessionLocal()
+        try:
+            otra_sesion.query(models.Producto).filter_by(id_producto=id_producto).update(
+                {"version_sync": models.Producto.version_sync + 1}
+            )
+            otra_sesion.commit()
+        finally:
+            otra_sesion.close()
+        return original(*args, **kwargs)
+    monkeypatch.setattr(cliente_stripe, "crear_producto", crear_y_cambiar)
+
+    assert procesar_sincronizaciones_pendientes() == 1
+    producto = _producto(db, id_producto)
+    assert producto.id_producto_stripe and producto.estado_sync == "pendiente"
@@ -0,0 +1,54 @@
+import main
+import models
+from payment.cliente_stripe import cliente as cliente_stripe
+from payment.stripe_falso import ClienteStripeFalso
+from payment.webhooks import procesar_eventos_pendientes
+
+def _estado_compra(db) -> str:
+    db.expire_all()
+    return db.query(models.Compra.estado).scalar()
+
+def _checkout(cliente, cabeceras, id_producto: int, cantidad: int) -> str:
+    respuesta = cliente.post("/crear-sesion-pago", headers=cabeceras, json=[{"id_producto": id_producto, "cantidad": cantidad}])
+    assert respuesta.status_code == 200, respuesta.text
+    return respuesta.json()["url_pago"].split("session_id=")[1]
+
+def test_las_rutas_solo_existen_con_el_cliente_falso():
+    assert isinstance(cliente_stripe, ClienteStripeFalso)
+    assert any(ruta.path.startswith("/stripe-falso/") for ruta in main.app.routes)
+
+# Checkout, pago y webhook recorridos por HTTP
+def test_completar_sesion_por_http(cliente, db, catalogo, cabeceras):
+    zelda = catalogo["productos"][0].id_producto
+    id_sesion = _checkout(cliente, cabeceras, zelda, 1)
+
+    respuesta = cliente.post(f"/stripe-falso/sesiones/{id_sesion}/completar")
+    assert respuesta.status_code == 200
+    assert respuesta.json()["tipo"] == "checkout.session.completed"
+    assert cliente_stripe.sesiones[id_sesion].payment_status == "paid"
+    # El evento entra en la bandeja como uno recibido en /webhook
+    assert _estado_compra(db) == "pendiente"
+    assert procesar_eventos_pendientes() == 1
+    assert _estado_compra(db) == "pagada"
+
+def test_expirar_sesion_por_http(cliente, db, catalogo, cabeceras):
+    forza = catalogo["productos"][3].id_producto
+    id_sesion = _checkout(cliente, cabeceras, forza, 3)
+    assert cliente.post(f"/stripe-falso/sesiones/{id_sesion}/expirar").status_code == 200
+    procesar_eventos_pendientes()
+    assert _estado_compra(db) == "cancelada"
+    db.expire_all()
+    assert db.get(models.Producto, forza).cantidad == 3
+
+def test_sesion_o_accion_desconocidas(cliente, catalogo):
+    assert cliente.post("/stripe-falso/sesiones/cs_no_existe/completar").status_code == 404
+    assert cliente.post("/stripe-falso/sesiones/cs_no_existe/reembolsar").status_code == 422
+
+# Igual que Stripe, repetir una creación con la misma clave de idempotencia no duplica
+def test_idempotencia_del_cliente_falso():
+    falso = ClienteStripeFalso()
+    primero = falso.crear_producto("Zelda", precio_centimos=5999, clave_idempotencia="producto-1-1")
+    segundo = falso.crear_producto("Zelda", precio_centimos=5999, clave_idempotencia="producto-1-1")
+    assert primero.id == segundo.id
+    assert len(falso.productos) == 1 and len(falso.precios) == 1
+    falso.cerrar()
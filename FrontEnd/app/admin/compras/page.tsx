@@ -5,11 +5,20 @@ import { useNavigate } from "react-router"
 import { useAuth } from "@/context/auth-context"
 import axios from "axios"
 
+type FiltroEstado = "pagada" | "pendiente" | "cancelada" | "todas"
+
+const ESTILOS_ESTADO: Record<string, string> = {
+  pagada: "bg-green-900/30 text-green-300",
+  pendiente: "bg-yellow-900/30 text-yellow-300",
+  cancelada: "bg-red-900/30 text-red-300",
+}
+
 interface Purchase {
   id_compra: number
   id_usuario: number
   fecha_compra: string
   total: number
+  estado: string
   productos: {
     nombre: string
     cantidad: number
@@ -19,13 +28,16 @@ interface Purchase {
 }
 
 export default function AdminComprasPage() {
-  const { user } = useAuth()
+  const { user, token } = useAuth()
   const navigate = useNavigate()
   const [purchases, setPurchases] = useState<Purchase[]>([])
   const [isLoading, setIsLoading] = useState(true)
   const [searchTerm, setSearchTerm] = useState("")
+  // Por defecto solo las compras cobradas; los checkouts pendientes o cancelados no son ventas
+  const [estado, setEstado] = useState<FiltroEstado>("pagada")
   const [selectedPurchase, setSelectedPurchase] = useState<Purchase | null>(null)
   const [purchaseDetails, setPurchaseDetails] = useState<any[]>([])
+  const [detailsByPurchase, setDetailsByPurchase] = useState<Record<number, any[]>>({})
   const [isDetailsLoading, setIsDetailsLoading] = useState(false)
 
   useEffect(() => {
@@ -37,8 +49,17 @@ export default function AdminComprasPage() {
     const fetchCompras = async () => {
       setIsLoading(true)
       try {
-        const res = await axios.get(`${import.meta.env.VITE_BACKEND_URL}/compras/`)
+        const res = await axios.get(`${import.meta.env.VITE_BACKEND_URL}/compras/`, { params: { estado } })
         setPurchases(res.data)
+        // Detalles de todas las compras listadas en una sola petición
+        setDetailsByPurchase({})
+        if (res.data.length > 0) {
+          const detalles = await axios.get(`${import.meta.env.VITE_BACKEND_URL}/detalles-compra/compras`, {
+            params: { ids: res.data.map((p: Purchase) => p.id_compra) },
+            paramsSerializer: { indexes: null },
+          })
+          setDetailsByPurchase(detalles.data)
+        }
       } catch (e) {
         setPurchases([])
       }
@@ -46,7 +67,7 @@ export default function AdminComprasPage() {
     }
 
     fetchCompras()
-  }, [user, navigate])
+  }, [user, navigate, estado])
 
   const filteredPurchases = purchases.filter((purchase) => {
     const matchesSearch =
@@ -54,12 +75,43 @@ export default function AdminComprasPage() {
     return matchesSearch
   })
 
+  // La exportación requiere el token de administrador, así que se descarga con
+  // axios en lugar de con un enlace directo
+  const handleExportar = async () => {
+    try {
+      const res = await axios.get(`${import.meta.env.VITE_BACKEND_URL}/compras/exportar`, {
+        params: { formato: "csv", estado },
+        headers: { Authorization: `Bearer ${token}` },
+        responseType: "blob",
+      })
+      const nombre = res.headers["content-disposition"]?.match(/filename="(.+)"/)?.[1] ?? "compras.csv"
+      const url = URL.createObjectURL(res.data)
+      const enlace = document.createElement("a")
+      enlace.href = url
+      enlace.download = nombre
+      enlace.click()
+      URL.revokeObjectURL(url)
+    } catch (e) {
+      alert("No se pudo exportar las compras")
+    }
+  }
+
   const handleShowDetails = async (purchase: Purchase) => {
     setSelectedPurchase(purchase)
+    // Normalmente los detalles ya vienen precargados con el listado
+    if (detailsByPurchase[purchase.id_compra]) {
+      setPurchaseDetails(detailsByPurchase[purchase.id_compra])
+      return
+    }
     setIsDetailsLoading(true)
     try {
-      const res = await axios.get(`${import.meta.env.VITE_BACKEND_URL}/detalles-compra/compra/${purchase.id_compra}`)
-      setPurchaseDetails(res.data)
+      const res = await axios.get(`${import.meta.env.VITE_BACKEND_URL}/detalles-compra/compras`, {
+        params: { ids: [purchase.id_compra] },
+        paramsSerializer: { indexes: null },
+      })
+      const detalles = res.data[purchase.id_compra] || []
+      setDetailsByPurchase((prev) => ({ ...prev, [purchase.id_compra]: detalles }))
+      setPurchaseDetails(detalles)
     } catch (e) {
       setPurchaseDetails([])
     }
@@ -72,13 +124,22 @@ export default function AdminComprasPage() {
 
   return (
     <div className="min-h-screen pt-24 pb-16 px-4 sm:px-6 lg:px-8 max-w-7xl mx-auto">
-      <div className="mb-8">
-        <h1 className="text-3xl font-bold text-white mb-2">Gestión de Compras</h1>
-        <p className="text-gray-400">Administra los pedidos de los clientes</p>
+      <div className="mb-8 flex items-start justify-between">
+        <div>
+          <h1 className="text-3xl font-bold text-white mb-2">Gestión de Compras</h1>
+          <p className="text-gray-400">Administra los pedidos de los clientes</p>
+        </div>
+        <button
+          type="button"
+          onClick={handleExportar}
+          className="px-4 py-2 rounded-lg bg-slate-700 hover:bg-slate-600 text-white transition-colors"
+        >
+          Exportar CSV
+        </button>
       </div>
 
       {/* Filtro */}
-      <div className="bg-slate-800 rounded-lg p-6 border border-purple-900/30 mb-6">
+      <div className="bg-slate-800 rounded-lg p-6 border border-purple-900/30 mb-6 grid grid-cols-1 md:grid-cols-2 gap-4">
         <div>
           <label className="label">Buscar pedido</label>
           <input
@@ -89,6 +150,15 @@ export default function AdminComprasPage() {
             onChange={(e) => setSearchTerm(e.target.value)}
           />
         </div>
+        <div>
+          <label className="label">Estado</label>
+          <select className="input" value={estado} onChange={(e) => setEstado(e.target.value as FiltroEstado)}>
+            <option value="pagada">Pagadas</option>
+            <option value="pendiente">Pendientes de pago</option>
+            <option value="cancelada">Canceladas</option>
+            <option value="todas">Todas</option>
+          </select>
+        </div>
       </div>
 
       {/* Tabla de compras */}
@@ -109,6 +179,9 @@ export default function AdminComprasPage() {
                 <th className="px-6 py-3 text-left text-xs font-medium text-gray-300 uppercase tracking-wider">
                   Total
                 </th>
+                <th className="px-6 py-3 text-left text-xs font-medium text-gray-300 uppercase tracking-wider">
+                  Estado
+                </th>
                 <th className="px-6 py-3 text-left text-xs font-medium text-gray-300 uppercase tracking-wider">
                   Acciones
                 </th>
@@ -130,6 +203,9 @@ export default function AdminComprasPage() {
                       <td className="px-6 py-4">
                         <div className="h-4 bg-slate-700 rounded w-16"></div>
                       </td>
+                      <td className="px-6 py-4">
+                        <div className="h-4 bg-slate-700 rounded w-16"></div>
+                      </td>
                       <td className="px-6 py-4">
                         <div className="h-4 bg-slate-700 rounded w-24"></div>
                       </td>
@@ -153,6 +229,11 @@ export default function AdminComprasPage() {
                         })}
                       </td>
                       <td className="px-6 py-4 text-sm font-medium text-white">€{purchase.total.toFixed(2)}</td>
+                      <td className="px-6 py-4 text-sm">
+                        <span className={`px-2 py-1 rounded-full text-xs font-medium ${ESTILOS_ESTADO[purchase.estado] ?? "bg-slate-700 text-gray-300"}`}>
+                          {purchase.estado}
+                        </span>
+                      </td>
                       <td className="px-6 py-4 text-sm font-medium">
                         <button
                           onClick={() => handleShowDetails(purchase)}
@@ -218,6 +299,9 @@ export default function AdminComprasPage() {
                   <p className="text-white">
                     <strong>Fecha:</strong> {new Date(selectedPurchase.fecha_compra).toLocaleString("es-ES")}
                   </p>
+                  <p className="text-white">
+                    <strong>Estado:</strong> {selectedPurchase.estado}
+                  </p>
                 </div>
               </div>
 
@@ -232,7 +316,10 @@ export default function AdminComprasPage() {
                       purchaseDetails.map((producto, index) => (
                         <div key={index} className="bg-slate-700 rounded-lg p-4 flex justify-between items-center">
                           <div>
-                            <p className="text-white font-medium">{producto.nombre}</p>
+                            <p className="text-white font-medium">{producto.producto_nombre ?? producto.nombre}</p>
+                            {producto.categoria_nombre && (
+                              <p className="text-gray-400 text-sm">{producto.categoria_nombre}</p>
+                            )}
                             <p className="text-gray-400 text-sm">Cantidad: {producto.cantidad}</p>
                           </div>
                           <p className="text-white font-bold">
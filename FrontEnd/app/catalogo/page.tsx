@@ -16,6 +16,8 @@ interface Product {
   imagen_url: string | null
 }
 
+const PAGE_SIZE = 24
+
 interface Category {
   id_categoria: number
   nombre: string
@@ -26,8 +28,10 @@ export default function CatalogoPage() {
   const categoryParam = searchParams.get("categoria")
 
   const [products, setProducts] = useState<Product[]>([])
+  const [totalProducts, setTotalProducts] = useState(0)
   const [categories, setCategories] = useState<Category[]>([])
   const [isLoading, setIsLoading] = useState(true)
+  const [isLoadingMore, setIsLoadingMore] = useState(false)
   const [selectedCategory, setSelectedCategory] = useState<number | null>(
     categoryParam ? Number.parseInt(categoryParam) : null,
   )
@@ -35,30 +39,54 @@ export default function CatalogoPage() {
   const [sortBy, setSortBy] = useState<string>("nombre")
   const { addToCart } = useCart()
 
+  useEffect(() => {
+    axios
+      .get(`${import.meta.env.VITE_BACKEND_URL}/categorias/`)
+      .then((res) => setCategories(res.data))
+      .catch(() => setCategories([]))
+  }, [])
+
+  // El filtrado y la ordenación se resuelven en el backend
+  const searchProducts = (skip: number) =>
+    axios.get(`${import.meta.env.VITE_BACKEND_URL}/productos/search`, {
+      params: {
+        id_categoria: selectedCategory ?? undefined,
+        // El máximo del control equivale a "sin límite de precio"
+        precio_max: priceRange[1] < 100 ? priceRange[1] : undefined,
+        orden: sortBy,
+        skip,
+        limit: PAGE_SIZE,
+      },
+    })
+
   useEffect(() => {
     const loadData = async () => {
       setIsLoading(true)
       try {
-        const [prodRes, catRes] = await Promise.all([
-          axios.get(`${import.meta.env.VITE_BACKEND_URL}/productos/`),
-          axios.get(`${import.meta.env.VITE_BACKEND_URL}/categorias/`)
-        ])
-        setProducts(prodRes.data)
-        setCategories(catRes.data)
-        if (prodRes.data.length > 0) {
-          const precios = prodRes.data.map((p: Product) => p.precio)
-          setPriceRange([Math.min(...precios), Math.max(...precios)])
-        }
+        const res = await searchProducts(0)
+        setProducts(res.data)
+        setTotalProducts(Number(res.headers["x-total-count"] ?? res.data.length))
       } catch (e) {
         // Manejo de error simple
         setProducts([])
-        setCategories([])
+        setTotalProducts(0)
       }
       setIsLoading(false)
     }
 
     loadData()
-  }, [])
+  }, [selectedCategory, priceRange, sortBy])
+
+  const loadMore = async () => {
+    setIsLoadingMore(true)
+    try {
+      const res = await searchProducts(products.length)
+      setProducts((prev) => [...prev, ...res.data])
+    } catch (e) {
+      // Se mantiene lo ya cargado
+    }
+    setIsLoadingMore(false)
+  }
 
   const handleAddToCart = (product: Product) => {
     addToCart({
@@ -70,25 +98,6 @@ export default function CatalogoPage() {
     })
   }
 
-  const filteredProducts = products
-    .filter(
-      (product) =>
-        (selectedCategory === null || product.id_categoria === selectedCategory) &&
-        product.precio >= priceRange[0] &&
-        product.precio <= priceRange[1],
-    )
-    .sort((a, b) => {
-      switch (sortBy) {
-        case "precio-asc":
-          return a.precio - b.precio
-        case "precio-desc":
-          return b.precio - a.precio
-        case "nombre":
-        default:
-          return a.nombre.localeCompare(b.nombre)
-      }
-    })
-
   if (isLoading) {
     return (
       <div className="min-h-screen pt-24 pb-16 px-4 sm:px-6 lg:px-8 max-w-7xl mx-auto">
@@ -187,14 +196,14 @@ export default function CatalogoPage() {
         <div className="md:col-span-3">
           <div className="mb-6 flex items-center justify-between">
             <div className="text-gray-400">
-              Mostrando <span className="text-white font-semibold">{filteredProducts.length}</span> de{" "}
-              <span className="text-white font-semibold">{products.length}</span> juegos
+              Mostrando <span className="text-white font-semibold">{products.length}</span> de{" "}
+              <span className="text-white font-semibold">{totalProducts}</span> juegos
             </div>
 
           </div>
 
           <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-6">
-            {filteredProducts.map((product) => (
+            {products.map((product) => (
               <div key={product.id_producto} className="card group">
                 <div className="relative h-48 overflow-hidden">
                   <img
@@ -237,7 +246,19 @@ export default function CatalogoPage() {
             ))}
           </div>
 
-          {filteredProducts.length === 0 && (
+          {products.length < totalProducts && (
+            <div className="text-center mt-8">
+              <button
+                onClick={loadMore}
+                disabled={isLoadingMore}
+                className="px-6 py-2 rounded-lg bg-purple-600 hover:bg-purple-700 text-white font-medium transition-colors disabled:opacity-50"
+              >
+                {isLoadingMore ? "Cargando..." : "Cargar más"}
+              </button>
+            </div>
+          )}
+
+          {products.length === 0 && (
             <div className="text-center py-12">
               <div className="text-gray-400 mb-4">
                 <svg
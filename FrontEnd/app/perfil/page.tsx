@@ -5,12 +5,24 @@ import { useAuth } from "@/context/auth-context"
 import { useNavigate } from "react-router"
 import axios from "axios"
 
+interface DetalleCompra {
+  id_detalle: number
+  id_producto: number
+  cantidad: number
+  precio_unitario: number
+  producto?: { id_producto: number; nombre: string; imagen_url?: string } | null
+}
+
 interface Compra {
   id_compra: number
   fecha_compra: string
   total: number
+  estado?: string
+  detalles: DetalleCompra[]
 }
 
+const COMPRAS_POR_PAGINA = 10
+
 export default function PerfilPage() {
   const { user, logout, setUser } = useAuth() as any
   const navigate = useNavigate()
@@ -24,6 +36,9 @@ export default function PerfilPage() {
   const [message, setMessage] = useState<{ type: "success" | "error"; text: string } | null>(null)
   const [compras, setCompras] = useState<Compra[]>([])
   const [comprasLoading, setComprasLoading] = useState(true)
+  const [comprasCursor, setComprasCursor] = useState<string | null>(null)
+  const [cargandoMasCompras, setCargandoMasCompras] = useState(false)
+  const [totalGastado, setTotalGastado] = useState(0)
   const comprasRef = useRef<HTMLDivElement>(null)
   const [showPasswordModal, setShowPasswordModal] = useState(false)
   const [password1, setPassword1] = useState("")
@@ -42,20 +57,44 @@ export default function PerfilPage() {
       telefono: user.telefono?.replace("+34 ", "") || "",
     })
 
-    // Cargar historial de compras real
+    // Cargar la primera página del historial de compras y el total gastado
     const fetchCompras = async () => {
       setComprasLoading(true)
       try {
-        const res = await axios.get(`${import.meta.env.VITE_BACKEND_URL}/compras/usuario/${user.id_usuario}`)
+        const [res, resumen] = await Promise.all([
+          axios.get(`${import.meta.env.VITE_BACKEND_URL}/compras/usuario/${user.id_usuario}/historial`, {
+            params: { limit: COMPRAS_POR_PAGINA },
+          }),
+          axios.get(`${import.meta.env.VITE_BACKEND_URL}/compras/usuario/${user.id_usuario}/resumen`),
+        ])
         setCompras(res.data)
+        setComprasCursor(res.headers["x-next-cursor"] || null)
+        setTotalGastado(resumen.data.total_gastado)
       } catch (e) {
         setCompras([])
+        setComprasCursor(null)
       }
       setComprasLoading(false)
     }
     fetchCompras()
   }, [user, navigate])
 
+  // Cargar la siguiente página del historial
+  const cargarMasCompras = async () => {
+    if (!comprasCursor) return
+    setCargandoMasCompras(true)
+    try {
+      const res = await axios.get(`${import.meta.env.VITE_BACKEND_URL}/compras/usuario/${user.id_usuario}/historial`, {
+        params: { limit: COMPRAS_POR_PAGINA, cursor: comprasCursor },
+      })
+      setCompras((prev) => [...prev, ...res.data])
+      setComprasCursor(res.headers["x-next-cursor"] || null)
+    } catch (e) {
+      setComprasCursor(null)
+    }
+    setCargandoMasCompras(false)
+  }
+
   const formatSpanishPhoneNumber = (value: string) => {
     const phoneNumber = value.replace(/[^\d]/g, "")
     if (phoneNumber.length <= 3) {
@@ -303,6 +342,7 @@ export default function PerfilPage() {
                     <tr>
                       <th className="px-4 py-2 text-left text-xs font-medium text-gray-300 uppercase">ID</th>
                       <th className="px-4 py-2 text-left text-xs font-medium text-gray-300 uppercase">Fecha</th>
+                      <th className="px-4 py-2 text-left text-xs font-medium text-gray-300 uppercase">Productos</th>
                       <th className="px-4 py-2 text-left text-xs font-medium text-gray-300 uppercase">Total</th>
                     </tr>
                   </thead>
@@ -319,11 +359,38 @@ export default function PerfilPage() {
                             minute: "2-digit",
                           })}
                         </td>
+                        <td className="px-4 py-2 text-gray-300">
+                          {compra.detalles.map((detalle) => (
+                            <div key={detalle.id_detalle} className="flex items-center gap-2">
+                              {detalle.producto?.imagen_url && (
+                                <img
+                                  src={detalle.producto.imagen_url}
+                                  alt={detalle.producto.nombre}
+                                  className="w-8 h-8 object-cover rounded"
+                                />
+                              )}
+                              <span>
+                                {detalle.cantidad} × {detalle.producto?.nombre ?? `Producto #${detalle.id_producto}`}
+                              </span>
+                            </div>
+                          ))}
+                        </td>
                         <td className="px-4 py-2 text-primary font-bold">{compra.total.toFixed(2)} €</td>
                       </tr>
                     ))}
                   </tbody>
                 </table>
+                {comprasCursor && (
+                  <div className="flex justify-center mt-4">
+                    <button
+                      onClick={cargarMasCompras}
+                      disabled={cargandoMasCompras}
+                      className="px-4 py-2 rounded-lg bg-slate-700 hover:bg-slate-600 text-white transition-colors disabled:opacity-50"
+                    >
+                      {cargandoMasCompras ? "Cargando..." : "Ver más"}
+                    </button>
+                  </div>
+                )}
               </div>
             )}
           </div>
@@ -361,7 +428,7 @@ export default function PerfilPage() {
               <div className="flex justify-between">
                 <span className="text-gray-400">Total gastado</span>
                 <span className="text-white font-semibold">
-                  {compras.reduce((acc, c) => acc + (c.total || 0), 0).toFixed(2)}€
+                  {totalGastado.toFixed(2)}€
                 </span>
               </div>
             </div>
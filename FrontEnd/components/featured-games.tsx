@@ -23,12 +23,11 @@ export default function FeaturedGames() {
     const fetchProductos = async () => {
       setIsLoading(true)
       try {
-        const res = await axios.get(`${import.meta.env.VITE_BACKEND_URL}/productos/`)
-        // Ordenar por fecha_creacion descendente si existe
-        const sorted = [...res.data].sort((a, b) =>
-          (b.fecha_creacion || "").localeCompare(a.fecha_creacion || "")
-        )
-        setProductos(sorted.slice(0, 8))
+        // Solo se piden los 8 productos más recientes
+        const res = await axios.get(`${import.meta.env.VITE_BACKEND_URL}/productos/search`, {
+          params: { orden: "recientes", limit: 8 },
+        })
+        setProductos(res.data)
       } catch (e) {
         setProductos([])
       }
@@ -1,6 +1,6 @@
 "use client"
 
-import { createContext, useContext, useState, useEffect, type ReactNode } from "react"
+import { createContext, useContext, useState, useEffect, useRef, type ReactNode } from "react"
 import axios from "axios"
 import { useNavigate } from "react-router"
 
@@ -30,6 +30,8 @@ export function AuthProvider({ children }: { children: ReactNode }) {
   const [isLoading, setIsLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const navigate = useNavigate()
+  // Renovación en curso, compartida por todas las peticiones que reciban un 401 a la vez
+  const refrescando = useRef<Promise<string> | null>(null)
 
   useEffect(() => {
     // Verificar si hay un token en localStorage al cargar la página
@@ -46,6 +48,46 @@ export function AuthProvider({ children }: { children: ReactNode }) {
     }
   }, [])
 
+  // Cuando el token de acceso caduca (401) se renueva con el token de refresco
+  // y se repite la petición, sin volver a pedir la contraseña
+  useEffect(() => {
+    const interceptor = axios.interceptors.response.use(undefined, async (error) => {
+      const original = error.config
+      const refreshToken = localStorage.getItem("refresh_token")
+      if (
+        error.response?.status !== 401 ||
+        !refreshToken ||
+        original?._reintentado ||
+        original?.url?.includes("/usuarios/refrescar")
+      ) {
+        throw error
+      }
+      original._reintentado = true
+      try {
+        if (!refrescando.current) {
+          refrescando.current = axios
+            .post(`${import.meta.env.VITE_BACKEND_URL}/usuarios/refrescar`, { refresh_token: refreshToken })
+            .then((res) => {
+              localStorage.setItem("token", res.data.access_token)
+              localStorage.setItem("refresh_token", res.data.refresh_token)
+              setToken(res.data.access_token)
+              return res.data.access_token
+            })
+            .finally(() => {
+              refrescando.current = null
+            })
+        }
+        const nuevoToken = await refrescando.current
+        original.headers.Authorization = `Bearer ${nuevoToken}`
+        return axios(original)
+      } catch {
+        logout()
+        throw error
+      }
+    })
+    return () => axios.interceptors.response.eject(interceptor)
+  }, [])
+
   const login = async (email: string, password: string) => {
     setIsLoading(true)
     setError(null)
@@ -57,6 +99,7 @@ export function AuthProvider({ children }: { children: ReactNode }) {
       )
 
       localStorage.setItem("token", res.data.access_token)
+      localStorage.setItem("refresh_token", res.data.refresh_token)
       localStorage.setItem("user", JSON.stringify(res.data.user))
       setUser(res.data.user)
       setToken(res.data.access_token)
@@ -72,9 +115,17 @@ export function AuthProvider({ children }: { children: ReactNode }) {
   }
 
   const logout = () => {
+    // Revoca el token de refresco en el servidor; el cierre de sesión local no espera
+    const refreshToken = localStorage.getItem("refresh_token")
+    if (refreshToken) {
+      axios
+        .post(`${import.meta.env.VITE_BACKEND_URL}/usuarios/logout`, { refresh_token: refreshToken })
+        .catch(() => {})
+    }
     setUser(null)
     setToken(null)
     localStorage.removeItem("token")
+    localStorage.removeItem("refresh_token")
     localStorage.removeItem("user")
     navigate("/login")
   }